@@ -2,6 +2,21 @@ import React, { useRef, useState } from 'react';
 import { Card, Button, ProgressBar } from 'react-bootstrap';
 // import './UploadFrame.css'; // Assuming you have this CSS file
 
+const CONTENT_HASH_BLOCK_SIZE = 1024 * 1024; // Must match the server's uploads.CONTENT_HASH_BLOCK_SIZE
+
+// SHA-256 over the SHA-256 of each 1MB block, so multi-GB videos are hashed a slice at a time.
+// Returns null where WebCrypto isn't available (non-HTTPS origins); the upload then runs without dedup.
+const computeContentHash = async (file) => {
+  if (!window.crypto || !window.crypto.subtle) return null;
+  const blockDigests = new Uint8Array(Math.ceil(file.size / CONTENT_HASH_BLOCK_SIZE) * 32);
+  for (let offset = 0, i = 0; offset < file.size; offset += CONTENT_HASH_BLOCK_SIZE, i++) {
+    const block = await file.slice(offset, offset + CONTENT_HASH_BLOCK_SIZE).arrayBuffer();
+    blockDigests.set(new Uint8Array(await window.crypto.subtle.digest('SHA-256', block)), i * 32);
+  }
+  const digest = new Uint8Array(await window.crypto.subtle.digest('SHA-256', blockDigests));
+  return Array.from(digest, (b) => b.toString(16).padStart(2, '0')).join('');
+};
+
 const UploadFrame = ({
   title,
   colorClass,
@@ -41,30 +56,58 @@ const UploadFrame = ({
 
 
       try {
+        const chunkSize = 1024 * 1024; // 1MB
+        const totalChunks = Math.ceil(file.size / chunkSize);
+        const contentHash = await computeContentHash(file);
+
         const initResponse = await fetch(`${process.env.REACT_APP_API_BASE_URL}/init-upload`, {
           method: 'POST',
+          headers: { 'Content-Type': 'application/json' },
+          body: JSON.stringify({
+            content_hash: contentHash,
+            filename: file.name,
+            file_size: file.size,
+            file_type: fileType,
+            session_id: sessionId,
+            total_chunks: totalChunks,
+            chunk_size: chunkSize,
+          }),
         });
         if (!initResponse.ok) throw new Error(`Failed to init upload for ${file.name}. Status: ${initResponse.status}`);
         const initData = await initResponse.json();
         const fileUploadJobId = initData.job_id;
 
-        const chunkSize = 1024 * 1024; // 1MB
-        const totalChunks = Math.ceil(file.size / chunkSize);
+        if (initData.status === 'complete') {
+          // Server already has this exact file; nothing to transfer
+          setUploadProgress(100);
+          onUpload && onUpload({
+            fileType: initData.file_type,
+            filename: initData.filename,
+            stored_filename: initData.stored_filename,
+            thumbnail_url: initData.thumbnail_url,
+            all_session_thumbnails: initData.all_session_thumbnails,
+          });
+          continue;
+        }
+        // Chunks stored by an earlier, interrupted upload of the same file are skipped
+        const receivedChunks = new Set(initData.received_chunks || []);
 
         for (let chunkIdx = 0; chunkIdx < totalChunks; chunkIdx++) {
+          if (receivedChunks.has(chunkIdx)) continue;
           const chunk = file.slice(chunkIdx * chunkSize, (chunkIdx + 1) * chunkSize);
-          const formData = new FormData();
-          formData.append('chunk', chunk);
-          formData.append('filename', file.name);
-          formData.append('job_id', fileUploadJobId);
-          formData.append('chunk_index', chunkIdx);
-          formData.append('total_chunks', totalChunks);
-          formData.append('file_type', fileType);
-          formData.append('session_id', sessionId);
-
-          const response = await fetch(`${process.env.REACT_APP_API_BASE_URL}/upload-chunk`, {
-            method: 'POST',
-            body: formData,
+          const params = new URLSearchParams({
+            filename: file.name,
+            total_chunks: totalChunks,
+            chunk_size: chunkSize,
+            total_size: file.size,
+            file_type: fileType,
+            session_id: sessionId,
+          });
+
+          // The raw chunk is the request body; the server streams it straight to its offset in the file
+          const response = await fetch(`${process.env.REACT_APP_API_BASE_URL}/upload-chunk/${fileUploadJobId}/${chunkIdx}?${params}`, {
+            method: 'PUT',
+            body: chunk,
           });
 
           if (!response.ok) {
@@ -1,5 +1,5 @@
 import React, { useState, useEffect } from 'react';
-import { Container, Row, Col, Card } from 'react-bootstrap';
+import { Container, Row, Col, Card, Table } from 'react-bootstrap';
 import './Metrics.css';
 
 const MetricsPage = ({ sessionId }) => {
@@ -7,7 +7,9 @@ const MetricsPage = ({ sessionId }) => {
     processedFrames: 0,
     detectedObjects: 0,
     patternMatches: 0,
-    solidColorFrames: 0
+    solidColorFrames: 0,
+    operations: {},
+    rejections: {}
   });
   
   const [loading, setLoading] = useState(true);
@@ -18,6 +20,11 @@ const MetricsPage = ({ sessionId }) => {
     }
   }, [sessionId]);
 
+  const formatSeconds = (seconds) => {
+    if (seconds == null) return '-';
+    return seconds < 1 ? `${(seconds * 1000).toFixed(1)} ms` : `${seconds.toFixed(2)} s`;
+  };
+
   const fetchMetrics = async () => {
     setLoading(true);
     try {
@@ -81,8 +88,39 @@ const MetricsPage = ({ sessionId }) => {
               <Card>
                 <Card.Body>
                   <Card.Title>Processing Results</Card.Title>
-                  <p>This section will display detailed results of video processing...</p>
-                  {/* Here you could add charts, graphs, or more detailed metrics */}
+                  {Object.keys(metrics.operations || {}).length === 0 ? (
+                    <p>No pipeline runs recorded for this session yet.</p>
+                  ) : (
+                    <Table size="sm" responsive>
+                      <thead>
+                        <tr>
+                          <th>Operation</th>
+                          <th>Count</th>
+                          <th>Errors</th>
+                          <th>Mean</th>
+                          <th>p95</th>
+                          <th>Total</th>
+                        </tr>
+                      </thead>
+                      <tbody>
+                        {Object.entries(metrics.operations).map(([name, op]) => (
+                          <tr key={name}>
+                            <td>{name}</td>
+                            <td>{op.count}</td>
+                            <td>{op.errors}</td>
+                            <td>{formatSeconds(op.mean_seconds)}</td>
+                            <td>{op.p95_seconds != null ? `≤ ${formatSeconds(op.p95_seconds)}` : '-'}</td>
+                            <td>{formatSeconds(op.total_seconds)}</td>
+                          </tr>
+                        ))}
+                      </tbody>
+                    </Table>
+                  )}
+                  {Object.keys(metrics.rejections || {}).length > 0 && (
+                    <p className="mb-0">
+                      Rejected frames: {Object.entries(metrics.rejections).map(([stage, count]) => `${stage}: ${count}`).join(', ')}
+                    </p>
+                  )}
                 </Card.Body>
               </Card>
             </Col>
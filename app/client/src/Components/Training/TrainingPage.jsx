@@ -12,6 +12,7 @@ const TrainingPage = ({ sessionId }) => {
   const [pipelineStatus, setPipelineStatus] = useState(null); // This holds { status, message, download_url, ... }
   const [pipelineError, setPipelineError] = useState(null);
   const [pollingIntervalId, setPollingIntervalId] = useState(null);
+  const [progressSource, setProgressSource] = useState(null); // EventSource for live progress, when the browser has one
 
   const handleUploadComplete = (uploadData) => {
     console.log('Upload complete in TrainingPage:', uploadData);
@@ -42,7 +43,7 @@ const TrainingPage = ({ sessionId }) => {
       setPipelineStatus(data); // data will contain { status, message, download_url, ... }
       setPipelineError(null);
 
-      if (data.status === 'completed' || data.status === 'failed' || data.status === 'completed_no_output') {
+      if (isFinishedStatus(data.status)) {
         if (pollingIntervalId) {
           clearInterval(pollingIntervalId);
           setPollingIntervalId(null);
@@ -61,7 +62,48 @@ const TrainingPage = ({ sessionId }) => {
     }
   };
 
-  const handleRunPipeline = async () => {
+  const isFinishedStatus = (status) => ['completed', 'failed', 'completed_no_output', 'cancelled'].includes(status);
+
+  const startPolling = (jobId) => {
+    const intervalId = setInterval(() => pollPipelineStatus(jobId), 3000);
+    setPollingIntervalId(intervalId);
+  };
+
+  // Progress is pushed by the server as Server-Sent Events; polling is only a fallback
+  const subscribeToPipelineProgress = (jobId) => {
+    if (typeof EventSource === 'undefined') {
+      startPolling(jobId);
+      return;
+    }
+    const source = new EventSource(`${process.env.REACT_APP_API_BASE_URL}/pipeline-progress/${jobId}`);
+    source.addEventListener('status', (event) => {
+      const data = JSON.parse(event.data);
+      setPipelineStatus(data);
+      setPipelineError(null);
+      if (isFinishedStatus(data.status)) {
+        source.close();
+        setProgressSource(null);
+      }
+    });
+    source.onerror = () => {
+      // The connection dropped before the job finished (EventSource would keep reconnecting)
+      source.close();
+      setProgressSource(null);
+      startPolling(jobId);
+    };
+    setProgressSource(source);
+  };
+
+  const formatDuration = (seconds) => {
+    if (seconds === null || seconds === undefined) return 'unknown';
+    const rounded = Math.round(seconds);
+    const hours = Math.floor(rounded / 3600);
+    const minutes = Math.floor((rounded % 3600) / 60);
+    const secs = rounded % 60;
+    return hours > 0 ? `${hours}h ${minutes}m` : minutes > 0 ? `${minutes}m ${secs}s` : `${secs}s`;
+  };
+
+  const handleRunPipeline = async (resumeJobId = null) => {
     // prevent running if already running
     if (pipelineJobId && (pipelineStatus?.status === 'running' || pipelineStatus?.status === 'queued')) {
         alert("A pipeline is already running or queued.");
@@ -76,7 +118,8 @@ const TrainingPage = ({ sessionId }) => {
       const response = await fetch(`${process.env.REACT_APP_API_BASE_URL}/run-pipeline`, {
         method: 'POST',
         headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ session_id: sessionId }),
+        // Re-running a failed or cancelled job by its ID resumes it from its checkpoints
+        body: JSON.stringify(resumeJobId ? { session_id: sessionId, job_id: resumeJobId } : { session_id: sessionId }),
       });
       if (!response.ok) {
         const errorData = await response.json().catch(() => ({error: "Failed to start pipeline"}));
@@ -86,8 +129,7 @@ const TrainingPage = ({ sessionId }) => {
       if (data.job_id) {
         setPipelineJobId(data.job_id); // Set new job ID
         setPipelineStatus({ status: data.status || 'queued', message: data.message }); // Initial status
-        const intervalId = setInterval(() => pollPipelineStatus(data.job_id), 3000);
-        setPollingIntervalId(intervalId);
+        subscribeToPipelineProgress(data.job_id);
       } else {
         throw new Error(data.error || "Failed to get job ID from pipeline start response.");
       }
@@ -106,6 +148,14 @@ const TrainingPage = ({ sessionId }) => {
     };
   }, [pollingIntervalId]);
 
+  useEffect(() => {
+    return () => {
+      if (progressSource) {
+        progressSource.close();
+      }
+    };
+  }, [progressSource]);
+
 
   if (loading) return <p>Loading session...</p>;
   if (sessionError) return <Alert variant="danger">Error loading session data: {sessionError.message || "Unknown error"}</Alert>;
@@ -135,10 +185,35 @@ const TrainingPage = ({ sessionId }) => {
               {pipelineStatus.status === 'running' && pipelineStatus.start_time && (
                 <small className="text-muted">Running for: {Math.round(Date.now()/1000 - pipelineStatus.start_time)}s</small>
               )}
+              {pipelineStatus.progress && (
+                <div style={{fontSize: '0.85em'}}>
+                  <div>
+                    Frames: {pipelineStatus.progress.frames_done}
+                    {pipelineStatus.progress.total_frames ? ` / ${pipelineStatus.progress.total_frames} (${pipelineStatus.progress.percent.toFixed(1)}%)` : ''}
+                  </div>
+                  {pipelineStatus.progress.frames_per_second && (
+                    <div>Throughput: {pipelineStatus.progress.frames_per_second.toFixed(1)} frames/s</div>
+                  )}
+                  {pipelineStatus.status === 'running' && (
+                    <div>ETA: {formatDuration(pipelineStatus.progress.eta_seconds)}</div>
+                  )}
+                  {Object.entries(pipelineStatus.progress.stages || {}).map(([name, stage]) => (
+                    <div key={name} className="text-muted">
+                      {name}: {stage.count} frames, {stage.mean_seconds ? `${(stage.mean_seconds * 1000).toFixed(1)} ms/frame` : '-'}, {stage.rejected} rejected
+                    </div>
+                  ))}
+                </div>
+              )}
               {/* Moved download button to TrainingMenu, but this is a good place for status text */}
                {pipelineStatus.status === 'completed' && pipelineStatus.download_url && (
                  <p className="mb-0 mt-1 text-success"><small>Results ready for download.</small></p>
                )}
+               {pipelineStatus.resumable && (
+                 <Button variant="outline-primary" size="sm" className="mt-1" onClick={() => handleRunPipeline(pipelineJobId)}>Resume</Button>
+               )}
+               {pipelineStatus.profile_url && (
+                 <p className="mb-0 mt-1"><small><a href={`${process.env.REACT_APP_BASE_URL}${pipelineStatus.profile_url}`}>Download profile</a></small></p>
+               )}
                {pipelineStatus.duration_seconds && (
                  <p className="mb-0 mt-1"><small>Duration: {pipelineStatus.duration_seconds}s</small></p>
                )}
@@ -0,0 +1,280 @@
+"""
+Headless batch runs: processes many raw/RealSense video pairs from a manifest without the web server.
+
+    python batch.py pairs.csv --patterns pattern_dir --thresholds thresholds.json --output-dir batch_output --jobs 4
+
+Pairs run concurrently in a process pool that shares one pattern library (loaded once, sent to
+each worker) and the on-disk LLM verdict cache. A summary line per pair is appended to
+<output-dir>/summary.jsonl as pairs finish, so --resume can pick up an interrupted backfill.
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import re
+import signal
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing.managers import SyncManager
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+load_dotenv() # Before the pipeline imports, which read their settings from the environment
+
+from defaults import default_pipeline_processes, default_thres_params
+from pipeline import PatternLibrary, PipelineCancelled, process_video_frames
+from pipeline.metrics import METRICS_FILENAME
+from pipeline.sampling import DEFAULT_SAMPLING_MODE, DEFAULT_SAMPLING_STRIDE, DEFAULT_SCENE_CHANGE_THRESHOLD, SAMPLING_MODES
+
+logger = logging.getLogger("batch")
+
+PATTERN_EXTENSIONS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff", ".webp")
+SUMMARY_FILENAME = "summary.jsonl"
+SUMMARY_CSV_FILENAME = "summary.csv"
+SUMMARY_CSV_FIELDS = ("name", "status", "frames", "accepted", "rejected", "pattern_matches", "seconds", "output", "zip", "error", "raw", "realsense")
+_UNSAFE_NAME_CHARS = re.compile(r"[^A-Za-z0-9._-]+")
+
+# Per-worker state, set once by _init_batch_worker so the pattern library isn't re-sent with every pair
+_worker_state = {}
+
+
+def read_pairs(manifest_path):
+    """
+    Reads video pairs from a CSV (header: raw,realsense[,name]) or JSONL ({"raw", "realsense", "name"})
+    manifest. Relative paths are resolved against the manifest's folder; names default to the raw
+    video's file name and are made unique and safe to use as folder names.
+    Returns: list of {"name", "raw", "realsense"}
+    """
+    manifest_path = Path(manifest_path)
+    if manifest_path.suffix.lower() == ".jsonl":
+        with open(manifest_path) as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+    else:
+        with open(manifest_path, newline="") as f:
+            rows = list(csv.DictReader(f))
+
+    pairs, seen = [], set()
+    for line_number, row in enumerate(rows, 1):
+        if not row.get("raw") or not row.get("realsense"):
+            raise ValueError(f"{manifest_path}: entry {line_number} needs both 'raw' and 'realsense' paths")
+        # Absolute, since workers run from the output folder
+        raw, realsense = ((manifest_path.parent / row[key]).resolve() for key in ("raw", "realsense"))
+        name = _UNSAFE_NAME_CHARS.sub("_", row.get("name") or raw.stem).strip("._") or f"pair_{line_number}"
+        unique_name, suffix = name, 2
+        while unique_name in seen:
+            unique_name, suffix = f"{name}_{suffix}", suffix + 1
+        seen.add(unique_name)
+        pairs.append({"name": unique_name, "raw": str(raw), "realsense": str(realsense)})
+    return pairs
+
+
+def load_settings(thresholds_path=None):
+    """
+    Reads a thresholds file: either the session's thres_params object (as shown on the Advanced
+    Settings page), or {"thresholds": {...}, "processes": {...}} to also switch stages on or off.
+    Missing values keep their defaults.
+    Returns: (thres_params, pipeline_processes)
+    """
+    thres_params, processes = default_thres_params(), default_pipeline_processes()
+    if thresholds_path:
+        settings = json.loads(Path(thresholds_path).read_text())
+        if "thresholds" in settings or "processes" in settings:
+            thres_params.update(settings.get("thresholds", {}))
+            processes.update(settings.get("processes", {}))
+        else:
+            thres_params.update(settings)
+    unknown = set(processes) - set(default_pipeline_processes())
+    if unknown:
+        raise ValueError(f"Unknown pipeline processes {sorted(unknown)}; expected {sorted(default_pipeline_processes())}")
+    return thres_params, processes
+
+
+def find_pattern_images(pattern_dir):
+    return sorted(str(path) for path in Path(pattern_dir).iterdir() if path.suffix.lower() in PATTERN_EXTENSIONS)
+
+
+def completed_pairs(summary_path):
+    """Names of pairs a previous run finished, from its summary.jsonl."""
+    if not Path(summary_path).exists():
+        return set()
+    with open(summary_path) as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    return {record["name"] for record in records if record["status"] in ("completed", "completed_no_output")}
+
+
+def _ignore_sigint():
+    # Ctrl-C is handled by the batch process, which cancels workers through the cancel event
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _init_batch_worker(output_dir, pattern_library):
+    _ignore_sigint()
+    # process_video_frames writes to ./pipeline_output (and ./downloads for zips)
+    os.chdir(output_dir)
+    logging.basicConfig(level=logging.WARNING)
+    _worker_state["pattern_library"] = pattern_library
+
+
+def _run_pair(pair, pattern_paths, thres_params, processes, options, cancel_event):
+    """Processes one pair in a batch worker. Returns: its summary record; failures are recorded, not raised."""
+    record = dict(pair, status="failed", frames=0, accepted=0, rejected={}, pattern_matches=0,
+                  seconds=None, output=None, zip=None, error=None)
+    started = time.perf_counter()
+    try:
+        frames, zip_name = process_video_frames(
+            pair["name"], pair["raw"], pair["realsense"], pattern_paths, thres_params, processes,
+            pattern_library=_worker_state.get("pattern_library"),
+            cancel_event=cancel_event,
+            **options
+        )
+    except PipelineCancelled:
+        record["status"] = "cancelled"
+    except Exception as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+    else:
+        job_dir = Path("pipeline_output") / pair["name"]
+        metrics = json.loads((job_dir / METRICS_FILENAME).read_text())
+        record.update(
+            status="completed" if zip_name else "completed_no_output",
+            frames=frames,
+            accepted=metrics["counters"].get("frames_accepted", 0),
+            rejected=metrics["rejections"],
+            pattern_matches=metrics["counters"].get("pattern_matches", 0),
+            output=str(job_dir.resolve()),
+            zip=str((Path("downloads") / zip_name).resolve()) if zip_name and options.get("create_zip") else None,
+        )
+    record["seconds"] = round(time.perf_counter() - started, 3)
+    return record
+
+
+def write_summary_csv(summary_path, csv_path):
+    """Flattens summary.jsonl (latest record per pair) into a CSV for spreadsheets."""
+    latest = {}
+    with open(summary_path) as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                latest[record["name"]] = record
+    with open(csv_path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_CSV_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        for record in latest.values():
+            writer.writerow(dict(record, rejected=json.dumps(record["rejected"])))
+
+
+def run_batch(pairs, pattern_paths, thres_params, processes, output_dir, jobs=2, options=None):
+    """
+    Runs every pair through process_video_frames, `jobs` at a time, appending a summary record
+    per pair to <output_dir>/summary.jsonl as it finishes. Ctrl-C cancels the running pairs.
+    Returns: list of summary records.
+    """
+    output_dir = Path(output_dir).resolve()
+    output_dir.mkdir(parents=True, exist_ok=True)
+    pattern_library = None
+    if processes.get("Pattern Thresholding") and pattern_paths:
+        # Built once; every worker gets a copy when it starts and pattern features are cached per file
+        pattern_library = PatternLibrary.from_paths(pattern_paths)
+        logger.info(f"Loaded {len(pattern_library)} usable patterns from {len(pattern_paths)} images.")
+    elif processes.get("Pattern Thresholding"):
+        logger.warning("Pattern Thresholding is on, but no pattern images were found.")
+
+    records = []
+    summary_path = output_dir / SUMMARY_FILENAME
+    manager = SyncManager()
+    manager.start(_ignore_sigint)
+    cancel_event = manager.Event()
+    try:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_batch_worker,
+                                 initargs=(str(output_dir), pattern_library)) as executor, \
+                open(summary_path, "a") as summary:
+            futures = {executor.submit(_run_pair, pair, pattern_paths, thres_params, processes, options or {}, cancel_event): pair
+                       for pair in pairs}
+            try:
+                for done, future in enumerate(as_completed(futures), 1):
+                    record = future.result()
+                    records.append(record)
+                    summary.write(json.dumps(record) + "\n")
+                    summary.flush()
+                    detail = record["error"] or f"{record['frames']} frames, {record['accepted']} accepted"
+                    logger.info(f"[{done}/{len(pairs)}] {record['name']}: {record['status']} ({detail}) in {record['seconds']}s")
+            except KeyboardInterrupt:
+                logger.warning("Interrupted; cancelling running pairs. Run again with --resume to continue.")
+                cancel_event.set()
+                for future in futures:
+                    future.cancel()
+                raise
+    finally:
+        manager.shutdown()
+        if summary_path.exists():
+            write_summary_csv(summary_path, output_dir / SUMMARY_CSV_FILENAME)
+    return records
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Run the PRADD pipeline over many video pairs without the web server.")
+    parser.add_argument("manifest", help="CSV (raw,realsense[,name]) or JSONL list of video pairs")
+    parser.add_argument("--patterns", help="Folder of pattern images")
+    parser.add_argument("--thresholds", help="JSON thresholds file (see load_settings)")
+    parser.add_argument("--output-dir", default="batch_output")
+    parser.add_argument("--jobs", type=int, default=int(os.getenv("PIPELINE_MAX_CONCURRENT_JOBS", 2)), help="Pairs processed at once")
+    parser.add_argument("--frame-workers", type=int, default=int(os.getenv("PIPELINE_FRAME_WORKERS", 1)), help="Processes per pair")
+    parser.add_argument("--output-mode", choices=("images", "manifest"), default=os.getenv("RESULTS_OUTPUT_MODE", "images").lower())
+    parser.add_argument("--manifest-format", default=os.getenv("RESULTS_MANIFEST_FORMAT", "csv").lower())
+    parser.add_argument("--zip", action="store_true", help="Also zip each pair's results into <output-dir>/downloads")
+    parser.add_argument("--feature-store", help="Keep per-frame features here so re-runs with new thresholds are fast")
+    parser.add_argument("--realsense-decode", choices=("gray", "bgr"), default=os.getenv("REALSENSE_DECODE_MODE", "gray").lower())
+    parser.add_argument("--analysis-width", type=int, default=int(os.getenv("REALSENSE_ANALYSIS_WIDTH", 0)))
+    parser.add_argument("--sampling", choices=SAMPLING_MODES, default=DEFAULT_SAMPLING_MODE,
+                        help="Analyze one frame per segment (every --sampling-stride frames, or per scene) and propagate its verdict")
+    parser.add_argument("--sampling-stride", type=int, default=DEFAULT_SAMPLING_STRIDE)
+    parser.add_argument("--scene-threshold", type=float, default=DEFAULT_SCENE_CHANGE_THRESHOLD)
+    parser.add_argument("--resume", action="store_true", help="Skip pairs that summary.jsonl already lists as completed")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    logging.getLogger("pipeline").setLevel(logging.WARNING) # Per-frame messages would drown the per-pair ones
+
+    pairs = read_pairs(args.manifest)
+    missing = [path for pair in pairs for path in (pair["raw"], pair["realsense"]) if not Path(path).is_file()]
+    if missing:
+        logger.error(f"{len(missing)} video(s) in the manifest don't exist, e.g. {missing[0]}")
+        return 2
+    if args.resume:
+        finished = completed_pairs(Path(args.output_dir) / SUMMARY_FILENAME)
+        pairs = [pair for pair in pairs if pair["name"] not in finished]
+        logger.info(f"Resuming: {len(finished)} pair(s) already done, {len(pairs)} to go.")
+    thres_params, processes = load_settings(args.thresholds)
+    pattern_paths = [str(Path(path).resolve()) for path in find_pattern_images(args.patterns)] if args.patterns else []
+
+    options = dict(
+        frame_workers=args.frame_workers,
+        feature_store_dir=str(Path(args.feature_store).resolve()) if args.feature_store else None,
+        realsense_gray_decode=args.realsense_decode == "gray",
+        analysis_width=args.analysis_width or None,
+        create_zip=args.zip,
+        output_mode=args.output_mode,
+        manifest_format=args.manifest_format,
+        sampling_options=dict(mode=args.sampling, stride=args.sampling_stride, scene_threshold=args.scene_threshold),
+    )
+    started = time.perf_counter()
+    try:
+        records = run_batch(pairs, pattern_paths, thres_params, processes, args.output_dir, args.jobs, options)
+    except KeyboardInterrupt:
+        return 130
+    failed = [record["name"] for record in records if record["status"] not in ("completed", "completed_no_output")]
+    logger.info(f"Processed {len(records) - len(failed)}/{len(records)} pairs in {time.perf_counter() - started:.1f}s; "
+                f"summary in {Path(args.output_dir) / SUMMARY_FILENAME}")
+    if failed:
+        logger.error(f"{len(failed)} pair(s) failed: {', '.join(failed[:10])}{' ...' if len(failed) > 10 else ''}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
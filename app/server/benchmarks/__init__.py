@@ -0,0 +1,6 @@
+"""
+Reproducible pipeline benchmarks: synthetic raw/RealSense video pairs and pattern libraries,
+a local fake Ollama server, and a runner that reports machine-readable results.
+
+Run from app/server: python -m benchmarks.run --help
+"""
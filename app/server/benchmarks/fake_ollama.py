@@ -0,0 +1,115 @@
+import json
+import time
+import zlib
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class _ChatHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        if self.path != "/api/chat":
+            self._send_json(404, {"error": f"{self.path} not found"})
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        self._send_json(200, self.server.fake.answer(body))
+
+    def do_GET(self):
+        self._send_json(200, self.server.fake.stats())
+
+
+class FakeOllamaServer:
+    """
+    Local stand-in for an Ollama server that answers /api/chat after a configurable delay,
+    so runs with object detection can be benchmarked without a GPU or model.
+
+    The answer for a frame depends only on its image bytes, so the same frames are accepted
+    and rejected on every run: about detect_ratio of them are reported as containing
+    man-made objects. GET / returns request counts and the most requests seen at once.
+    """
+
+    def __init__(self, latency=0.2, jitter=0.0, detect_ratio=0.0, host="127.0.0.1", port=0, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.detect_ratio = detect_ratio
+        self.requests = 0
+        self.max_in_flight = 0
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+        self._server = ThreadingHTTPServer((host, port), _ChatHandler)
+        self._server.daemon_threads = True
+        self._server.fake = self
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def answer(self, body):
+        with self._lock:
+            self.requests += 1
+            self._in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self._in_flight)
+            delay = max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+        try:
+            time.sleep(delay)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+        images = body["messages"][-1].get("images") or [""]
+        detected = zlib.crc32(str(images[0]).encode()) / 2**32 < self.detect_ratio
+        content = "True. A fence post is visible." if detected else "False. Only ground and vegetation."
+        return {"model": body.get("model", ""), "created_at": "1970-01-01T00:00:00Z",
+                "message": {"role": "assistant", "content": content}, "done": True}
+
+    def stats(self):
+        with self._lock:
+            return {"requests": self.requests, "max_in_flight": self.max_in_flight}
+
+    def serve_forever(self):
+        """Serves on the calling thread until stop() is called from another one (or KeyboardInterrupt)."""
+        self._server.serve_forever()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-ollama", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a fake Ollama /api/chat endpoint, e.g. for OLLAMA_HOST.")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds per request")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Random +/- seconds added to the latency")
+    parser.add_argument("--detect-ratio", type=float, default=0.0, help="Fraction of frames reported as containing objects")
+    args = parser.parse_args()
+    server = FakeOllamaServer(args.latency, args.jitter, args.detect_ratio, port=args.port)
+    print(f"Fake Ollama listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
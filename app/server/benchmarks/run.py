@@ -0,0 +1,372 @@
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+import cv2
+
+from pipeline import (PatternLibrary, extract_pattern_match_distances, is_mostly_black_or_white, modelObjectDetection,
+                      process_video_frames)
+from pipeline.llm import OllamaDetector
+from pipeline.metrics import METRICS_FILENAME, summarize_metrics
+from pipeline.patterns import get_sift
+from pipeline.video import VideoFrameSource
+from pipeline.writer import encode_frame
+from .fake_ollama import FakeOllamaServer
+from .synthetic import generate_pattern_library, generate_video_pair
+
+try:
+    import resource
+except ImportError: # Not available on Windows; peak RSS is reported as None there
+    resource = None
+
+SCHEMA_VERSION = 1
+DETECTION_PROMPT = "Are there any man-made objects in this image? Answer True or False, then explain."
+# Stages benchmarked on their own, in the order they are reported
+STAGE_BENCHMARKS = ("decode", "solid_color", "sift_match", "llm_call", "image_encode")
+# Settings that change the workload; results are only comparable when these match
+WORKLOAD_SETTINGS = ("width", "height", "frames", "fps", "patterns", "pattern_density", "solid_density", "seed",
+                     "stage_frames", "processes", "llm_latency", "llm_detect_ratio", "llm_in_flight", "bgr_decode", "zip",
+                     "scaling_patterns", "scaling_pattern_size")
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def _summarize_times(times):
+    if not times:
+        return None
+    mean = statistics.fmean(times)
+    return {
+        'calls': len(times),
+        'mean_seconds': mean,
+        'p50_seconds': _percentile(times, 0.5),
+        'p95_seconds': _percentile(times, 0.95),
+        'calls_per_second': 1 / mean if mean > 0 else None,
+    }
+
+
+def _peak_rss_mb(who):
+    """Peak resident set size of this process (or the largest of its finished children) in MB."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(who).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024 # Bytes on macOS, KB elsewhere
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=Path(__file__).parent).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def benchmark_stages(raw_video, realsense_video, pattern_library, detector, frames, llm_frames):
+    """Times each stage function on its own over the first `frames` frames. Returns: {stage: timing summary}."""
+    times = {name: [] for name in STAGE_BENCHMARKS}
+    cap_raw, cap_realsense = VideoFrameSource(raw_video), VideoFrameSource(realsense_video)
+    try:
+        for index in range(frames):
+            started = time.perf_counter()
+            if not cap_raw.grab() or not cap_realsense.grab():
+                break
+            raw_frame, realsense_frame = cap_raw.retrieve(), cap_realsense.retrieve_analysis()
+            times['decode'].append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            is_mostly_black_or_white(realsense_frame)
+            times['solid_color'].append(time.perf_counter() - started)
+
+            if pattern_library:
+                started = time.perf_counter()
+                extract_pattern_match_distances(realsense_frame, pattern_library)
+                times['sift_match'].append(time.perf_counter() - started)
+
+            if detector is not None and index < llm_frames:
+                started = time.perf_counter()
+                modelObjectDetection(raw_frame, DETECTION_PROMPT, detector)
+                times['llm_call'].append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            encode_frame(raw_frame, "png")
+            times['image_encode'].append(time.perf_counter() - started)
+    finally:
+        cap_raw.release()
+        cap_realsense.release()
+    return {name: summary for name, summary in ((name, _summarize_times(times[name])) for name in STAGE_BENCHMARKS) if summary}
+
+
+def benchmark_pattern_scaling(realsense_video, pattern_paths, work_dir, sizes, frames, pattern_size, seed):
+    """
+    Times matching the same frames against growing pattern libraries (the video's patterns
+    padded with extra ones), exactly and through the k-NN index.
+    Returns: one case per library size, with the share of frames whose best pattern both modes agree on.
+    """
+    frame_descriptors = []
+    cap = VideoFrameSource(realsense_video)
+    try:
+        while len(frame_descriptors) < frames and cap.grab():
+            _, descriptors = get_sift().detectAndCompute(cap.retrieve_analysis(), None)
+            if descriptors is not None:
+                frame_descriptors.append(descriptors)
+    finally:
+        cap.release()
+    extra_paths = generate_pattern_library(Path(work_dir) / "scaling_patterns", max(0, max(sizes) - len(pattern_paths)),
+                                           size=pattern_size, seed=seed + 1)
+    cases = []
+    for size in sizes:
+        paths = (list(pattern_paths) + extra_paths)[:size]
+        case = {'patterns': len(paths)}
+        best = {}
+        for mode, approximate in (("exact", False), ("approximate", True)):
+            library = PatternLibrary.from_paths(paths, approximate=approximate)
+            case['descriptors'] = len(library.stacked_descriptors)
+            started = time.perf_counter()
+            library.match_distances(frame_descriptors[0]) # Builds the k-NN index
+            case[f'{mode}_first_call_seconds'] = time.perf_counter() - started
+            times = []
+            best[mode] = []
+            for descriptors in frame_descriptors:
+                started = time.perf_counter()
+                counts = library.good_match_counts(descriptors, 200)
+                times.append(time.perf_counter() - started)
+                best[mode].append(int(counts.argmax()) if counts.max() > 1 else None)
+            case[mode] = _summarize_times(times)
+        case['best_pattern_agreement'] = statistics.fmean(a == b for a, b in zip(best['exact'], best['approximate']))
+        cases.append(case)
+    return cases
+
+
+def _run_pipeline_once(work_dir, job_id, raw_video, realsense_video, pattern_paths, processes, frame_workers,
+                       llm_host, llm_in_flight, realsense_gray_decode, create_zip):
+    """Runs one job in a fresh process, so its peak RSS is its own. Returns: run results."""
+    logging.disable(logging.WARNING) # Per-frame log lines (e.g. frames without SIFT features) would dominate the timings
+    os.chdir(work_dir) # process_video_frames writes to ./pipeline_output
+    detector = OllamaDetector(host=llm_host, max_in_flight=llm_in_flight) if llm_host else None
+    thres_params = {'Object Detection Prompt': DETECTION_PROMPT}
+    started = time.perf_counter()
+    frames, _ = process_video_frames(job_id, raw_video, realsense_video, pattern_paths, thres_params, processes,
+                                     frame_workers=frame_workers, detector=detector, feature_store_dir=None,
+                                     realsense_gray_decode=realsense_gray_decode, create_zip=create_zip)
+    seconds = time.perf_counter() - started
+    job_dir = Path("pipeline_output") / job_id
+    stage_timings = json.loads((job_dir / "stage_timings.json").read_text())
+    metrics = json.loads((job_dir / METRICS_FILENAME).read_text())
+    shutil.rmtree(job_dir, ignore_errors=True)
+    for zip_path in Path("downloads").glob(f"Results_{job_id}.zip"):
+        zip_path.unlink()
+    return {
+        'seconds': seconds,
+        'frames': frames,
+        'frames_per_second': frames / seconds if seconds > 0 else None,
+        'peak_rss_mb': _peak_rss_mb(resource.RUSAGE_SELF) if resource else None,
+        'peak_worker_rss_mb': _peak_rss_mb(resource.RUSAGE_CHILDREN) if resource and frame_workers > 1 else None,
+        'stage_timings': stage_timings,
+        'metrics': metrics,
+    }
+
+
+def benchmark_pipeline(work_dir, raw_video, realsense_video, pattern_paths, processes, frame_workers, repeat,
+                       llm_host, llm_in_flight, realsense_gray_decode, create_zip):
+    """Runs process_video_frames `repeat` times, each in a new process. Returns: case results with medians."""
+    runs = []
+    context = multiprocessing.get_context("spawn")
+    for attempt in range(repeat):
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            runs.append(executor.submit(
+                _run_pipeline_once, work_dir, f"bench-{frame_workers}-{attempt}", raw_video, realsense_video,
+                pattern_paths, processes, frame_workers, llm_host, llm_in_flight, realsense_gray_decode, create_zip
+            ).result())
+    rss = [run['peak_rss_mb'] for run in runs if run['peak_rss_mb'] is not None]
+    worker_rss = [run['peak_worker_rss_mb'] for run in runs if run['peak_worker_rss_mb'] is not None]
+    last = runs[-1]
+    return {
+        'name': f"workers-{frame_workers}",
+        'frame_workers': frame_workers,
+        'frames': last['frames'],
+        'seconds': statistics.median(run['seconds'] for run in runs),
+        'frames_per_second': statistics.median(run['frames_per_second'] or 0 for run in runs),
+        'peak_rss_mb': max(rss) if rss else None,
+        'peak_worker_rss_mb': max(worker_rss) if worker_rss else None,
+        'stages': {name: {'mean_seconds': timing['mean_seconds'], 'count': timing['count'], 'rejected': timing['rejected']}
+                   for name, timing in last['stage_timings'].items()},
+        'operations': summarize_metrics(last['metrics'])['operations'],
+        'counters': last['metrics']['counters'],
+        'runs': [{key: run[key] for key in ('seconds', 'frames_per_second', 'peak_rss_mb', 'peak_worker_rss_mb')} for run in runs],
+    }
+
+
+def compare_results(results, baseline, tolerance):
+    """
+    Compares results against a baseline produced by this script.
+    Returns: list of regression descriptions; slower throughput, slower stages or more memory
+    by more than `tolerance` (a fraction) count as regressions.
+    """
+    regressions = []
+
+    def check(label, current, previous, higher_is_better=False):
+        if current is None or not previous:
+            return
+        change = (current - previous) / previous
+        if (-change if higher_is_better else change) > tolerance:
+            regressions.append(f"{label}: {previous:.4g} -> {current:.4g} ({change:+.1%})")
+
+    for name, summary in results['stages'].items():
+        previous = baseline.get('stages', {}).get(name)
+        if previous and name != "llm_call": # LLM latency is whatever the fake server was told to use
+            check(f"stage {name} mean seconds", summary['mean_seconds'], previous['mean_seconds'])
+    baseline_cases = {case['name']: case for case in baseline.get('pipeline', [])}
+    for case in results['pipeline']:
+        previous = baseline_cases.get(case['name'])
+        if previous is None:
+            continue
+        check(f"{case['name']} frames/sec", case['frames_per_second'], previous['frames_per_second'], higher_is_better=True)
+        check(f"{case['name']} peak RSS MB", case['peak_rss_mb'], previous.get('peak_rss_mb'))
+    baseline_scaling = {case['patterns']: case for case in baseline.get('pattern_scaling', [])}
+    for case in results.get('pattern_scaling', []):
+        previous = baseline_scaling.get(case['patterns'])
+        if previous is None:
+            continue
+        for mode in ("exact", "approximate"):
+            check(f"{case['patterns']} patterns {mode} match mean seconds", case[mode]['mean_seconds'], previous[mode]['mean_seconds'])
+    return regressions
+
+
+def _print_summary(results):
+    decoded = results['stages'].get('decode', {}).get('calls', 0)
+    print(f"Stages ({decoded} frames, {results['config']['width']}x{results['config']['height']}):")
+    for name, summary in results['stages'].items():
+        print(f"  {name:<14} mean {summary['mean_seconds'] * 1000:8.2f} ms   p95 {summary['p95_seconds'] * 1000:8.2f} ms   {summary['calls_per_second']:8.1f}/s")
+    print("Pipeline:")
+    for case in results['pipeline']:
+        rss = f"{case['peak_rss_mb']:.0f} MB" if case['peak_rss_mb'] is not None else "n/a"
+        print(f"  {case['name']:<14} {case['frames']} frames in {case['seconds']:.2f}s   {case['frames_per_second']:.1f} frames/s   peak RSS {rss}")
+        for name, stage in case['stages'].items():
+            print(f"    {name:<26} mean {stage['mean_seconds'] * 1000:8.2f} ms x {stage['count']}, rejected {stage['rejected']}")
+    if results.get('pattern_scaling'):
+        print("Pattern matching by library size (per frame):")
+    for case in results.get('pattern_scaling', []):
+        print(f"  {case['patterns']:>4} patterns ({case['descriptors']} descriptors)   exact {case['exact']['mean_seconds'] * 1000:8.2f} ms"
+              f"   approximate {case['approximate']['mean_seconds'] * 1000:8.2f} ms (first call {case['approximate_first_call_seconds']:.2f}s)"
+              f"   same best pattern {case['best_pattern_agreement']:.0%}")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline on synthetic videos with a fake Ollama server.")
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--frames", type=int, default=120, help="Frames per video")
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--patterns", type=int, default=8, help="Pattern library size")
+    parser.add_argument("--pattern-density", type=float, default=0.5, help="Fraction of frames showing a pattern")
+    parser.add_argument("--solid-density", type=float, default=0.1, help="Fraction of frames that are depth dropouts")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--frame-workers", type=int, nargs="+", default=[1], help="Pipeline cases to run, by frame workers")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per pipeline case; medians are reported")
+    parser.add_argument("--stage-frames", type=int, default=60, help="Frames used for the per-stage benchmarks")
+    parser.add_argument("--scaling-patterns", type=int, nargs="*", default=[10, 50, 200],
+                        help="Library sizes for the pattern matching scaling case; none skips it")
+    parser.add_argument("--scaling-pattern-size", type=int, default=320, help="Side in pixels of the extra scaling patterns")
+    parser.add_argument("--no-object-detection", action="store_true", help="Skip the LLM stage")
+    parser.add_argument("--no-pattern-matching", action="store_true")
+    parser.add_argument("--no-solid-color", action="store_true")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Seconds the fake Ollama server takes per request")
+    parser.add_argument("--llm-jitter", type=float, default=0.0)
+    parser.add_argument("--llm-detect-ratio", type=float, default=0.1, help="Fraction of frames the fake model rejects")
+    parser.add_argument("--llm-in-flight", type=int, default=4, help="Concurrent LLM requests per frame range")
+    parser.add_argument("--llm-frames", type=int, default=20, help="Frames sent to the LLM in the per-stage benchmark")
+    parser.add_argument("--bgr-decode", action="store_true", help="Decode RealSense video as BGR instead of grayscale")
+    parser.add_argument("--zip", action="store_true", help="Also zip the results, as RESULTS_ZIP_MODE=file does")
+    parser.add_argument("--data-dir", help="Keep generated videos and outputs here instead of a temporary folder")
+    parser.add_argument("--output", help="Write machine-readable results to this JSON file")
+    parser.add_argument("--compare", help="Baseline results JSON; exit with status 1 if anything regressed")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed relative slowdown before --compare fails")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.ERROR) # Background-only frames have no SIFT features, which is logged per frame
+    work_dir = Path(args.data_dir) if args.data_dir else Path(tempfile.mkdtemp(prefix="pradd-bench-"))
+    work_dir.mkdir(parents=True, exist_ok=True)
+    work_dir = work_dir.resolve()
+    processes = {
+        'Solid Color Detection': not args.no_solid_color,
+        'Model Object Detection': not args.no_object_detection,
+        'Pattern Thresholding': not args.no_pattern_matching,
+    }
+    try:
+        started = time.perf_counter()
+        pattern_paths = generate_pattern_library(work_dir / "patterns", args.patterns, seed=args.seed)
+        raw_video, realsense_video = generate_video_pair(work_dir / "videos", args.width, args.height, args.frames, args.fps,
+                                                         pattern_paths, args.pattern_density, args.solid_density, args.seed)
+        generate_seconds = time.perf_counter() - started
+
+        with FakeOllamaServer(args.llm_latency, args.llm_jitter, args.llm_detect_ratio, seed=args.seed) as fake_ollama:
+            llm_host = fake_ollama.url if processes['Model Object Detection'] else None
+            detector = OllamaDetector(host=fake_ollama.url, max_in_flight=1) if llm_host else None
+            stages = benchmark_stages(raw_video, realsense_video, PatternLibrary.from_paths(pattern_paths), detector,
+                                      args.stage_frames, args.llm_frames)
+            pattern_scaling = benchmark_pattern_scaling(realsense_video, pattern_paths, work_dir, args.scaling_patterns,
+                                                        args.stage_frames, args.scaling_pattern_size, args.seed) if args.scaling_patterns else []
+            pipeline = [
+                benchmark_pipeline(str(work_dir), raw_video, realsense_video, pattern_paths if processes['Pattern Thresholding'] else [],
+                                   processes, frame_workers, args.repeat, llm_host, args.llm_in_flight,
+                                   not args.bgr_decode, args.zip)
+                for frame_workers in args.frame_workers
+            ]
+            llm_server = fake_ollama.stats()
+    finally:
+        if not args.data_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    results = {
+        'schema_version': SCHEMA_VERSION,
+        'created': datetime.now(timezone.utc).isoformat(),
+        'commit': _git_commit(),
+        'environment': {
+            'python': platform.python_version(),
+            'opencv': cv2.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+        },
+        'config': dict(vars(args), processes=processes, generate_seconds=generate_seconds),
+        'llm_server': llm_server,
+        'stages': stages,
+        'pattern_scaling': pattern_scaling,
+        'pipeline': pipeline,
+    }
+    _print_summary(results)
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+        print(f"Results written to {args.output}")
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())
+        changed = [key for key in WORKLOAD_SETTINGS if baseline.get('config', {}).get(key) != results['config'][key]]
+        if changed:
+            print(f"Note: {args.compare} was run with different {', '.join(changed)}; differences may not be regressions")
+        regressions = compare_results(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+        print(f"No regressions beyond {args.tolerance:.0%} against {args.compare}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+import cv2
+import numpy as np
+from pathlib import Path
+
+# FFV1 is lossless, so every run decodes exactly the frames that were generated
+VIDEO_FOURCC = "FFV1"
+VIDEO_EXTENSION = ".mkv"
+
+
+def _smooth_noise(rng, height, width, cells=8):
+    """Low-frequency noise: a coarse random grid scaled up, like a depth map of uneven ground."""
+    coarse = rng.random((cells, max(1, cells * width // height))).astype(np.float32)
+    return cv2.resize(coarse, (width, height), interpolation=cv2.INTER_CUBIC)
+
+
+def generate_pattern_image(rng, size=128, shapes=12):
+    """A grayscale pattern of random shapes, with enough corners and edges for SIFT to describe."""
+    image = np.full((size, size), int(rng.integers(60, 200)), np.uint8)
+    for _ in range(shapes):
+        color = int(rng.integers(0, 256))
+        x, y = (int(v) for v in rng.integers(0, size, 2))
+        extent = int(rng.integers(size // 16, size // 4))
+        kind = rng.integers(0, 3)
+        if kind == 0:
+            cv2.rectangle(image, (x, y), (x + extent, y + extent // 2), color, -1)
+        elif kind == 1:
+            cv2.circle(image, (x, y), extent // 2, color, -1)
+        else:
+            x2, y2 = (int(v) for v in rng.integers(0, size, 2))
+            cv2.line(image, (x, y), (x2, y2), color, max(1, extent // 6))
+    return image
+
+
+def generate_pattern_library(output_dir, count, size=128, seed=0):
+    """Writes `count` distinct pattern images. Returns: list of their paths."""
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    paths = []
+    for index in range(count):
+        path = output_dir / f"pattern_{index:03d}.png"
+        cv2.imwrite(str(path), generate_pattern_image(rng, size))
+        paths.append(str(path))
+    return paths
+
+
+def generate_video_pair(output_dir, width=640, height=480, frames=120, fps=30, pattern_paths=(),
+                        pattern_density=0.5, solid_density=0.1, seed=0):
+    """
+    Writes a raw video and a RealSense-like depth video of the same scene.
+
+    Each frame independently shows one of the patterns (with probability pattern_density),
+    is a depth dropout that the solid color check rejects (solid_density), or shows only
+    background. The same seed always produces the same videos.
+    Returns: (raw_video_path, realsense_video_path)
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    patterns = [cv2.imread(str(path), cv2.IMREAD_GRAYSCALE) for path in pattern_paths]
+    raw_path = output_dir / f"raw{VIDEO_EXTENSION}"
+    realsense_path = output_dir / f"realsense{VIDEO_EXTENSION}"
+    fourcc = cv2.VideoWriter_fourcc(*VIDEO_FOURCC)
+    raw_writer = cv2.VideoWriter(str(raw_path), fourcc, fps, (width, height))
+    realsense_writer = cv2.VideoWriter(str(realsense_path), fourcc, fps, (width, height))
+    if not raw_writer.isOpened() or not realsense_writer.isOpened():
+        raise IOError(f"OpenCV can't write {VIDEO_FOURCC} video; it needs an FFmpeg-enabled build.")
+
+    ground = _smooth_noise(rng, height, width)
+    try:
+        for index in range(frames):
+            # Drift the background a little every frame, as a moving camera would
+            depth = np.roll(ground, index * 2, axis=1)
+            depth = (60 + 120 * depth + rng.normal(0, 2, (height, width))).clip(0, 255).astype(np.uint8)
+            draw = rng.random()
+            if draw < solid_density:
+                depth[:] = rng.integers(0, 10)
+            elif patterns and draw < solid_density + pattern_density:
+                pattern = patterns[int(rng.integers(0, len(patterns)))]
+                scale = min(1.0, 0.5 * min(width, height) / max(pattern.shape))
+                pattern = cv2.resize(pattern, None, fx=scale * rng.uniform(0.8, 1.2), fy=scale * rng.uniform(0.8, 1.2))
+                ph, pw = pattern.shape
+                y, x = int(rng.integers(0, height - ph + 1)), int(rng.integers(0, width - pw + 1))
+                depth[y:y + ph, x:x + pw] = pattern
+            realsense_writer.write(cv2.applyColorMap(depth, cv2.COLORMAP_BONE))
+            raw = cv2.cvtColor(depth, cv2.COLOR_GRAY2BGR)
+            raw[..., 1] = np.clip(raw[..., 1].astype(np.int16) + 40, 0, 255) # Greener than the depth view
+            raw_writer.write(raw)
+    finally:
+        raw_writer.release()
+        realsense_writer.release()
+    return str(raw_path), str(realsense_path)
@@ -0,0 +1,27 @@
+"""Default pipeline settings shared by new web sessions and the batch CLI."""
+
+# Default threshold parameters
+DEFAULT_PATTERN_THRES = 200 # SIFT distance threshold for pattern matching
+DEFAULT_SOLID_THRES = 0.60 # Percentage for black/white detection
+DEFAULT_OBJ_PROMPT = "Analyze the image and determine with at least 70% confidence whether it contains man-made objects (buildings, houses, light poles, cars, sheds, or artificial structures) that affect depth; exclude natural elements like trees or paths in mostly tree-covered images, and explicitly state 'True' or 'False' before listing identified objects or explaining uncertainty."
+DEFAULT_BLACK_THRES = 30 # Pixel value for black in BW check
+DEFAULT_WHITE_THRES = 225 # Pixel value for white in BW check
+
+
+def default_thres_params():
+    return {
+        'Pattern Thresholding Value': DEFAULT_PATTERN_THRES, # SIFT distance
+        'Solid Color Detection': DEFAULT_SOLID_THRES,  # BW percentage
+        'Object Detection Prompt': DEFAULT_OBJ_PROMPT,
+        'Black Threshold BW': DEFAULT_BLACK_THRES,
+        'White Threshold BW': DEFAULT_WHITE_THRES,
+        'Reject No Pattern Match': False, # Reject frames matching no pattern instead of filing them under No_Pattern_Match
+    }
+
+
+def default_pipeline_processes():
+    return {
+        'Pattern Thresholding': True,
+        'Model Object Detection': True,
+        'Solid Color Detection': True
+    }
@@ -0,0 +1,132 @@
+import asyncio
+import functools
+import itertools
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Number of pipeline jobs allowed to run at once; everything else waits in the queue
+DEFAULT_MAX_CONCURRENT_JOBS = int(os.getenv("PIPELINE_MAX_CONCURRENT_JOBS", 2))
+
+
+class PipelineJobScheduler:
+    """
+    Queues pipeline jobs and runs them in a bounded process pool so the synchronous
+    frame-processing code never blocks the FastAPI event loop.
+
+    Jobs are dequeued by priority (higher first), then in submission order. Each job gets
+    a cross-process cancel event that `process_video_frames` polls between frames, and a
+    cross-process dict it publishes live progress into.
+    """
+
+    def __init__(self, max_concurrent_jobs: int = DEFAULT_MAX_CONCURRENT_JOBS):
+        self.max_concurrent_jobs = max(1, max_concurrent_jobs)
+        self.executor: Optional[ProcessPoolExecutor] = None
+        self._manager = None
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._workers = []
+        self._sequence = itertools.count()
+        self._pending: Dict[str, tuple] = {} # job_id -> queue sort key, for jobs not yet started
+        self._cancel_events: Dict[str, object] = {}
+        self._progress: Dict[str, object] = {}
+        self._cancelled = set()
+
+    def start(self):
+        """Creates the process pool and dispatcher tasks. Must be called from the running event loop."""
+        if self._workers:
+            return
+        self.executor = ProcessPoolExecutor(max_workers=self.max_concurrent_jobs)
+        self._manager = multiprocessing.Manager()
+        self._queue = asyncio.PriorityQueue()
+        self._workers = [asyncio.create_task(self._dispatch()) for _ in range(self.max_concurrent_jobs)]
+        logger.info(f"Pipeline job scheduler started with {self.max_concurrent_jobs} worker(s).")
+
+    async def shutdown(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        for event in self._cancel_events.values():
+            event.set()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+        if self._manager is not None:
+            self._manager.shutdown()
+            self._manager = None
+
+    def submit(self, job_id: str, run_job: Callable[[], Awaitable[None]], priority: int = 0):
+        """
+        Queues a job.
+        Args:
+            job_id (str): Pipeline job ID.
+            run_job (callable): Coroutine function that runs the job, typically by calling `run_in_pool`.
+            priority (int): Higher values are dequeued first; equal priorities run FIFO.
+        """
+        self.start()
+        self._cancel_events[job_id] = self._manager.Event()
+        self._progress[job_id] = self._manager.dict()
+        sort_key = (-priority, next(self._sequence))
+        self._pending[job_id] = sort_key
+        self._queue.put_nowait((*sort_key, job_id, run_job))
+
+    def queue_position(self, job_id: str) -> Optional[int]:
+        """Zero-based position of a queued job in dequeue order, or None if it isn't waiting."""
+        sort_key = self._pending.get(job_id)
+        if sort_key is None:
+            return None
+        return sum(1 for other_id, other_key in self._pending.items()
+                   if other_key < sort_key and other_id not in self._cancelled)
+
+    def job_ids(self) -> list:
+        """IDs of the jobs queued or running in this scheduler."""
+        return list(self._cancel_events)
+
+    def cancel_event(self, job_id: str):
+        return self._cancel_events.get(job_id)
+
+    def progress(self, job_id: str):
+        """Shared dict a queued or running job publishes progress into, or None once it has finished."""
+        return self._progress.get(job_id)
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        Cancels a queued or running job.
+        Returns: True if the job was still pending or running, False otherwise.
+        """
+        event = self._cancel_events.get(job_id)
+        if event is None or job_id in self._cancelled:
+            return False
+        self._cancelled.add(job_id)
+        event.set()
+        return True
+
+    def is_cancelled(self, job_id: str) -> bool:
+        return job_id in self._cancelled
+
+    async def run_in_pool(self, func, *args, **kwargs):
+        """Runs a synchronous function in the job process pool and awaits its result."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    async def _dispatch(self):
+        while True:
+            _, _, job_id, run_job = await self._queue.get()
+            self._pending.pop(job_id, None)
+            try:
+                if job_id in self._cancelled:
+                    logger.info(f"Pipeline Job {job_id}: Skipped, cancelled while queued.")
+                    continue
+                await run_job()
+            except Exception as e:
+                logger.error(f"Pipeline Job {job_id}: Unhandled scheduler error: {e}", exc_info=True)
+            finally:
+                self._cancel_events.pop(job_id, None)
+                self._progress.pop(job_id, None)
+                self._cancelled.discard(job_id)
+                self._queue.task_done()
+
@@ -1,5 +1,5 @@
-from fastapi import FastAPI, UploadFile, File, Form, BackgroundTasks, Request, HTTPException
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi import FastAPI, UploadFile, File, Form, BackgroundTasks, Request, HTTPException, Body
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from pathlib import Path
@@ -14,8 +14,20 @@ import json
 from typing import Dict, Optional, List
 from pydantic import BaseModel
 from dotenv import load_dotenv
-from pipeline import process_video_frames
+from pipeline import (process_video_frames, summarize_progress, PatternLibrary, PipelineCancelled, invalidate_pattern_cache,
+                      stream_zip_from_directory, stream_manifest_results, load_results_info, FrameSampler)
+from pipeline.checkpoint import has_checkpoint
+from pipeline.profiling import PROFILE_DIRNAME, PROFILE_STATS_FILENAME, profile_job
+from pipeline.metrics import METRICS_FILENAME, PipelineMetrics, format_prometheus, merge_metrics, summarize_metrics
+from pipeline.metrics import pipeline_metrics as server_metrics # In this process it only ever accumulates
+from defaults import default_pipeline_processes, default_thres_params
+from jobs import PipelineJobScheduler
+from uploads import ChunkedUploadStore, DEFAULT_UPLOAD_CHUNK_SIZE, content_upload_id, is_content_hash
+from store import MemoryStateStore, StateStoreBusy, open_state_store
+from storage import DEFAULT_ORPHAN_GRACE, DEFAULT_SWEEP_INTERVAL, StorageManager, storage_quotas_from_env, storage_ttls_from_env, touch
+from contextlib import asynccontextmanager
 import time
+import socket
 import asyncio
 
 
@@ -40,19 +52,97 @@ PIPELINE_OUTPUT_DIR = Path("pipeline_output")
 for folder in [UPLOAD_DIR, DOWNLOAD_DIR, FRAMES_DIR, MIRROR_DIR, PATTERN_DIR, CHUNK_DIR, PIPELINE_OUTPUT_DIR]:
     folder.mkdir(exist_ok=True)
 
-# Default threshold parameters
-DEFAULT_PATTERN_THRES = 200 # SIFT distance threshold for pattern matching
-DEFAULT_SOLID_THRES = 0.60 # Percentage for black/white detection
-DEFAULT_OBJ_PROMPT = "Analyze the image and determine with at least 70% confidence whether it contains man-made objects (buildings, houses, light poles, cars, sheds, or artificial structures) that affect depth; exclude natural elements like trees or paths in mostly tree-covered images, and explicitly state 'True' or 'False' before listing identified objects or explaining uncertainty."
-DEFAULT_BLACK_THRES = 30 # Pixel value for black in BW check
-DEFAULT_WHITE_THRES = 225 # Pixel value for white in BW check
-
-# Store session data
-sessions: Dict[str, dict] = {}
-pipeline_jobs: Dict[str, Dict[str, any]] = {} # In-memory job store
-
-
-app = FastAPI()
+PIPELINE_FRAME_WORKERS = int(os.getenv("PIPELINE_FRAME_WORKERS", 1)) # Processes per job working on frame ranges in parallel
+# Optional JSON {stage name: seconds per frame} overriding stage ordering, e.g. taken from a job's stage_timings.json
+PIPELINE_STAGE_COSTS = json.loads(os.getenv("PIPELINE_STAGE_COSTS", "{}"))
+# Per-video frame features (histograms, SIFT match distances, LLM answers) so threshold tweaks re-run in seconds
+FEATURE_STORE_DIR = os.getenv("FEATURE_STORE_DIR", "feature_store") if os.getenv("FEATURE_STORE_ENABLED", "1") != "0" else None
+# "gray" decodes the depth stream straight to luma (colorized depth falls back to BGR); "bgr" always converts
+REALSENSE_DECODE_MODE = os.getenv("REALSENSE_DECODE_MODE", "gray").lower()
+REALSENSE_ANALYSIS_WIDTH = int(os.getenv("REALSENSE_ANALYSIS_WIDTH", 0)) # Width depth frames are analysed at; 0 keeps full resolution
+# "stream" builds the results ZIP on the fly at download time; "file" writes it to downloads/ when the job finishes
+RESULTS_ZIP_MODE = os.getenv("RESULTS_ZIP_MODE", "stream").lower()
+RESULTS_KEEP_UNZIPPED = os.getenv("RESULTS_KEEP_UNZIPPED", "0") != "0" # With "file", also keep the images the ZIP was made from
+# "manifest" records accepted frame indices instead of copying images; images are extracted from the videos on download
+RESULTS_OUTPUT_MODE = os.getenv("RESULTS_OUTPUT_MODE", "images").lower()
+RESULTS_MANIFEST_FORMAT = os.getenv("RESULTS_MANIFEST_FORMAT", "csv").lower() # csv, jsonl or parquet (needs pyarrow)
+# Let /api/run-pipeline start on videos that are still uploading (overridable per request with "streaming_ingest")
+STREAMING_INGEST = os.getenv("STREAMING_INGEST", "0") != "0"
+# Default for jobs that don't say; profiled jobs run noticeably slower
+PIPELINE_PROFILE = os.getenv("PIPELINE_PROFILE", "0") != "0"
+PIPELINE_PROGRESS_STREAM_INTERVAL = float(os.getenv("PIPELINE_PROGRESS_STREAM_INTERVAL", 1.0)) # Seconds between progress events
+TERMINAL_JOB_STATUSES = {"completed", "completed_no_output", "failed", "cancelled"}
+# Sessions (and their uploads in progress) and job records are dropped this many seconds after they were last used
+SESSION_TTL = float(os.getenv("SESSION_TTL", 7 * 24 * 3600))
+JOB_TTL = float(os.getenv("JOB_TTL", 7 * 24 * 3600))
+# Seconds between each worker's saves of its running jobs' progress to the state store
+JOB_STATE_SYNC_INTERVAL = float(os.getenv("JOB_STATE_SYNC_INTERVAL", 2.0))
+JOB_STALE_AFTER = max(30.0, 10 * JOB_STATE_SYNC_INTERVAL) # Unfinished jobs not saved for this long lost their worker
+STATE_PURGE_INTERVAL = 600 # Seconds between deletions of expired sessions and jobs
+BACKEND_WORKERS = int(os.getenv("BACKEND_WORKERS", 1)) # uvicorn worker processes; more than 1 needs the sqlite state store
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+# Optional JSON {directory name: GB} / {directory name: hours}, e.g. {"downloads": 50} (see storage.py)
+STORAGE_QUOTAS = storage_quotas_from_env()
+STORAGE_TTLS = storage_ttls_from_env()
+
+# Session, job and upload state, shared by every worker using the same store (see store.py)
+state_store = open_state_store()
+sessions = state_store.table("sessions", ttl=SESSION_TTL)
+pipeline_jobs = state_store.table("pipeline_jobs", ttl=JOB_TTL)
+job_metrics = state_store.table("job_metrics", ttl=JOB_TTL) # Metrics snapshot of each finished job (see pipeline.metrics), plus download zipping
+# This worker's pattern SIFT features per session, with the pattern paths they were built from
+pattern_libraries: Dict[str, tuple] = {}
+job_scheduler = PipelineJobScheduler() # Runs this worker's pipeline jobs in a bounded process pool
+upload_store = ChunkedUploadStore(UPLOAD_DIR, state=state_store.table("uploads", ttl=SESSION_TTL)) # Chunked uploads in progress, written in place
+
+
+def _storage_references():
+    """
+    Paths the storage manager must keep: (in use, referenced). Session files and everything of
+    unfinished jobs are in use; the results of finished jobs (and, for manifest results, the
+    videos they are extracted from) are only referenced, so quotas may evict them.
+    """
+    in_use, referenced = set(), set()
+    for session_id, session in sessions.items():
+        thumbnails = session.get("thumbnails", {})
+        thumbnail_urls = [thumbnails.get("dataset"), thumbnails.get("mirror"), *thumbnails.get("pattern", [])]
+        in_use.update(path for path in (session.get("dataset_path"), session.get("mirror_path"), *session.get("pattern_paths", []),
+                                        *session.get("uploading_paths", {}).values()) if path)
+        in_use.update(UPLOAD_DIR / Path(url).name for url in thumbnail_urls if url)
+        in_use.add(PATTERN_DIR / session_id)
+    for job_id, job_info in pipeline_jobs.items():
+        job_paths = [PIPELINE_OUTPUT_DIR / job_id, DOWNLOAD_DIR / (job_info.get("output_filename") or f"Results_{job_id}.zip")]
+        if job_info.get("status") not in TERMINAL_JOB_STATUSES:
+            in_use.update(job_paths + job_info.get("inputs", []))
+            continue
+        referenced.update(job_paths)
+        results_info = load_results_info(PIPELINE_OUTPUT_DIR / job_id) if job_info.get("output_mode") == "manifest" else None
+        if results_info:
+            referenced.update((results_info["raw_video"], results_info["realsense_video"]))
+    return in_use, referenced
+
+storage_manager = StorageManager(_storage_references, orphan_grace=DEFAULT_ORPHAN_GRACE)
+for directory, per_folder in [(UPLOAD_DIR, False), (PATTERN_DIR, True), (PIPELINE_OUTPUT_DIR, True), (DOWNLOAD_DIR, False), (CHUNK_DIR, False)]:
+    storage_manager.add_directory(directory.name, directory, STORAGE_QUOTAS.get(directory.name), STORAGE_TTLS.get(directory.name), per_folder)
+for directory in set(STORAGE_QUOTAS) | set(STORAGE_TTLS):
+    if directory not in storage_manager.directories:
+        logger.warning(f"Storage limits set for unknown directory '{directory}'; expected one of {sorted(storage_manager.directories)}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    job_scheduler.start()
+    background_tasks = [asyncio.create_task(_sync_job_state())]
+    if DEFAULT_SWEEP_INTERVAL > 0:
+        background_tasks.append(asyncio.create_task(_sweep_storage()))
+    yield
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    await job_scheduler.shutdown()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Configure CORS
 app.add_middleware(
@@ -70,6 +160,13 @@ app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
 app.mount("/patterns", StaticFiles(directory=PATTERN_DIR), name="patterns")
 
 
+@app.exception_handler(StateStoreBusy)
+async def state_store_busy_handler(request: Request, exc: StateStoreBusy):
+    # Another worker held the state store for longer than STATE_STORE_BUSY_TIMEOUT; the client can retry
+    logger.warning(f"{request.method} {request.url.path}: {exc}")
+    return JSONResponse(status_code=503, content={"detail": "The server is busy, please try again."}, headers={"Retry-After": "1"})
+
+
 @app.get("/api/new-session")
 async def create_session():
     """Create a new session for the user"""
@@ -77,19 +174,10 @@ async def create_session():
     sessions[session_id] = {
         'dataset_path': None,
         'mirror_path': None,
+        'uploading_paths': {}, # file_type -> final path of a video whose upload is still in progress
         'pattern_paths': [],
-        'thres_params': {
-            'Pattern Thresholding Value': DEFAULT_PATTERN_THRES, # SIFT distance
-            'Solid Color Detection': DEFAULT_SOLID_THRES,  # BW percentage
-            'Object Detection Prompt': DEFAULT_OBJ_PROMPT,
-            'Black Threshold BW': DEFAULT_BLACK_THRES,
-            'White Threshold BW': DEFAULT_WHITE_THRES,
-        },
-        'pipeline_processes': {
-            'Pattern Thresholding': True,
-            'Model Object Detection': True,
-            'Solid Color Detection': True
-        },
+        'thres_params': default_thres_params(),
+        'pipeline_processes': default_pipeline_processes(),
         'thumbnails': {
             'dataset': None,
             'mirror': None,
@@ -100,11 +188,53 @@ async def create_session():
     return {"session_id": session_id}
 
 @app.post("/api/init-upload")
-async def init_upload():
-    """Initialize a new upload job"""
-    job_id = str(uuid.uuid4())
-    logger.debug(f"🎯 Initialized new job: {job_id}")
-    return {"job_id": job_id}
+async def init_upload(init_data: Optional[dict] = Body(default=None)):
+    """
+    Initialize a new upload job.
+    With a content_hash (see uploads.content_hash_of_file) plus filename, file_type, session_id
+    and total_chunks, an identical file that is already stored is attached to the session
+    without any transfer, and an interrupted upload of it reports the chunks it already has.
+    """
+    content_hash = (init_data or {}).get("content_hash")
+    if not content_hash:
+        job_id = str(uuid.uuid4())
+        logger.debug(f"🎯 Initialized new job: {job_id}")
+        return {"job_id": job_id}
+
+    content_hash = content_hash.lower()
+    original_filename = init_data.get("filename")
+    session_id = init_data.get("session_id")
+    file_type = init_data.get("file_type", "dataset")
+    if not is_content_hash(content_hash) or not original_filename:
+        raise HTTPException(status_code=400, detail="content_hash must be a hex SHA-256 and filename is required.")
+    if session_id not in sessions:
+        raise HTTPException(status_code=404, detail=f"Session {session_id} not found.")
+
+    job_id = content_upload_id(content_hash)
+    stored_path = upload_store.find_content(content_hash, original_filename)
+    if stored_path is not None:
+        logger.info(f"Upload of {original_filename} skipped: identical content already stored at {stored_path}")
+        return {"job_id": job_id, **await _complete_upload(stored_path, original_filename, job_id, file_type, session_id, shared=True)}
+
+    total_chunks = _optional_int(init_data.get("total_chunks"))
+    received_chunks = []
+    if total_chunks:
+        try:
+            received_chunks = await asyncio.to_thread(
+                upload_store.received_chunks, job_id, original_filename, total_chunks,
+                _optional_int(init_data.get("chunk_size")) or DEFAULT_UPLOAD_CHUNK_SIZE, _optional_int(init_data.get("file_size"))
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    if total_chunks and len(received_chunks) == total_chunks:
+        # Every chunk arrived before an interruption, but the file was never finished
+        upload = upload_store.pop(job_id)
+        try:
+            await asyncio.to_thread(upload.finalize)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return {"job_id": job_id, **await _complete_upload(upload.final_path, original_filename, job_id, file_type, session_id, shared=True)}
+    return {"job_id": job_id, "status": "resume" if received_chunks else "new", "received_chunks": received_chunks}
 
 def generate_thumbnail(source_path_str: str, unique_id: str, file_type: str, is_video_file: bool):
     """Generates a thumbnail and saves it to UPLOAD_DIR."""
@@ -139,6 +269,37 @@ def generate_thumbnail(source_path_str: str, unique_id: str, file_type: str, is_
         return None
 
 
+def _optional_int(value):
+    return int(value) if value not in (None, "") else None
+
+async def _receive_chunk(upload_job_id, original_filename, chunk_index, total_chunks, chunk_size, total_size, write_chunk,
+                         session_id=None, file_type=None):
+    """Writes one chunk in place via write_chunk(upload); returns the finished ChunkedUpload or None."""
+    if not 0 <= chunk_index < total_chunks:
+        raise HTTPException(status_code=400, detail=f"Chunk index {chunk_index} out of range for {total_chunks} chunks.")
+    try:
+        upload = await asyncio.to_thread(
+            upload_store.get_or_create, upload_job_id, original_filename, total_chunks,
+            chunk_size or DEFAULT_UPLOAD_CHUNK_SIZE, total_size
+        )
+        session = sessions.get(session_id)
+        if file_type in ("dataset", "mirror") and session is not None and session.get("uploading_paths", {}).get(file_type) != str(upload.final_path):
+            # Lets a streaming-ingest pipeline run start before the upload finishes
+            with sessions.edit(session_id) as session:
+                session.setdefault("uploading_paths", {})[file_type] = str(upload.final_path)
+        written = await write_chunk(upload)
+        logger.debug(f"Chunk {chunk_index + 1}/{total_chunks} for {original_filename} (job:{upload_job_id}) written at offset {upload.chunk_offset(chunk_index)}")
+        if not await asyncio.to_thread(upload.mark_received, chunk_index, written):
+            return None
+        upload_store.pop(upload_job_id)
+        await asyncio.to_thread(upload.finalize) # Also verifies the content hash, if one was declared
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except OSError as e:
+        logger.error(f"Error writing chunk {chunk_index} of {original_filename} (job:{upload_job_id}): {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Error saving chunk.")
+    return upload
+
 @app.post("/api/upload-chunk")
 async def upload_chunk(request: Request):
     form = await request.form()
@@ -155,135 +316,195 @@ async def upload_chunk(request: Request):
     if session_id not in sessions:
         raise HTTPException(status_code=404, detail=f"Session {session_id} not found.")
 
-    chunk_filename = f"{upload_job_id}_{original_filename}_chunk_{chunk_index}"
-    chunk_path = CHUNK_DIR / chunk_filename
-    
-    if not chunk_file: # Add a check for chunk_file existence
-        logger.error("Chunk file is missing in the form data.")
-        raise HTTPException(status_code=400, detail="Chunk file is missing.")
-
     try:
-        content = await chunk_file.read() # Use await chunk_file.read() directly
-        
-        with open(chunk_path, "wb") as f:
-            f.write(content)
-    except Exception as e:
-        logger.error(f"Error writing chunk {chunk_path}: {e}", exc_info=True) # Added exc_info for more details
-        raise HTTPException(status_code=500, detail="Error saving chunk.")
+        # Copied from the spooled form file in a worker thread, never through the event loop
+        upload = await _receive_chunk(
+            upload_job_id, original_filename, chunk_index, total_chunks,
+            _optional_int(form.get("chunk_size")), _optional_int(form.get("total_size")),
+            lambda upload: asyncio.to_thread(upload.write_from_file, chunk_index, chunk_file.file),
+            session_id, file_type
+        )
     finally:
-        if chunk_file: # Add a finally block to ensure the file is closed
-            await chunk_file.close()
+        await chunk_file.close()
 
-    logger.debug(f"Chunk {chunk_index + 1}/{total_chunks} for {original_filename} (job:{upload_job_id}, session:{session_id}) saved to {chunk_path}")
-
-    if chunk_index + 1 == total_chunks:
-        # All chunks received, assemble the file
-        # Assembled file will have a unique name using upload_job_id to avoid collision before moving
-        assembled_file_name_tmp = f"{upload_job_id}_{original_filename}"
-        temp_assembled_path = UPLOAD_DIR / assembled_file_name_tmp # Assemble in UPLOAD_DIR first
-
-        with open(temp_assembled_path, "wb") as outfile:
-            for i in range(total_chunks):
-                part_path = CHUNK_DIR / f"{upload_job_id}_{original_filename}_chunk_{i}"
-                with open(part_path, "rb") as infile:
-                    outfile.write(infile.read())
-                os.remove(part_path) # Clean up chunk
-
-        logger.info(f"File {original_filename} assembled at {temp_assembled_path} for job {upload_job_id}, session {session_id}")
+    if upload is None:
+        return {"status": "partial", "chunk_index": chunk_index, "filename": original_filename}
+    return await _complete_upload(upload.final_path, original_filename, upload_job_id, file_type, session_id,
+                                  shared=upload.content_hash is not None)
 
-        final_stored_path_str = ""
-        is_video = file_type in ["dataset", "mirror"]
-        current_session = sessions[session_id]
+@app.put("/api/upload-chunk/{upload_job_id}/{chunk_index}")
+async def upload_chunk_stream(
+    request: Request, upload_job_id: str, chunk_index: int, filename: str, total_chunks: int, session_id: str,
+    file_type: str = "dataset", chunk_size: Optional[int] = None, total_size: Optional[int] = None
+):
+    """Streaming variant of /api/upload-chunk: the request body is the raw chunk, written to disk as it arrives."""
+    if session_id not in sessions:
+        raise HTTPException(status_code=404, detail=f"Session {session_id} not found.")
+    upload = await _receive_chunk(
+        upload_job_id, filename, chunk_index, total_chunks, chunk_size, total_size,
+        lambda upload: upload.write_stream(chunk_index, request.stream()),
+        session_id, file_type
+    )
+    if upload is None:
+        return {"status": "partial", "chunk_index": chunk_index, "filename": filename}
+    return await _complete_upload(upload.final_path, filename, upload_job_id, file_type, session_id,
+                                  shared=upload.content_hash is not None)
+
+async def _complete_upload(stored_path, original_filename, upload_job_id, file_type, session_id, shared=False):
+    """
+    Files a fully received upload into the session and generates its thumbnail.
+    Shared (content-addressed) files stay where they are and are only referenced by the session.
+    """
+    temp_assembled_path = stored_path
+    logger.info(f"File {original_filename} stored at {temp_assembled_path} for job {upload_job_id}, session {session_id}")
+
+    final_stored_path_str = ""
+    is_video = file_type in ["dataset", "mirror"]
+    if file_type not in ("pattern", "dataset", "mirror"):
+        if not shared: # Clean up if not used
+            Path(temp_assembled_path).unlink(missing_ok=True)
+        logger.warning(f"Unknown file type '{file_type}' for {original_filename}. Uploaded file removed.")
+        raise HTTPException(status_code=400, detail=f"Unsupported file type: {file_type}")
+
+    if file_type == "pattern" and not shared:
+        # Store pattern images in a session-specific subfolder within PATTERN_UPLOAD_DIR
+        session_pattern_dir = PATTERN_DIR / session_id
+        session_pattern_dir.mkdir(parents=True, exist_ok=True)
+        # Use a unique name for the stored pattern file to avoid clashes if user uploads 'image.png' multiple times
+        unique_pattern_filename = f"{str(uuid.uuid4())}_{original_filename}"
+        final_dest_path = session_pattern_dir / unique_pattern_filename
+        await asyncio.to_thread(shutil.move, str(temp_assembled_path), str(final_dest_path)) # A rename on the same filesystem
+        final_stored_path_str = str(final_dest_path)
+    else:
+        # Videos are stored directly in UPLOAD_DIR under the name they were uploaded to
+        final_stored_path_str = str(temp_assembled_path)
 
+    with sessions.edit(session_id) as current_session:
         if file_type == "pattern":
-            # Store pattern images in a session-specific subfolder within PATTERN_UPLOAD_DIR
-            session_pattern_dir = PATTERN_DIR / session_id
-            session_pattern_dir.mkdir(parents=True, exist_ok=True)
-            # Use a unique name for the stored pattern file to avoid clashes if user uploads 'image.png' multiple times
-            unique_pattern_filename = f"{str(uuid.uuid4())}_{original_filename}"
-            final_dest_path = session_pattern_dir / unique_pattern_filename
-            shutil.move(str(temp_assembled_path), str(final_dest_path))
-            final_stored_path_str = str(final_dest_path)
-            current_session['pattern_paths'].append(final_stored_path_str)
-        elif is_video:
-            # Videos are stored directly in UPLOAD_DIR with their temp assembled name for now
-            # Or move them too if a different final naming convention is desired
-            final_stored_path_str = str(temp_assembled_path)
-            if file_type == "dataset":
-                current_session["dataset_path"] = final_stored_path_str
-            elif file_type == "mirror":
-                current_session["mirror_path"] = final_stored_path_str
+            if final_stored_path_str not in current_session['pattern_paths']:
+                current_session['pattern_paths'].append(final_stored_path_str)
+            pattern_libraries.pop(session_id, None) # Rebuilt with the new pattern on the next run
         else:
-            os.remove(temp_assembled_path) # Clean up if not used
-            logger.warning(f"Unknown file type '{file_type}' for {original_filename}. Assembled file removed.")
-            raise HTTPException(status_code=400, detail=f"Unsupported file type: {file_type}")
+            current_session.setdefault("uploading_paths", {}).pop(file_type, None)
+            current_session[f"{file_type}_path"] = final_stored_path_str
 
-        # Generate thumbnail for the newly stored file
-        # Use original_filename or a part of it for thumbnail name for better UX
-        thumbnail_url = generate_thumbnail(final_stored_path_str, upload_job_id, file_type, is_video_file=is_video)
+    # Generate thumbnail for the newly stored file
+    # Use original_filename or a part of it for thumbnail name for better UX
+    thumbnail_url = await asyncio.to_thread(generate_thumbnail, final_stored_path_str, upload_job_id, file_type, is_video_file=is_video)
 
-        if thumbnail_url:
+    if thumbnail_url:
+        with sessions.edit(session_id) as current_session:
             if file_type == "pattern":
                 current_session["thumbnails"]["pattern"].append(thumbnail_url)
             else: # dataset or mirror
                 current_session["thumbnails"][file_type] = thumbnail_url
-        
-        logger.info(f"File processing complete for {original_filename}. Final path: {final_stored_path_str}. Thumbnail: {thumbnail_url}")
-        return {
-            "status": "complete",
-            "filename": original_filename, # Original filename for FE
-            "stored_filename": Path(final_stored_path_str).name, # Actual name on disk
-            "file_type": file_type,
-            "thumbnail_url": thumbnail_url, # Thumbnail for this specific file
-            "all_session_thumbnails": current_session["thumbnails"], # All thumbnails for the session
-        }
-    else:
-        return {"status": "partial", "chunk_index": chunk_index, "filename": original_filename}
+    
+    logger.info(f"File processing complete for {original_filename}. Final path: {final_stored_path_str}. Thumbnail: {thumbnail_url}")
+    return {
+        "status": "complete",
+        "filename": original_filename, # Original filename for FE
+        "stored_filename": Path(final_stored_path_str).name, # Actual name on disk
+        "file_type": file_type,
+        "thumbnail_url": thumbnail_url, # Thumbnail for this specific file
+        "all_session_thumbnails": current_session["thumbnails"], # All thumbnails for the session
+    }
+
+def _update_job(job_id, changes):
+    """Applies changes to a job's stored record. Returns: the updated record, or None if it no longer exists."""
+    try:
+        with pipeline_jobs.edit(job_id) as job_info:
+            job_info.update(changes)
+    except KeyError:
+        return None
+    return job_info
 
 async def run_pipeline_background_task(
     pipeline_job_id: str, session_id: str, raw_video_path: str, realsense_video_path: str,
-    pattern_img_paths: List[str], session_thres_params: dict, session_pipeline_processes: dict
+    pattern_img_paths: List[str], session_thres_params: dict, session_pipeline_processes: dict,
+    pattern_library: Optional[PatternLibrary] = None, streaming_ingest: bool = False, profile: bool = False,
+    sampling_options: Optional[dict] = None
 ):
+    if (pipeline_jobs.get(pipeline_job_id) or {}).get("status") != "queued":
+        logger.info(f"Pipeline Job {pipeline_job_id}: Skipped, cancelled through another worker while queued.")
+        return
     logger.info(f"Pipeline Job {pipeline_job_id} (Session: {session_id}): Starting background processing...")
-    pipeline_jobs[pipeline_job_id] = {
+    _update_job(pipeline_job_id, {
         "status": "running", "session_id": session_id, "start_time": time.time(),
         "message": "Processing started."
-    }
+    })
+    # Profiled jobs run the whole job (and each frame range worker) under a profiler
+    profile_dir = str(PIPELINE_OUTPUT_DIR / pipeline_job_id / PROFILE_DIRNAME) if profile else None
+    job_function = (profile_job, profile_dir, process_video_frames) if profile else (process_video_frames,)
     try:
-        # Call the refactored processing function from processes/__init__.py
-        processed_frames_count, output_zip_filename = process_video_frames(
-            job_id=pipeline_job_id, # Pass pipeline_job_id for unique output folder naming
-            path_to_raw_video=raw_video_path,
-            path_to_realsense_video=realsense_video_path,
-            pattern_image_paths=pattern_img_paths,
-            thres_params=session_thres_params,
-            pipeline_processes_config=session_pipeline_processes
-        )
+        try:
+            # Runs process_video_frames in the scheduler's process pool so the event loop stays responsive
+            processed_frames_count, output_zip_filename = await job_scheduler.run_in_pool(
+                *job_function,
+                job_id=pipeline_job_id, # Pass pipeline_job_id for unique output folder naming
+                path_to_raw_video=raw_video_path,
+                path_to_realsense_video=realsense_video_path,
+                pattern_image_paths=pattern_img_paths,
+                thres_params=session_thres_params,
+                pipeline_processes_config=session_pipeline_processes,
+                pattern_library=pattern_library,
+                cancel_event=job_scheduler.cancel_event(pipeline_job_id),
+                frame_workers=PIPELINE_FRAME_WORKERS,
+                stage_costs=PIPELINE_STAGE_COSTS or None,
+                feature_store_dir=FEATURE_STORE_DIR,
+                realsense_gray_decode=REALSENSE_DECODE_MODE == "gray",
+                analysis_width=REALSENSE_ANALYSIS_WIDTH or None,
+                create_zip=RESULTS_ZIP_MODE != "stream" and RESULTS_OUTPUT_MODE != "manifest",
+                keep_unzipped=RESULTS_KEEP_UNZIPPED,
+                output_mode=RESULTS_OUTPUT_MODE,
+                manifest_format=RESULTS_MANIFEST_FORMAT,
+                streaming_ingest=streaming_ingest,
+                progress=job_scheduler.progress(pipeline_job_id),
+                profile_dir=profile_dir,
+                sampling_options=sampling_options
+            )
+        finally:
+            # Kept before the status changes, so clients see final numbers along with the final status
+            await _record_final_progress(pipeline_job_id)
+            if profile and (PIPELINE_OUTPUT_DIR / pipeline_job_id / PROFILE_DIRNAME / PROFILE_STATS_FILENAME).exists():
+                _update_job(pipeline_job_id, {"profile_url": f"/api/pipeline-profile/{pipeline_job_id}"})
 
         if output_zip_filename:
-            download_url = f"/downloads/{output_zip_filename}" # Assuming zip is in DOWNLOAD_DIR
-            pipeline_jobs[pipeline_job_id].update({
+            if RESULTS_ZIP_MODE == "stream" or RESULTS_OUTPUT_MODE == "manifest":
+                download_url = f"/api/download-results/{pipeline_job_id}"
+            else:
+                download_url = f"/downloads/{output_zip_filename}" # Assuming zip is in DOWNLOAD_DIR
+            _update_job(pipeline_job_id, {
                 "status": "completed",
                 "message": f"Successfully processed {processed_frames_count} frames.",
                 "download_url": download_url,
                 "output_filename": output_zip_filename,
+                "output_mode": RESULTS_OUTPUT_MODE,
                 "end_time": time.time()
             })
             logger.info(f"Pipeline Job {pipeline_job_id}: Completed. Download at {download_url}")
         else:
-             pipeline_jobs[pipeline_job_id].update({
+             _update_job(pipeline_job_id, {
                 "status": "completed_no_output",
                 "message": f"Processed {processed_frames_count} frames, but no images were accepted into the output.",
                 "end_time": time.time()
             })
              logger.info(f"Pipeline Job {pipeline_job_id}: Completed but no output ZIP generated.")
 
+    except PipelineCancelled:
+        logger.info(f"Pipeline Job {pipeline_job_id}: Cancelled.")
+        _update_job(pipeline_job_id, {
+            "status": "cancelled",
+            "message": "Pipeline job was cancelled.",
+            "resumable": has_checkpoint(PIPELINE_OUTPUT_DIR / pipeline_job_id),
+            "end_time": time.time()
+        })
     except Exception as e:
         logger.error(f"Pipeline Job {pipeline_job_id}: Failed. Error: {e}", exc_info=True)
-        pipeline_jobs[pipeline_job_id].update({
+        _update_job(pipeline_job_id, {
             "status": "failed",
             "error": str(e),
             "message": "An error occurred during pipeline processing.",
+            "resumable": has_checkpoint(PIPELINE_OUTPUT_DIR / pipeline_job_id),
             "end_time": time.time()
         })
 
@@ -319,22 +540,24 @@ async def update_threshold_endpoint(threshold_data: dict):
     param_name = threshold_data.get('param_name') # e.g., 'Pattern Thresholding Value'
     value = threshold_data.get('value')
 
-    if not session_id or session_id not in sessions:
+    session = sessions.get(session_id) if session_id else None
+    if session is None:
         raise HTTPException(status_code=404, detail="Invalid session ID")
-    if param_name not in sessions[session_id]['thres_params']:
+    if param_name not in session['thres_params']:
         raise HTTPException(status_code=400, detail=f"Invalid threshold parameter name: {param_name}")
 
     try:
         # Attempt to cast to appropriate type if needed (e.g., float, int)
-        if isinstance(sessions[session_id]['thres_params'][param_name], (int, float)):
+        if isinstance(session['thres_params'][param_name], (int, float)):
             if isinstance(value, str): # Attempt conversion if string value from JS
                  try:
                     value = float(value) if '.' in value else int(value)
                  except ValueError:
                     raise HTTPException(status_code=400, detail=f"Invalid value type for {param_name}. Expected number.")
-        sessions[session_id]['thres_params'][param_name] = value
+        with sessions.edit(session_id) as session:
+            session['thres_params'][param_name] = value
         logger.info(f"Session {session_id}: Updated threshold '{param_name}' to '{value}'")
-        return {"success": True, "updated_params": sessions[session_id]['thres_params']}
+        return {"success": True, "updated_params": session['thres_params']}
     except Exception as e:
         logger.error(f"Error updating threshold for session {session_id}: {e}")
         raise HTTPException(status_code=500, detail="Error updating threshold.")
@@ -443,6 +666,22 @@ async def run_pipeline_endpoint(pipeline_data: dict, background_tasks: Backgroun
     raw_path = session.get("dataset_path")
     realsense_path = session.get("mirror_path")
     pattern_paths = session.get("pattern_paths", []) # List of paths
+    streaming_ingest = bool(pipeline_data.get('streaming_ingest', STREAMING_INGEST))
+    profile = bool(pipeline_data.get('profile', PIPELINE_PROFILE))
+    # Optional {"mode": "stride" or "scene", "stride": n, "scene_threshold": x}; the server .env sets the defaults
+    try:
+        sampler = FrameSampler(**(pipeline_data.get('sampling') or {}))
+    except (TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid sampling settings: {e}")
+    try:
+        priority = int(pipeline_data.get('priority', 0)) # Higher runs first (see jobs.PipelineJobScheduler)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid priority; expected an integer.")
+    if streaming_ingest:
+        # Videos still uploading (including replacements for ones already uploaded) are processed as they arrive
+        uploading_paths = session.get("uploading_paths", {})
+        raw_path = uploading_paths.get("dataset", raw_path)
+        realsense_path = uploading_paths.get("mirror", realsense_path)
 
     if not raw_path: # Mirror might be optional depending on pipeline
         raise HTTPException(status_code=400, detail="Dataset video not uploaded.")
@@ -453,34 +692,309 @@ async def run_pipeline_endpoint(pipeline_data: dict, background_tasks: Backgroun
     if session['pipeline_processes'].get('Pattern Thresholding', False) and not pattern_paths:
         raise HTTPException(status_code=400, detail="Pattern Thresholding is enabled, but no pattern images are uploaded.")
 
-    pipeline_job_id = str(uuid.uuid4())
-    pipeline_jobs[pipeline_job_id] = {"status": "queued", "session_id": session_id, "message": "Pipeline job is queued."}
-
-    # praying that this corrects pipeline not running in background
-    asyncio.create_task(
-        run_pipeline_background_task(
+    pattern_library = None
+    if session['pipeline_processes'].get('Pattern Thresholding', False):
+        # Patterns may have changed through another worker, so the cached library must match the session's paths
+        built_from, pattern_library = pattern_libraries.get(session_id, (None, None))
+        if built_from != tuple(pattern_paths):
+            pattern_library = await asyncio.to_thread(PatternLibrary.from_paths, pattern_paths) # Reads every image and runs SIFT on it
+            pattern_libraries[session_id] = (tuple(pattern_paths), pattern_library)
+
+    # Passing the ID of a failed or cancelled job re-runs it, resuming from its checkpoints
+    pipeline_job_id = pipeline_data.get('job_id')
+    if pipeline_job_id:
+        try:
+            pipeline_job_id = str(uuid.UUID(str(pipeline_job_id)))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid job ID")
+        previous_job = pipeline_jobs.get(pipeline_job_id)
+        if previous_job is not None and previous_job.get("session_id") != session_id:
+            raise HTTPException(status_code=409, detail="Job belongs to another session.")
+        if previous_job is not None and previous_job.get("status") not in TERMINAL_JOB_STATUSES:
+            raise HTTPException(status_code=409, detail="Job is still queued or running.")
+    else:
+        pipeline_job_id = str(uuid.uuid4())
+    pipeline_jobs[pipeline_job_id] = {"status": "queued", "session_id": session_id, "message": "Pipeline job is queued.",
+                                      "worker": WORKER_ID, "heartbeat": time.time(),
+                                      "inputs": [raw_path, realsense_path, *pattern_paths]} # Kept from deletion while the job runs
+
+    job_scheduler.submit(
+        pipeline_job_id,
+        lambda: run_pipeline_background_task(
             pipeline_job_id,
             session_id,
             raw_path,
             realsense_path,
-            pattern_paths,
-            session['thres_params'],
-            session['pipeline_processes']
-        )
+            list(pattern_paths),
+            dict(session['thres_params']),
+            dict(session['pipeline_processes']),
+            pattern_library,
+            streaming_ingest,
+            profile,
+            dict(mode=sampler.mode, stride=sampler.stride, scene_threshold=sampler.scene_threshold)
+        ),
+        priority=priority
     )
-    logger.info(f"Pipeline job {pipeline_job_id} for session {session_id} added to background queue.")
+    logger.info(f"Pipeline job {pipeline_job_id} for session {session_id} added to job queue (priority {priority}).")
     return {"job_id": pipeline_job_id, "status": "queued", "message": "Pipeline processing initiated in background."}
 
-@app.get("/api/pipeline-status/{job_id}")
-async def get_pipeline_status(job_id: str):
+async def _read_job_progress(job_id):
+    """Summary of the progress a running job has published, or None if there is none (yet)."""
+    shared_progress = job_scheduler.progress(job_id)
+    if shared_progress is None:
+        return None
+    try:
+        snapshot = await asyncio.to_thread(dict, shared_progress) # A round trip to the manager process
+    except (OSError, EOFError): # Manager already shut down
+        return None
+    return summarize_progress(snapshot)
+
+def _merge_job_metrics(job_id, snapshot):
+    job_metrics.setdefault(job_id, merge_metrics([]))
+    with job_metrics.edit(job_id) as merged:
+        merged.update(merge_metrics([merged, snapshot]))
+
+async def _record_final_progress(job_id):
+    progress = await _read_job_progress(job_id)
+    if progress is not None:
+        _update_job(job_id, {"progress": progress})
+    # Written by process_video_frames in the job's process; server_metrics accumulates every job for /metrics
+    metrics_path = PIPELINE_OUTPUT_DIR / job_id / METRICS_FILENAME
+    if metrics_path.exists():
+        snapshot = json.loads(await asyncio.to_thread(metrics_path.read_text))
+        _merge_job_metrics(job_id, snapshot)
+        server_metrics.merge(snapshot)
+
+def _record_download_zip(job_id, seconds, error=False):
+    observed = PipelineMetrics()
+    observed.observe("zip", seconds, error)
+    snapshot = observed.snapshot()
+    _merge_job_metrics(job_id, snapshot)
+    server_metrics.merge(snapshot)
+
+def _timed_zip_stream(archive, job_id):
+    """Passes a results stream through, recording how long building and sending it took as the job's "zip" time."""
+    started = time.perf_counter()
+    error = True
+    try:
+        yield from archive
+        error = False
+    finally:
+        _record_download_zip(job_id, time.perf_counter() - started, error)
+
+def _save_job_heartbeat(job_id, progress):
+    """Records that this worker still runs a job, with its live progress. Returns: the job's record, or None if it no longer exists."""
+    try:
+        with pipeline_jobs.edit(job_id) as job_info:
+            job_info["heartbeat"] = time.time()
+            if progress is not None and job_info.get("status") == "running":
+                job_info["progress"] = progress
+    except KeyError:
+        return None
+    return job_info
+
+def _purge_expired_state():
+    """Deletes expired sessions and jobs, and this worker's pattern libraries of sessions that are gone. Returns: records deleted."""
+    purged = state_store.purge_expired()
+    for session_id in list(pattern_libraries):
+        if session_id not in sessions:
+            pattern_libraries.pop(session_id, None)
+    return purged
+
+async def _sync_job_state():
+    """
+    Runs in every worker: saves the live progress of this worker's jobs to the state store so
+    any worker can report it, passes on cancellations requested through other workers, marks
+    jobs whose worker stopped saving them (e.g. the server restarted) as failed, and deletes
+    expired sessions and jobs. Store work runs in a thread, so waiting on other workers'
+    writes doesn't hold up requests; anything that fails is retried on the next pass.
+    """
+    last_orphan_check = last_purge = 0.0
+    while True:
+        try:
+            for job_id in job_scheduler.job_ids():
+                progress = await _read_job_progress(job_id)
+                job_info = await asyncio.to_thread(_save_job_heartbeat, job_id, progress)
+                if job_info is None:
+                    continue
+                if job_info.get("cancel_requested"):
+                    job_scheduler.cancel(job_id)
+            if time.monotonic() - last_orphan_check >= JOB_STALE_AFTER / 3:
+                await asyncio.to_thread(_fail_orphaned_jobs)
+                last_orphan_check = time.monotonic()
+            if time.monotonic() - last_purge >= STATE_PURGE_INTERVAL:
+                purged = await asyncio.to_thread(_purge_expired_state)
+                if purged:
+                    logger.info(f"Deleted {purged} expired session/job record(s).")
+                last_purge = time.monotonic()
+        except Exception as e:
+            logger.error(f"Could not sync job state: {e}", exc_info=True)
+        await asyncio.sleep(JOB_STATE_SYNC_INTERVAL)
+
+async def _sweep_storage():
+    """
+    Runs in every worker, but each sweep is claimed by one of them: deletes abandoned uploads,
+    outputs of expired jobs and anything past its directory's TTL, and evicts least recently
+    used results from directories over their quota (see storage.StorageManager).
+    """
+    while True:
+        try:
+            if await asyncio.to_thread(state_store.add, "locks", "storage_sweep", {"worker": WORKER_ID}, ttl=DEFAULT_SWEEP_INTERVAL * 0.9):
+                report = await asyncio.to_thread(storage_manager.sweep)
+                usage = ", ".join(f"{name} {info['bytes'] / 1e9:.2f} GB" for name, info in report.items())
+                deleted = sum(info["deleted"] for info in report.values())
+                if deleted:
+                    logger.info(f"Storage sweep deleted {deleted} item(s), freeing {sum(info['freed_bytes'] for info in report.values()) / 1e9:.2f} GB. Now using: {usage}")
+                else:
+                    logger.debug(f"Storage sweep found nothing to delete. Using: {usage}")
+        except Exception as e:
+            logger.error(f"Storage sweep failed: {e}", exc_info=True)
+        await asyncio.sleep(DEFAULT_SWEEP_INTERVAL)
+
+def _fail_orphaned_jobs():
+    stale_before = time.time() - JOB_STALE_AFTER
+    for job_id, job_info in pipeline_jobs.items():
+        if job_info.get("status") in TERMINAL_JOB_STATUSES or job_info.get("heartbeat", 0) >= stale_before:
+            continue
+        try:
+            with pipeline_jobs.edit(job_id) as job_info:
+                if job_info.get("status") in TERMINAL_JOB_STATUSES or job_info.get("heartbeat", 0) >= stale_before:
+                    continue # Saved again since it was read
+                logger.warning(f"Pipeline Job {job_id}: Its worker {job_info.get('worker')} stopped reporting; marking it failed.")
+                job_info.update({
+                    "status": "failed",
+                    "error": "The server worker running this job stopped.",
+                    "message": "Pipeline processing was interrupted.",
+                    "resumable": has_checkpoint(PIPELINE_OUTPUT_DIR / job_id),
+                    "end_time": time.time()
+                })
+        except KeyError:
+            pass
+
+async def _job_status(job_id):
+    """A job's status as reported by the API; live progress comes from the job itself if it runs in this worker."""
     job_info = pipeline_jobs.get(job_id)
     if not job_info:
-        raise HTTPException(status_code=404, detail="Pipeline job not found.")
+        return None
+    job_info.pop("heartbeat", None) # Changes all the time, which would make every progress event look new
     # Optionally calculate duration if start/end times exist
     if "start_time" in job_info and "end_time" in job_info:
         job_info["duration_seconds"] = round(job_info["end_time"] - job_info["start_time"], 2)
+    if job_info.get("status") == "queued":
+        job_info["queue_position"] = job_scheduler.queue_position(job_id)
+    else:
+        job_info.pop("queue_position", None)
+    if job_info.get("status") == "running":
+        progress = await _read_job_progress(job_id)
+        if progress is not None:
+            job_info["progress"] = progress
     return job_info
 
+@app.get("/api/pipeline-status/{job_id}")
+async def get_pipeline_status(job_id: str):
+    job_info = await _job_status(job_id)
+    if not job_info:
+        raise HTTPException(status_code=404, detail="Pipeline job not found.")
+    return job_info
+
+@app.get("/api/pipeline-progress/{job_id}")
+async def stream_pipeline_progress(job_id: str, request: Request):
+    """
+    Server-Sent Events stream of a job's status, as returned by /api/pipeline-status, including
+    live progress (frames done, frames/sec, per-stage rates, ETA) while it runs. A "status"
+    event is sent whenever something changes; the stream ends once the job has finished.
+    """
+    if job_id not in pipeline_jobs:
+        raise HTTPException(status_code=404, detail="Pipeline job not found.")
+
+    async def events():
+        last_payload, last_sent = None, time.monotonic()
+        while not await request.is_disconnected():
+            job_info = await _job_status(job_id)
+            if job_info is None:
+                return
+            payload = json.dumps(job_info, default=str)
+            if payload != last_payload:
+                yield f"event: status\ndata: {payload}\n\n"
+                last_payload, last_sent = payload, time.monotonic()
+            elif time.monotonic() - last_sent > 15:
+                yield ": keep-alive\n\n" # Stops proxies from closing a quiet connection
+                last_sent = time.monotonic()
+            if job_info.get("status") in TERMINAL_JOB_STATUSES:
+                return
+            await asyncio.sleep(PIPELINE_PROGRESS_STREAM_INTERVAL)
+
+    # X-Accel-Buffering stops nginx-style proxies from holding events back
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.post("/api/cancel-pipeline/{job_id}")
+async def cancel_pipeline(job_id: str):
+    try:
+        with pipeline_jobs.edit(job_id) as job_info:
+            if job_info.get("status") in TERMINAL_JOB_STATUSES or job_info.get("cancel_requested"):
+                raise HTTPException(status_code=409, detail=f"Pipeline job is already {job_info.get('status')}.")
+            # The job may be in another worker's queue; that worker picks the request up from the store
+            job_info["cancel_requested"] = True
+            if job_info.get("status") == "queued":
+                # Never started, so there is no worker to report back
+                job_info.update({"status": "cancelled", "message": "Pipeline job was cancelled before it started.", "end_time": time.time()})
+            else:
+                job_info["message"] = "Cancellation requested."
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Pipeline job not found.")
+    job_scheduler.cancel(job_id)
+    logger.info(f"Pipeline job {job_id}: Cancellation requested.")
+    return {"job_id": job_id, "status": job_info["status"], "message": job_info["message"]}
+
+@app.get("/api/download-results/{job_id}")
+async def download_results(job_id: str, category: Optional[str] = None, start_frame: Optional[int] = None, stop_frame: Optional[int] = None):
+    """
+    Streams a job's results as a ZIP built on the fly, so no archive copy is kept on disk.
+    For manifest-mode jobs, accepted frames (optionally one category and/or frames
+    [start_frame, stop_frame)) are extracted from the source videos while streaming.
+    """
+    job_info = pipeline_jobs.get(job_id)
+    if not job_info:
+        raise HTTPException(status_code=404, detail="Pipeline job not found.")
+    if job_info.get("status") != "completed":
+        raise HTTPException(status_code=409, detail=f"Pipeline job is {job_info.get('status')}; no results to download.")
+    output_dir = PIPELINE_OUTPUT_DIR / job_id / "Accepted_images"
+    if not output_dir.is_dir():
+        raise HTTPException(status_code=404, detail="Pipeline output no longer exists.")
+    touch(PIPELINE_OUTPUT_DIR / job_id) # Recently downloaded results are evicted last
+
+    filename = job_info.get("output_filename") or f"Results_{job_id}.zip"
+    results_info = load_results_info(PIPELINE_OUTPUT_DIR / job_id)
+    if results_info and results_info.get("output_mode") == "manifest":
+        try:
+            archive = stream_manifest_results(PIPELINE_OUTPUT_DIR / job_id, output_dir, category, start_frame, stop_frame)
+        except FileNotFoundError as e:
+            raise HTTPException(status_code=410, detail=str(e))
+    else:
+        archive = stream_zip_from_directory(str(output_dir))
+    return StreamingResponse(
+        _timed_zip_stream(archive, job_id), # Sync generator, iterated in the threadpool
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@app.get("/api/pipeline-profile/{job_id}")
+async def download_pipeline_profile(job_id: str):
+    """
+    Streams the profile of a job started with "profile": true as a ZIP: profile.pstats,
+    profile.collapsed (for flamegraph.pl or speedscope), profile.txt and the per-process files.
+    """
+    if job_id not in pipeline_jobs:
+        raise HTTPException(status_code=404, detail="Pipeline job not found.")
+    profile_dir = PIPELINE_OUTPUT_DIR / job_id / PROFILE_DIRNAME
+    if not (profile_dir / PROFILE_STATS_FILENAME).exists():
+        raise HTTPException(status_code=404, detail="No profile was recorded for this job (yet).")
+    return StreamingResponse(
+        stream_zip_from_directory(str(profile_dir)),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="Profile_{job_id}.zip"'}
+    )
+
 @app.post("/api/update-pipeline")
 async def update_pipeline(pipeline_data: dict):
     """Update pipeline process selection"""
@@ -492,15 +1006,31 @@ async def update_pipeline(pipeline_data: dict):
     processes = pipeline_data.get('processes')
     
     if processes:
-        for process_name, value in processes.items():
-            if process_name in sessions[session_id]['pipeline_processes']:
-                sessions[session_id]['pipeline_processes'][process_name] = value
+        with sessions.edit(session_id) as session:
+            for process_name, value in processes.items():
+                if process_name in session['pipeline_processes']:
+                    session['pipeline_processes'][process_name] = value
         
         return {"success": True}
     
     return JSONResponse(status_code=400, content={"error": "Invalid processes data"})
 
 
+def _release_stored_file(path_str):
+    """
+    Deletes an uploaded file once no session refers to it (call after removing the caller's
+    own reference). Returns: True if the file was deleted.
+    """
+    if upload_store.is_shared(path_str):
+        for other_session in sessions.values():
+            if path_str in (other_session.get('dataset_path'), other_session.get('mirror_path')) or path_str in other_session.get('pattern_paths', []):
+                return False
+    path = Path(path_str)
+    if not path.exists():
+        return False
+    path.unlink()
+    return True
+
 @app.post("/api/delete/{file_type}")
 async def delete_file_endpoint(file_type: str, delete_data: dict):
     session_id = delete_data.get('session_id')
@@ -510,48 +1040,54 @@ async def delete_file_endpoint(file_type: str, delete_data: dict):
     if not session_id or session_id not in sessions:
         raise HTTPException(status_code=404, detail="Invalid session ID")
 
-    session = sessions[session_id]
-    deleted_items_count = 0
+    if file_type not in ("dataset", "mirror", "pattern"):
+        raise HTTPException(status_code=400, detail="Invalid file type for deletion.")
 
-    if file_type == "dataset" or file_type == "mirror":
-        path_key = f"{file_type}_path"
-        file_path_to_delete = session.get(path_key)
-        if file_path_to_delete and Path(file_path_to_delete).exists():
-            Path(file_path_to_delete).unlink()
-            logger.info(f"Deleted {file_type} file: {file_path_to_delete} for session {session_id}")
+    deleted_items_count = 0
+    released_paths = [] # Stored files the session no longer refers to, deleted once that is saved
+    with sessions.edit(session_id) as session:
+        if file_type == "dataset" or file_type == "mirror":
+            path_key = f"{file_type}_path"
+            if session.get(path_key):
+                released_paths.append(session[path_key])
+            session[path_key] = None
+            # Delete associated thumbnail
+            thumb_url = session["thumbnails"].get(file_type)
+            if thumb_url:
+                thumb_path = UPLOAD_DIR / Path(thumb_url).name
+                if thumb_path.exists():
+                    thumb_path.unlink()
+                session["thumbnails"][file_type] = None
+
+        elif file_type == "pattern":
+            # This deletes ALL pattern images for the session as per original high-level request
+            # "delete the contents of the patterns directory"
+            session_pattern_dir = PATTERN_DIR / session_id
+            if session_pattern_dir.exists():
+                for item in session_pattern_dir.iterdir(): # Delete files within the folder
+                     item.unlink()
+                     deleted_items_count +=1
+                # shutil.rmtree(session_pattern_dir) # To delete the folder itself
+                logger.info(f"Deleted all pattern images in {session_pattern_dir} for session {session_id}")
+
+            # Clear from session, along with any cached SIFT features for those files
+            invalidate_pattern_cache(session['pattern_paths'])
+            pattern_libraries.pop(session_id, None)
+            released_paths += [path for path in session['pattern_paths'] if upload_store.is_shared(path)]
+            session['pattern_paths'] = []
+            # Delete associated thumbnails
+            if isinstance(session["thumbnails"].get("pattern"), list):
+                for thumb_url in session["thumbnails"]["pattern"]:
+                    if thumb_url:
+                        thumb_path = UPLOAD_DIR / Path(thumb_url).name
+                        if thumb_path.exists():
+                            thumb_path.unlink()
+                session["thumbnails"]["pattern"] = []
+
+    for path in released_paths:
+        if _release_stored_file(path):
+            logger.info(f"Deleted {file_type} file: {path} for session {session_id}")
             deleted_items_count +=1
-        session[path_key] = None
-        # Delete associated thumbnail
-        thumb_url = session["thumbnails"].get(file_type)
-        if thumb_url:
-            thumb_path = UPLOAD_DIR / Path(thumb_url).name
-            if thumb_path.exists():
-                thumb_path.unlink()
-            session["thumbnails"][file_type] = None
-            
-    elif file_type == "pattern":
-        # This deletes ALL pattern images for the session as per original high-level request
-        # "delete the contents of the patterns directory"
-        session_pattern_dir = PATTERN_DIR / session_id
-        if session_pattern_dir.exists():
-            for item in session_pattern_dir.iterdir(): # Delete files within the folder
-                 item.unlink()
-                 deleted_items_count +=1
-            # shutil.rmtree(session_pattern_dir) # To delete the folder itself
-            logger.info(f"Deleted all pattern images in {session_pattern_dir} for session {session_id}")
-        
-        # Clear from session
-        session['pattern_paths'] = []
-        # Delete associated thumbnails
-        if isinstance(session["thumbnails"].get("pattern"), list):
-            for thumb_url in session["thumbnails"]["pattern"]:
-                if thumb_url:
-                    thumb_path = UPLOAD_DIR / Path(thumb_url).name
-                    if thumb_path.exists():
-                        thumb_path.unlink()
-            session["thumbnails"]["pattern"] = []
-    else:
-        raise HTTPException(status_code=400, detail="Invalid file type for deletion.")
 
     return {"success": True, "message": f"Deleted {deleted_items_count} item(s) of type '{file_type}'.", "updated_thumbnails": session["thumbnails"]}
 
@@ -563,27 +1099,72 @@ async def get_session_data(session_id: str):
     # No specific thumbnail regeneration here, should be up-to-date
     return {"session_data": sessions[session_id]}
 
+def _metrics_report(snapshot):
+    """Metrics API view of a snapshot: headline counts for the metrics page plus per-operation latencies."""
+    summary = summarize_metrics(snapshot)
+    return {
+        "processedFrames": summary["counters"].get("frames_processed", 0),
+        "acceptedFrames": summary["counters"].get("frames_accepted", 0),
+        "detectedObjects": summary["rejections"].get("Model Object Detection", 0), # Frames rejected for man-made objects
+        "patternMatches": summary["counters"].get("pattern_matches", 0),
+        "solidColorFrames": summary["rejections"].get("Solid Color Detection", 0),
+        "operations": summary["operations"],
+        "rejections": summary["rejections"],
+    }
+
 @app.get("/api/metrics/{session_id}")
 async def get_metrics(session_id: str):
-    """Get metrics for a session"""
+    """
+    Per-operation counts and latencies (decode, solid color check, LLM call, SIFT extract/match,
+    image write, zip) for a session: totals over its finished jobs, and each job separately.
+    Running jobs are listed with their live progress.
+    """
     if session_id not in sessions:
         return JSONResponse(status_code=400, content={"error": "Invalid session ID"})
-    
-    # TODO: get metric data and put it here
-    # In a real app, these would come from processing results
-    # For now, we'll return mock data
-    metrics = {
-        "processedFrames": 120,
-        "detectedObjects": 45,
-        "patternMatches": 30,
-        "solidColorFrames": 15
-    }
-    
+
+    session_jobs = {job_id: job for job_id, job in pipeline_jobs.items() if job.get("session_id") == session_id}
+    session_metrics = {job_id: job_metrics.get(job_id) for job_id in session_jobs}
+    jobs = {}
+    for job_id, job in session_jobs.items():
+        if session_metrics[job_id] is not None:
+            jobs[job_id] = _metrics_report(session_metrics[job_id])
+        elif job.get("status") == "running":
+            jobs[job_id] = {"running": True, "progress": await _read_job_progress(job_id) or job.get("progress")}
     return {
         "success": True,
-        "metrics": metrics
+        "metrics": _metrics_report(merge_metrics(session_metrics.values())),
+        "jobs": jobs,
     }
 
+@app.get("/api/job-metrics/{job_id}")
+async def get_job_metrics(job_id: str):
+    """Metrics for one job; while it runs, the live numbers it has published so far."""
+    job_info = pipeline_jobs.get(job_id)
+    if job_info is None:
+        raise HTTPException(status_code=404, detail="Pipeline job not found.")
+    snapshot = job_metrics.get(job_id)
+    if snapshot is not None:
+        return {"job_id": job_id, "status": job_info.get("status"), "metrics": _metrics_report(snapshot)}
+    progress = await _read_job_progress(job_id) or job_info.get("progress")
+    return {"job_id": job_id, "status": job_info.get("status"), "metrics": progress["metrics"] if progress else None}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """
+    Prometheus text exposition of the server's pipeline metrics: latency histograms and
+    error counts per operation over all finished jobs and downloads, frame counters, and
+    the number of jobs in each state.
+    """
+    lines = [format_prometheus(server_metrics.snapshot())]
+    lines.append("# HELP pradd_pipeline_jobs Pipeline jobs known to this server, by status.")
+    lines.append("# TYPE pradd_pipeline_jobs gauge")
+    statuses = {}
+    for job in pipeline_jobs.values():
+        statuses[job.get("status")] = statuses.get(job.get("status"), 0) + 1
+    for status, count in sorted(statuses.items(), key=lambda item: str(item[0])):
+        lines.append(f'pradd_pipeline_jobs{{status="{status}"}} {count}')
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
 @app.post("/api/update-pipeline-config") # Renamed for clarity
 async def update_pipeline_config_endpoint(pipeline_config_data: dict):
     session_id = pipeline_config_data.get('session_id')
@@ -594,12 +1175,13 @@ async def update_pipeline_config_endpoint(pipeline_config_data: dict):
     if not isinstance(processes_config, dict):
         raise HTTPException(status_code=400, detail="Invalid processes_config data format.")
 
-    for process_name, is_active in processes_config.items():
-        if process_name in sessions[session_id]['pipeline_processes']:
-            sessions[session_id]['pipeline_processes'][process_name] = bool(is_active)
+    with sessions.edit(session_id) as session:
+        for process_name, is_active in processes_config.items():
+            if process_name in session['pipeline_processes']:
+                session['pipeline_processes'][process_name] = bool(is_active)
     
     logger.info(f"Session {session_id}: Updated pipeline processes configuration.")
-    return {"success": True, "updated_config": sessions[session_id]['pipeline_processes']}
+    return {"success": True, "updated_config": session['pipeline_processes']}
 
 
 @app.post("/api/restore-defaults")
@@ -608,24 +1190,20 @@ async def restore_defaults_endpoint(data: dict):
     if not session_id or session_id not in sessions:
         raise HTTPException(status_code=404, detail="Invalid session ID")
 
-    sessions[session_id]['thres_params'] = {
-        'Pattern Thresholding Value': DEFAULT_PATTERN_THRES,
-        'Solid Color Detection': DEFAULT_SOLID_THRES,
-        'Object Detection Prompt': DEFAULT_OBJ_PROMPT,
-        'Black Threshold BW': DEFAULT_BLACK_THRES,
-        'White Threshold BW': DEFAULT_WHITE_THRES,
-    }
-    sessions[session_id]['pipeline_processes'] = {
-        'Pattern Thresholding': True, 'Model Object Detection': True, 'Solid Color Detection': True
-    }
+    with sessions.edit(session_id) as session:
+        session['thres_params'] = default_thres_params()
+        session['pipeline_processes'] = default_pipeline_processes()
     logger.info(f"Session {session_id}: Restored to default parameters and pipeline config.")
-    return {"success": True, "thres_params": sessions[session_id]['thres_params'], "pipeline_processes": sessions[session_id]['pipeline_processes']}
+    return {"success": True, "thres_params": session['thres_params'], "pipeline_processes": session['pipeline_processes']}
 
 
 if __name__ == "__main__":
     import uvicorn
     host = os.getenv("BACKEND_HOST", "127.0.0.1")
     port = int(os.getenv("BACKEND_PORT", 8000)) # Common port for FastAPI dev
-    logger.info(f"Starting server on {host}:{port}")
-    uvicorn.run(app, host=host, port=port)
+    if BACKEND_WORKERS > 1 and isinstance(state_store, MemoryStateStore):
+        raise SystemExit("BACKEND_WORKERS > 1 needs STATE_STORE=sqlite, so every worker sees the same sessions and jobs.")
+    logger.info(f"Starting server on {host}:{port} with {BACKEND_WORKERS} worker(s)")
+    # Several workers need the app as an import string; each imports it in its own process
+    uvicorn.run("main:app" if BACKEND_WORKERS > 1 else app, host=host, port=port, workers=BACKEND_WORKERS)
 
@@ -1,17 +1,98 @@
-import ollama
 import cv2
 import numpy as np
-import re
 import os
 import zipfile
 import io
 import shutil
 import time
 import logging
+import json
+from collections import deque
+from contextlib import ExitStack
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+from .patterns import PatternLibrary, get_sift, invalidate_pattern_cache
+from .llm import ERROR_RESPONSES, OllamaDetector, get_default_detector
+from .verdicts import prompt_key
+from .features import FeatureStore
+from .video import VideoFrameSource, decode_profile, probe_gray_decode
+from .metrics import METRICS_FILENAME, OPERATIONS, PipelineMetrics, format_prometheus, merge_metrics, pipeline_metrics, summarize_metrics
+from .progress import ProgressReporter, start_progress, summarize_progress
+from .checkpoint import DEFAULT_CHECKPOINT_INTERVAL, JobCheckpoint, discard_frames_from, has_checkpoint, inputs_fingerprint, video_signature
+from .profiling import PROFILE_DIRNAME, PipelineProfiler, combine_profiles, profile_call, profile_job
+from .ingest import GrowingFileStream, is_growing, streaming_ingest_supported, wait_until_complete
+from .writer import FrameWriter, frame_extension, resolve_output_formats
+from .archive import iter_directory_entries, stream_zip, stream_zip_from_directory, zip_compress_type
+from .manifest import (check_manifest_format, extract_manifest_frames, load_results_info, manifest_row, read_manifest,
+                       stream_manifest_results, write_manifest, write_results_info)
+from .stages import DEFAULT_STAGE_COSTS, FramePair, PipelineStage, StageExecutor, merge_stage_timings
+from .sampling import SAMPLING_MODES, FrameSampler
 
 logger = logging.getLogger(__name__)
 
+class PipelineCancelled(Exception):
+    """Raised by process_video_frames when its cancel event is set."""
+
+def _to_gray_uint8(image_cv):
+    gray_image = image_cv
+    if len(image_cv.shape) == 3:
+        gray_image = cv2.cvtColor(image_cv, cv2.COLOR_BGR2GRAY)
+    if gray_image.dtype != np.uint8:
+        # Thresholds live in 0-255, so out-of-range values still land in the black/white bins
+        gray_image = np.clip(gray_image, 0, 255).astype(np.uint8)
+    return gray_image
+
+def gray_histogram(image_cv):
+    """
+    256-bin grayscale histogram of an image (BGR or single channel).
+    Returns: numpy.ndarray of shape (256,) with int64 pixel counts.
+    """
+    gray_image = _to_gray_uint8(image_cv)
+    return cv2.calcHist([gray_image], [0], None, [256], [0, 256]).ravel().astype(np.int64)
+
+def gray_histograms(frames):
+    """
+    Histograms for a batch of frames in one pass.
+    Args:
+        frames (numpy.ndarray or list): (N, H, W) grayscale stack, (N, H, W, 3) BGR stack, or a list of frames.
+    Returns:
+        numpy.ndarray: (N, 256) int64 pixel counts.
+    """
+    if isinstance(frames, np.ndarray) and frames.ndim == 3 and frames.dtype == np.uint8:
+        gray_stack = frames
+    else:
+        gray_stack = np.stack([_to_gray_uint8(frame) for frame in frames])
+    num_frames = len(gray_stack)
+    # Offset each frame's values into its own 256-bin block so one bincount covers the batch
+    offsets = (np.arange(num_frames, dtype=np.int64) * 256).reshape(-1, 1)
+    binned = gray_stack.reshape(num_frames, -1).astype(np.int64) + offsets
+    return np.bincount(binned.ravel(), minlength=num_frames * 256).reshape(num_frames, 256)
+
+def black_white_fractions(histogram, black_threshold_val, white_threshold_val):
+    """
+    Fractions of pixels <= black_threshold_val and >= white_threshold_val, from a 256-bin
+    grayscale histogram (or an (N, 256) batch, giving arrays of fractions).
+    """
+    histogram = np.asarray(histogram)
+    total_pixels = histogram.sum(axis=-1)
+    black_pixels = histogram[..., :int(black_threshold_val) + 1].sum(axis=-1)
+    white_pixels = histogram[..., max(int(np.ceil(white_threshold_val)), 0):].sum(axis=-1)
+    return black_pixels / total_pixels, white_pixels / total_pixels
+
+def black_white_fraction_table(histograms):
+    """
+    Black/white fractions for every possible threshold at once, via cumulative sums, so
+    threshold previews and sweeps are array lookups.
+    Returns: (black_fraction, white_fraction) arrays shaped like histograms, where
+        black_fraction[..., t] is the fraction of pixels <= t and white_fraction[..., t] of pixels >= t.
+    """
+    histograms = np.asarray(histograms, dtype=np.int64)
+    cumulative = np.cumsum(histograms, axis=-1)
+    total_pixels = cumulative[..., -1:]
+    black_fraction = cumulative / total_pixels
+    white_fraction = (total_pixels - cumulative + histograms) / total_pixels
+    return black_fraction, white_fraction
+
 def is_mostly_black_or_white(image_cv, black_threshold_val=30, white_threshold_val=225, percentage_threshold=0.60):
     """
     Check if an image is mostly black or white.
@@ -27,131 +108,111 @@ def is_mostly_black_or_white(image_cv, black_threshold_val=30, white_threshold_v
         logger.error("is_mostly_black_or_white: Input image is None.")
         return False # Or raise error
 
-    gray_image = image_cv
-    if len(image_cv.shape) == 3:
-        gray_image = cv2.cvtColor(image_cv, cv2.COLOR_BGR2GRAY)
-
-    total_pixels = gray_image.size
-    if total_pixels == 0:
+    if image_cv.size == 0:
         logger.error("is_mostly_black_or_white: Image has zero pixels.")
         return False
 
-    black_pixels = np.sum(gray_image <= black_threshold_val)
-    white_pixels = np.sum(gray_image >= white_threshold_val)
+    black_percentage, white_percentage = black_white_fractions(gray_histogram(image_cv), black_threshold_val, white_threshold_val)
+    return black_percentage >= percentage_threshold or white_percentage >= percentage_threshold
 
-    black_percentage = black_pixels / total_pixels
-    white_percentage = white_pixels / total_pixels
+def mostly_black_or_white_batch(frames, black_threshold_val=30, white_threshold_val=225, percentage_threshold=0.60):
+    """
+    Vectorized is_mostly_black_or_white for a batch of frames (see gray_histograms for accepted shapes).
+    Returns: numpy.ndarray of bools, one per frame.
+    """
+    black_percentage, white_percentage = black_white_fractions(gray_histograms(frames), black_threshold_val, white_threshold_val)
+    return (black_percentage >= percentage_threshold) | (white_percentage >= percentage_threshold)
 
-    return black_percentage >= percentage_threshold or white_percentage >= percentage_threshold
 
-def modelObjectDetection(frame_cv, model_prompt_content):
+def modelObjectDetection(frame_cv, model_prompt_content, detector: OllamaDetector = None):
     """
     Detect man-made objects in an image using a pre-trained model from Ollama.
     Args:
         frame_cv (numpy.ndarray): Image data (frame).
         model_prompt_content (str): The prompt for the LLM.
+        detector (OllamaDetector): Client wrapper to use; defaults to a shared module-level one.
     Returns:
         tuple: (bool indicating if man-made objects detected, str response from model)
     """
-    if frame_cv is None:
-        logger.error("modelObjectDetection: Input frame is None.")
-        return True, "Error: Input frame was None." # Default to objects_detected = True to avoid filtering good images due to error
+    return (detector or get_default_detector()).detect(frame_cv, model_prompt_content)
 
-    objects_detected = True  # Default assumption
-    model_response_content = "Error in model processing."
 
-    try:
-        _, buffer = cv2.imencode('.jpg', frame_cv)
-        image_bytes = buffer.tobytes()
-
-        res = ollama.chat(
-            model="llava:34b", # Ensure this model is available
-            messages=[
-                {
-                    'role': 'user',
-                    'content': model_prompt_content,
-                    'images': [image_bytes]
-                }
-            ]
-        )
-        model_response_content = res['message']['content']
-        if re.search(r'False', model_response_content, re.IGNORECASE): # More robust check
-            objects_detected = False
-    except Exception as e:
-        logger.error(f"Error in modelObjectDetection with Ollama: {e}")
-        # Keep objects_detected = True to be safe, or handle error differently
-    return objects_detected, model_response_content
-
-
-def patternThresholding(test_image_cv, loaded_pattern_images_data, threshold_match_val):
+def extract_pattern_match_distances(test_image_cv, pattern_library):
     """
-    Compare an image against multiple patterns using SIFT features.
-    Args:
-        test_image_cv (numpy.ndarray): Grayscale image to be matched.
-        loaded_pattern_images_data (list): List of tuples (pattern_cv_gray, pattern_name).
-        threshold_match_val (int): SIFT match distance threshold (lower is stricter, but it's used differently here).
-    Returns:
-        str: Name of the best matching pattern or None.
+    Runs SIFT on a frame and matches it against every pattern in the library.
+    Returns: (pattern_ids, distances) arrays, or None if no descriptors could be extracted.
     """
     if test_image_cv is None:
         logger.error("patternThresholding: Input test_image is None.")
         return None
-    
+
     test_img_gray = test_image_cv
     if len(test_image_cv.shape) == 3:
          test_img_gray = cv2.cvtColor(test_image_cv, cv2.COLOR_BGR2GRAY)
 
-
-    sift = cv2.SIFT_create()
     try:
-        test_keypoints, test_descriptors = sift.detectAndCompute(test_img_gray, None)
+        with pipeline_metrics.timer("sift_extract"):
+            test_keypoints, test_descriptors = get_sift().detectAndCompute(test_img_gray, None)
     except cv2.error as e:
         logger.error(f"SIFT error on test image: {e}")
         return None
 
-
     if test_descriptors is None or test_keypoints is None or len(test_keypoints) == 0 :
         logger.warning("No SIFT descriptors found for test image.")
         return None
 
-    bf = cv2.BFMatcher(cv2.NORM_L2, crossCheck=True)
-    best_match_name = None
-    max_good_matches = 0 # want the pattern with the most "good" matches
-
-    for pattern_img_gray, pattern_name in loaded_pattern_images_data:
-        if pattern_img_gray is None:
-            logger.warning(f"Skipping None pattern image: {pattern_name}")
-            continue
-        try:
-            pattern_keypoints, pattern_descriptors = sift.detectAndCompute(pattern_img_gray, None)
-        except cv2.error as e:
-            logger.error(f"SIFT error on pattern image {pattern_name}: {e}")
-            continue
-
-
-        if pattern_descriptors is None or pattern_keypoints is None or len(pattern_keypoints) == 0:
-            logger.warning(f"No SIFT descriptors found for pattern: {pattern_name}")
-            continue
-
-        try:
-            matches = bf.match(test_descriptors, pattern_descriptors)
-            matches = sorted(matches, key=lambda x: x.distance)
-            # `threshold_match_val` is the distance cutoff for a match to be "good"
-            good_matches = [m for m in matches if m.distance < threshold_match_val]
-            num_good_matches = len(good_matches)
-
-            if num_good_matches > max_good_matches:
-                max_good_matches = num_good_matches
-                best_match_name = pattern_name
-        except cv2.error as e:
-            logger.error(f"Error during SIFT matching for pattern {pattern_name}: {e}")
-            continue
-            
+    try:
+        with pipeline_metrics.timer("sift_match"):
+            return pattern_library.match_distances(test_descriptors)
+    except cv2.error as e:
+        logger.error(f"Error during SIFT matching against pattern library: {e}")
+        return None
+
+
+def best_pattern_match_with_score(pattern_library, pattern_ids, distances, threshold_match_val):
+    """
+    Picks the pattern with the most matches closer than threshold_match_val.
+    Returns: (str name of the best matching pattern or "No_Pattern_Match", int number of good matches for the closest pattern)
+    """
+    good_match_counts = np.bincount(pattern_ids[distances < threshold_match_val], minlength=len(pattern_library))
+    if len(good_match_counts) == 0:
+        return "No_Pattern_Match", 0
+
+    # want the pattern with the most "good" matches
+    best_index = int(np.argmax(good_match_counts))
+    max_good_matches = int(good_match_counts[best_index])
+
     # what's a "match"? is it if any pattern has at least X good_matches?
     # `THRESHOLD_PATTERN_MATCH` is distance threshold
     # assume `max_good_matches > 1` is good enough
+    if max_good_matches > 1:
+        return pattern_library.patterns[best_index].name, max_good_matches
+    return "No_Pattern_Match", max_good_matches
+
 
-    return best_match_name if max_good_matches > 1 else "No_Pattern_Match"
+def best_pattern_match(pattern_library, pattern_ids, distances, threshold_match_val):
+    """Returns: str name of the best matching pattern, or "No_Pattern_Match"."""
+    return best_pattern_match_with_score(pattern_library, pattern_ids, distances, threshold_match_val)[0]
+
+
+def patternThresholding(test_image_cv, pattern_library, threshold_match_val):
+    """
+    Compare an image against multiple patterns using SIFT features.
+    Args:
+        test_image_cv (numpy.ndarray): Grayscale image to be matched.
+        pattern_library (PatternLibrary): Precomputed pattern features. A list of tuples
+            (pattern_cv_gray, pattern_name) is also accepted and extracted on the fly.
+        threshold_match_val (int): SIFT match distance threshold (lower is stricter, but it's used differently here).
+    Returns:
+        str: Name of the best matching pattern or None.
+    """
+    if not isinstance(pattern_library, PatternLibrary):
+        pattern_library = PatternLibrary.from_images(pattern_library)
+
+    match_distances = extract_pattern_match_distances(test_image_cv, pattern_library)
+    if match_distances is None:
+        return None
+    return best_pattern_match(pattern_library, *match_distances, threshold_match_val)
 
 
 def sort_into_folders(output_base_dir, name_folder, raw_image_cv, raw_image_name, realsense_image_cv, realsense_image_name):
@@ -182,19 +243,147 @@ def create_zip_from_directory(directory_path_str, job_id):
     
     Path("downloads").mkdir(exist_ok=True)
 
-    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-        for root, _, files in os.walk(dir_path):
-            for file in files:
-                file_path = Path(root) / file
-                arcname = file_path.relative_to(dir_path)
-                zipf.write(file_path, arcname)
+    with pipeline_metrics.timer("zip"), zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
+        for file_path, arcname in iter_directory_entries(dir_path):
+            zipf.write(file_path, arcname, compress_type=zip_compress_type(arcname))
     logger.info(f"ZIP file created at: {zip_path}")
     return zip_filename # Return only the name for URL construction
 
 
+class SolidColorStage(PipelineStage):
+    """Rejects RealSense frames that are mostly black or white."""
+    name = 'Solid Color Detection'
+
+    def __init__(self, bw_filter_params):
+        self.bw_filter_params = bw_filter_params
+        self.cost = DEFAULT_STAGE_COSTS[self.name]
+
+    def extract(self, pair):
+        # A 256-bin histogram answers the check for any black/white thresholds
+        frame = pair.realsense_analysis_cv
+        if frame is None:
+            logger.error("is_mostly_black_or_white: Input image is None.")
+            return None
+        with pipeline_metrics.timer("solid_color"):
+            return gray_histogram(frame)
+
+    def should_store(self, features):
+        return features is not None
+
+    def decide(self, pair, features):
+        if features is None or features.sum() == 0:
+            return None
+        black_percentage, white_percentage = black_white_fractions(features,
+                                                                   self.bw_filter_params['black_thresh'],
+                                                                   self.bw_filter_params['white_thresh'])
+        percentage_thresh = self.bw_filter_params['percentage_thresh']
+        if black_percentage >= percentage_thresh or white_percentage >= percentage_thresh:
+            logger.info(f"{pair.realsense_frame_name}: Rejected by solid color check.")
+            return "Rejected: Mostly black or white"
+        return None
+
+
+class ObjectDetectionStage(PipelineStage):
+    """Rejects raw frames in which the LLM reports man-made objects."""
+    name = 'Model Object Detection'
+
+    def __init__(self, obj_detect_prompt, detector: OllamaDetector = None, concurrent=True):
+        self.obj_detect_prompt = obj_detect_prompt
+        self.detector = detector or get_default_detector()
+        self.concurrent = concurrent and self.detector.max_in_flight > 1
+        self.cost = DEFAULT_STAGE_COSTS[self.name]
+        self.feature_variant = prompt_key(self.detector.model, obj_detect_prompt)
+
+    def extract(self, pair):
+        return modelObjectDetection(pair.raw_frame_cv, self.obj_detect_prompt, self.detector)
+
+    def submit(self, pair):
+        if not self.concurrent:
+            return None
+        return self.detector.submit(pair.raw_frame_cv, self.obj_detect_prompt)
+
+    def should_store(self, features):
+        return features[1] not in ERROR_RESPONSES
+
+    def decide(self, pair, features):
+        objects_detected, model_reason = features
+        if objects_detected: # True if man-made objects are detected
+            logger.info(f"{pair.raw_frame_name}: Rejected by object detection. Reason: {model_reason}")
+            return f"Rejected: Man-made objects detected ({model_reason[:50]}...)"
+        return None
+
+
+class PatternMatchingStage(PipelineStage):
+    """
+    Categorizes RealSense frames by their best-matching pattern. With reject_no_match,
+    frames that match no pattern are rejected instead of filed under No_Pattern_Match,
+    which also lets the stage run before more expensive ones.
+    """
+    name = 'Pattern Thresholding'
+
+    def __init__(self, pattern_library, pattern_match_sift_distance_thresh, reject_no_match=False):
+        self.pattern_library = pattern_library
+        self.pattern_match_sift_distance_thresh = pattern_match_sift_distance_thresh
+        self.rejects = reject_no_match
+        self.cost = DEFAULT_STAGE_COSTS[self.name]
+        self.feature_variant = pattern_library.fingerprint if pattern_library else ""
+
+    def extract(self, pair):
+        # Raw per-pattern match distances; the distance threshold is applied in decide()
+        if not self.pattern_library:
+            return None
+        match_distances = extract_pattern_match_distances(pair.realsense_analysis_cv, self.pattern_library)
+        if match_distances is None:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+        return match_distances
+
+    def should_store(self, features):
+        return features is not None
+
+    def decide(self, pair, features):
+        if not self.pattern_library:
+            logger.warning(f"{pair.realsense_frame_name}: Pattern matching is ON but no pattern images were loaded/provided.")
+            pair.category = "No_Patterns_Available"
+            return None
+
+        best_match_name, pair.match_score = best_pattern_match_with_score(self.pattern_library, *features, self.pattern_match_sift_distance_thresh)
+        if best_match_name != "No_Pattern_Match":
+            pair.category = pair.matched_pattern = best_match_name
+            logger.info(f"{pair.realsense_frame_name}: Matched pattern '{best_match_name}'.")
+            return None
+
+        pair.category = "No_Pattern_Match"
+        logger.info(f"{pair.realsense_frame_name}: No suitable pattern match found.")
+        if self.rejects:
+            return "Rejected: No pattern match"
+        return None
+
+
+def build_stages(
+    pattern_library,
+    run_solid_color_check: bool,
+    run_object_detection: bool,
+    run_pattern_matching: bool,
+    bw_filter_params: dict,
+    obj_detect_prompt: str,
+    pattern_match_sift_distance_thresh: int,
+    detector: OllamaDetector = None,
+    reject_no_pattern_match: bool = False
+):
+    """Creates the active pipeline stages from the per-job frame options."""
+    stages = []
+    if run_solid_color_check:
+        stages.append(SolidColorStage(bw_filter_params))
+    if run_object_detection:
+        stages.append(ObjectDetectionStage(obj_detect_prompt, detector))
+    if run_pattern_matching:
+        stages.append(PatternMatchingStage(pattern_library, pattern_match_sift_distance_thresh, reject_no_pattern_match))
+    return stages
+
+
 def load_and_process_frame_pair(
     raw_frame_cv, raw_frame_name, realsense_frame_cv, realsense_frame_name,
-    loaded_pattern_images_data, # List of (pattern_cv_gray, pattern_name)
+    pattern_library, # PatternLibrary with precomputed pattern descriptors
     output_base_dir_for_accepted,
     # Configurable parameters
     run_solid_color_check: bool,
@@ -203,49 +392,240 @@ def load_and_process_frame_pair(
     # Thresholds and prompts
     bw_filter_params: dict, # {'black_thresh', 'white_thresh', 'percentage_thresh'}
     obj_detect_prompt: str,
-    pattern_match_sift_distance_thresh: int
+    pattern_match_sift_distance_thresh: int,
+    detector: OllamaDetector = None,
+    reject_no_pattern_match: bool = False,
+    stage_costs: dict = None # Optional {stage name: seconds per frame} overrides for stage ordering
 ):
     """
     Processes a single pair of raw and realsense frames based on active pipeline stages.
+    Stages run cheapest-first and stop at the first rejection.
     Returns: (bool_accepted, reason_or_category_name)
     """
-    # 1. Solid Color Check (on RealSense frame)
-    if run_solid_color_check:
-        if is_mostly_black_or_white(realsense_frame_cv,
-                                    bw_filter_params['black_thresh'],
-                                    bw_filter_params['white_thresh'],
-                                    bw_filter_params['percentage_thresh']):
-            logger.info(f"{realsense_frame_name}: Rejected by solid color check.")
-            return False, "Rejected: Mostly black or white"
-
-    # 2. Model Object Detection (on Raw frame)
-    if run_object_detection:
-        objects_detected, model_reason = modelObjectDetection(raw_frame_cv, obj_detect_prompt)
-        if objects_detected: # True if man-made objects are detected
-            logger.info(f"{raw_frame_name}: Rejected by object detection. Reason: {model_reason}")
-            return False, f"Rejected: Man-made objects detected ({model_reason[:50]}...)"
+    executor = StageExecutor(build_stages(
+        pattern_library, run_solid_color_check, run_object_detection, run_pattern_matching,
+        bw_filter_params, obj_detect_prompt, pattern_match_sift_distance_thresh, detector, reject_no_pattern_match
+    ), stage_costs)
+    pair = executor.process(FramePair(None, raw_frame_cv, raw_frame_name, realsense_frame_cv, realsense_frame_name))
+    return _finish_frame_pair(pair, output_base_dir_for_accepted)
 
-    # 3. Pattern Matching (on RealSense frame)
-    classification_name = "Uncategorized" # Default if pattern matching is off or no match
-    if run_pattern_matching:
-        if not loaded_pattern_images_data:
-            logger.warning(f"{realsense_frame_name}: Pattern matching is ON but no pattern images were loaded/provided.")
-            classification_name = "No_Patterns_Available"
-        else:
-            best_match_name = patternThresholding(realsense_frame_cv, loaded_pattern_images_data, pattern_match_sift_distance_thresh)
-            if best_match_name:
-                classification_name = best_match_name
-                logger.info(f"{realsense_frame_name}: Matched pattern '{best_match_name}'.")
-            else: # No pattern met criteria
-                classification_name = "No_Pattern_Match"
-                logger.info(f"{realsense_frame_name}: No suitable pattern match found.")
-                # Depending on requirements, "No_Pattern_Match" might be a rejection or a category.
-                # For now, let's assume it's a category. If it's a rejection:
-                # return False, "Rejected: No pattern match"
 
+def _finish_frame_pair(pair, output_base_dir_for_accepted, writer: FrameWriter = None):
+    if not pair.accepted:
+        return False, pair.rejection_reason
     # If all checks passed (or were skipped), sort the image
-    sort_into_folders(output_base_dir_for_accepted, classification_name, raw_frame_cv, raw_frame_name, realsense_frame_cv, realsense_frame_name)
-    return True, classification_name
+    if writer is not None:
+        writer.write(pair.category, pair.raw_frame_cv, pair.raw_frame_name, pair.realsense_frame_cv, pair.realsense_frame_name)
+    else:
+        sort_into_folders(output_base_dir_for_accepted, pair.category, pair.raw_frame_cv, pair.raw_frame_name, pair.realsense_frame_cv, pair.realsense_frame_name)
+    return True, pair.category
+
+
+def split_frame_ranges(total_frames, frame_workers, ranges_per_worker=4, align=1):
+    """
+    Splits [0, total_frames) into contiguous (start, stop) ranges for parallel processing.
+    The last range has stop=None so it reads to the real end of the videos, since container
+    frame counts can be off. Returns a single (0, None) range when running serially.
+    Ranges start at multiples of align, e.g. the sampling stride, so none starts mid-segment.
+    """
+    if frame_workers <= 1 or total_frames <= 0:
+        return [(0, None)]
+    num_ranges = min(total_frames, frame_workers * ranges_per_worker)
+    bounds = sorted({align * round(i * total_frames / num_ranges / align) for i in range(num_ranges)} - {total_frames}) + [total_frames]
+    if len(bounds) < 2:
+        return [(0, None)]
+    ranges = [(bounds[i], bounds[i + 1]) for i in range(len(bounds) - 1)]
+    ranges[-1] = (ranges[-1][0], None)
+    return ranges
+
+
+def _init_frame_worker():
+    # Each worker already owns a core; stop OpenCV from spawning its own thread pool on top
+    cv2.setNumThreads(1)
+
+
+def _process_frame_range(job_id, path_to_raw_video, path_to_realsense_video, pattern_library,
+                         output_base_dir, frame_options, cancel_event, feature_store, realsense_decode,
+                         writer_options, output_mode, progress, checkpoint, start_frame, stop_frame):
+    """
+    Runs the pipeline stages over frames [start_frame, stop_frame) of both videos.
+    stop_frame=None processes until either video ends. With frame_options['sampling'] (see
+    FrameSampler) only each segment's first frame runs the stages and the rest of the segment
+    takes its verdict. In "manifest" output mode accepted frames are recorded instead of written. Progress is published to `progress` (see
+    ProgressReporter) if given. With a JobCheckpoint, finished work is checkpointed every
+    checkpoint.interval seconds and a range interrupted earlier picks up from its last checkpoint.
+    Returns: (number_of_pairs_iterated, removed_images_log_entries, stage_timings, manifest_rows, metrics_snapshot)
+    """
+    pipeline_metrics.snapshot(reset=True) # Only count this range's work
+    reporter = ProgressReporter(progress, start_frame)
+    range_checkpoint = checkpoint.for_range(start_frame, stop_frame) if checkpoint is not None else None
+    resumed = range_checkpoint.load() if range_checkpoint is not None else None
+    if resumed is not None:
+        pipeline_metrics.merge(resumed['metrics'] or {})
+        if resumed['done']:
+            logger.info(f"Job {job_id}: Frames {start_frame}-{resumed['next_frame']} were finished before; reusing their results.")
+            reporter.update(resumed['next_frame'] - start_frame, resumed['stage_timings'], pipeline_metrics, force=True)
+            return (resumed['next_frame'] - start_frame, resumed['removed'], resumed['stage_timings'], resumed['manifest_rows'],
+                    pipeline_metrics.snapshot(reset=True))
+        logger.info(f"Job {job_id}: Resuming frames {start_frame}-{stop_frame if stop_frame is not None else 'end'} at frame {resumed['next_frame']}.")
+        # Anything written after the last checkpoint is redone
+        discard_frames_from(output_base_dir, resumed['next_frame'], stop_frame)
+    first_frame = resumed['next_frame'] if resumed is not None else start_frame
+
+    cap_raw = VideoFrameSource(path_to_raw_video, first_frame)
+    try:
+        cap_realsense = VideoFrameSource(path_to_realsense_video, first_frame, **realsense_decode)
+    except IOError:
+        cap_raw.release()
+        raise
+
+    frame_options = dict(frame_options)
+    stage_costs = frame_options.pop('stage_costs', None)
+    sampler = FrameSampler(**(frame_options.pop('sampling', None) or {}))
+    executor = StageExecutor(build_stages(pattern_library, **frame_options), stage_costs, feature_store)
+    for name, timing in (resumed['stage_timings'] if resumed is not None else {}).items():
+        executor.timings.setdefault(name, timing).update(timing)
+    # Frames whose stages are in flight (e.g. LLM requests) wait in this window and are
+    # finished strictly in frame order, so the removal log stays ordered
+    detector = frame_options.get('detector') or get_default_detector()
+    lookahead = detector.max_in_flight if frame_options['run_object_detection'] else 0
+    pending = deque()
+    # Accepted frames are encoded and written on background threads
+    writer = FrameWriter(output_base_dir, **writer_options) if output_mode == "images" else None
+    image_format, depth_format, _ = resolve_output_formats(writer_options)
+    manifest_rows = list(resumed['manifest_rows']) if resumed is not None else []
+
+    frame_count = first_frame
+    removed_images_log_data = list(resumed['removed']) if resumed is not None else []
+
+    def finish_oldest():
+        pair = pending.popleft()
+        if pair.representative is not None:
+            pair.adopt_verdict() # Its representative was finished before it
+            pair.representative = None
+            pipeline_metrics.count("frames_propagated")
+        else:
+            executor.finish(pair)
+        pipeline_metrics.count("frames_processed")
+        if pair.accepted:
+            pipeline_metrics.count("frames_accepted")
+            if pair.matched_pattern:
+                pipeline_metrics.count("pattern_matches")
+        else:
+            pipeline_metrics.count_rejection(executor.stages[pair.next_stage - 1].name) # The stage that just ran rejected it
+        if writer is None:
+            manifest_rows.append(manifest_row(pair))
+            accepted, reason_or_category = pair.accepted, pair.rejection_reason
+        else:
+            accepted, reason_or_category = _finish_frame_pair(pair, output_base_dir, writer)
+        if not accepted:
+            removed_images_log_data.append((pair.raw_frame_name, reason_or_category))
+
+    def commit_checkpoint(done=False):
+        # Frames still in the lookahead window aren't finished; the next run starts with the oldest of them.
+        # Stage timings and metrics already include some of their work, which a resumed run counts again.
+        if writer is not None:
+            writer.flush()
+        if feature_store is not None:
+            feature_store.flush()
+        # A frame waiting on its segment's representative resumes from the representative, which a
+        # failed finish may have dropped without recording
+        resume_pair = (pending[0].representative or pending[0]) if pending else None
+        range_checkpoint.commit(resume_pair.index if resume_pair is not None else frame_count, removed_images_log_data, manifest_rows,
+                                executor.timings, pipeline_metrics.snapshot(), done)
+
+    if range_checkpoint is not None:
+        range_checkpoint.begin()
+    try:
+        while stop_frame is None or frame_count < stop_frame:
+            if cancel_event is not None and cancel_event.is_set():
+                logger.info(f"Job {job_id}: Cancelled at frame pair {frame_count}.")
+                raise PipelineCancelled(f"Job {job_id} was cancelled.")
+
+            # grab() now, retrieve() only if a stage or the writer needs pixels; frames decided
+            # early or from stored features never pay for converting them
+            ret_raw = cap_raw.grab()
+            ret_realsense = cap_realsense.grab()
+
+            if not ret_raw or not ret_realsense:
+                logger.info(f"Job {job_id}: Reached end of one or both videos after {frame_count} iterations.")
+                break
+
+            raw_frame_name = f"raw_frame_{frame_count:05d}{frame_extension(image_format)}" # Lossless formats only, for quality
+            realsense_frame_name = f"realsense_frame_{frame_count:05d}{frame_extension(depth_format)}"
+
+            pair = FramePair(frame_count, None, raw_frame_name, None, realsense_frame_name,
+                             raw_loader=cap_raw.retrieve,
+                             realsense_loader=lambda: (cap_realsense.retrieve(), cap_realsense.retrieve_analysis()))
+            if sampler.starts_segment(pair):
+                representative, done = pair, executor.advance(pair)
+                # Without a writer, pixels are only kept for stages still to run
+                pair.detach(pair.accepted and (writer is not None or not done))
+            else:
+                pair.representative = representative
+                verdict_known = representative.pending is None and (not representative.accepted or representative.next_stage == len(executor.stages))
+                pair.detach(writer is not None and (representative.accepted or not verdict_known))
+            pending.append(pair)
+            # The lookahead limits frames being analyzed; frames waiting on one of them finish right after it
+            while pending and (pending[0].representative is not None or sum(1 for p in pending if p.representative is None) > lookahead):
+                finish_oldest()
+
+            if frame_count % 100 == 0: # Log progress
+                logger.info(f"Job {job_id}: Processed {frame_count} frame pairs...")
+            frame_count +=1
+            reporter.update(frame_count - start_frame, executor.timings, pipeline_metrics)
+            if range_checkpoint is not None and range_checkpoint.due():
+                commit_checkpoint()
+
+        while pending:
+            finish_oldest()
+        if writer is not None:
+            writer.close()
+        if range_checkpoint is not None:
+            commit_checkpoint(done=True)
+        reporter.update(frame_count - start_frame, executor.timings, pipeline_metrics, force=True)
+    except BaseException as e:
+        if range_checkpoint is not None and isinstance(e, Exception):
+            # Keep what was finished, e.g. when cancelled or the videos became unreadable part way
+            try:
+                commit_checkpoint()
+            except Exception as checkpoint_error:
+                logger.warning(f"Job {job_id}: Could not checkpoint frames {start_frame}-{frame_count}: {checkpoint_error}")
+        if writer is not None:
+            writer.close(discard=True)
+        raise
+    finally:
+        for pair in pending:
+            executor.cancel(pair)
+        if feature_store is not None:
+            feature_store.close()
+        cap_raw.release()
+        cap_realsense.release()
+
+    return frame_count - start_frame, removed_images_log_data, executor.timings, manifest_rows, pipeline_metrics.snapshot(reset=True)
+
+
+def _process_growing_videos(range_args, cancel_event):
+    """
+    Runs _process_frame_range over videos that may still be arriving. Videos that are still
+    growing are read through a GrowingFileStream, so frames are processed as their bytes land
+    and the run ends when the shorter video is complete.
+    """
+    job_id, path_to_raw_video, path_to_realsense_video = range_args[:3]
+    with ExitStack() as stack:
+        streams = {
+            path: stack.enter_context(GrowingFileStream(path, cancel_event))
+            for path in (path_to_raw_video, path_to_realsense_video) if is_growing(path)
+        }
+        sources = [streams[path].stream_path if path in streams else path for path in (path_to_raw_video, path_to_realsense_video)]
+        result = _process_frame_range(job_id, *sources, *range_args[3:], 0, None)
+    if cancel_event is not None and cancel_event.is_set():
+        # A cancelled stream ends like a finished video; don't report partial results as complete
+        raise PipelineCancelled(f"Job {job_id} was cancelled.")
+    for path, stream in streams.items():
+        if stream.error is not None:
+            raise IOError(f"Streaming ingest of {path} failed after {stream.bytes_fed} bytes: {stream.error}")
+    return result
 
 
 def process_video_frames(
@@ -255,14 +635,56 @@ def process_video_frames(
     pattern_image_paths: list, # List of full paths to pattern images
     # Configurable parameters from main.py session
     thres_params: dict, # Contains all numerical thresholds and text prompts
-    pipeline_processes_config: dict # Booleans for active stages
+    pipeline_processes_config: dict, # Booleans for active stages
+    pattern_library: PatternLibrary = None, # Optional prebuilt library, e.g. shared across a session's jobs
+    cancel_event=None, # Optional Event; processing stops once it is set. Must be picklable (e.g. a Manager Event) when frame_workers > 1
+    frame_workers: int = 1, # Processes used to work on frame ranges in parallel; 1 processes serially
+    detector: OllamaDetector = None, # Ollama client settings, including how many requests stay in flight
+    stage_costs: dict = None, # Optional {stage name: seconds per frame}, e.g. from a previous job's stage_timings.json
+    feature_store_dir: str = None, # Keep per-frame features here so re-runs with new thresholds skip the expensive work
+    realsense_gray_decode: bool = False, # Decode the depth stream straight to grayscale when the video allows it
+    analysis_width: int = None, # Downscale depth frames to this width for the solid color and pattern stages
+    writer_options: dict = None, # FrameWriter settings: image_format, depth_format, png_compression, threads, queue_size
+    create_zip: bool = True, # False leaves the output folder for the caller to stream with stream_zip_from_directory
+    keep_unzipped: bool = True, # False deletes the output folder once the ZIP is written, leaving only the archive
+    output_mode: str = "images", # "manifest" records accepted frames in a manifest instead of writing images
+    manifest_format: str = "csv", # csv, jsonl or parquet (needs pyarrow)
+    streaming_ingest: bool = False, # Start on videos that are still being uploaded, following them as they grow
+    progress=None, # Optional mapping (a Manager dict when frame_workers > 1) that live progress is published to
+    profile_dir: str = None, # Frame range workers write their profiles here; run the job itself with profile_job to profile it too
+    checkpoint_interval: float = DEFAULT_CHECKPOINT_INTERVAL, # Seconds between checkpoints a re-run of the job resumes from; 0 disables them
+    sampling_options: dict = None # FrameSampler settings: mode ("off", "stride" or "scene"), stride, scene_threshold
 ):
     """
     Extracts frames from videos, processes them according to pipeline_processes_config and thres_params.
-    Saves accepted images into categorized folders and creates a ZIP archive.
-    Returns: (number_of_frames_processed, name_of_output_zip_file)
+    Saves accepted images into categorized folders and creates a ZIP archive. In manifest output mode
+    only a manifest of per-frame results is saved; images are extracted from the source videos on
+    demand with stream_manifest_results or extract_manifest_frames.
+    With streaming_ingest, videos still being written (see pipeline.ingest) are processed from
+    the part that has arrived and followed until complete; this runs serially, without the
+    feature store or grayscale decode, since those need the whole file up front.
+    Returns: (number_of_frames_processed, name_of_output_zip_file); the name is None if nothing was
+    accepted, and with create_zip=False it is returned without the file being written.
+    With keep_unzipped=False the accepted images are removed once zipped, so only the ZIP is kept.
+    Live progress written to `progress` can be read with summarize_progress(dict(progress)).
+    To profile a job, call it through profile_job(profile_dir, process_video_frames, ..., profile_dir=profile_dir).
+    Jobs are checkpointed (see pipeline.checkpoint) unless checkpoint_interval is 0; running a job
+    again with the same job_id and inputs resumes it from its checkpoints, which are removed once
+    it completes. Streaming ingest runs aren't checkpointed.
+    With sampling_options (see pipeline.sampling), only one frame per segment of similar frames is
+    analyzed and the others take its verdict, e.g. 1 in 10 frames of slowly changing footage.
     """
     logger.info(f"Job {job_id}: Starting video processing. Raw: '{path_to_raw_video}', RealSense: '{path_to_realsense_video}'")
+    pipeline_metrics.snapshot(reset=True) # Drop anything left over from this process's previous job
+    if output_mode not in ("images", "manifest"):
+        raise ValueError(f"Unknown output mode '{output_mode}', expected 'images' or 'manifest'")
+    if output_mode == "manifest":
+        check_manifest_format(manifest_format) # Fail before processing, not after
+    sampler = FrameSampler(**(sampling_options or {}))
+    # Resolved here so every frame range worker samples the same way
+    sampling = dict(mode=sampler.mode, stride=sampler.stride, scene_threshold=sampler.scene_threshold)
+    if sampler.enabled:
+        logger.info(f"Job {job_id}: Sampling frames by {sampler.mode}; segments of up to {sampler.stride} frames take the verdict of their first frame.")
     
     # Define base output directory for this job's accepted images
     # This should be unique per job to avoid conflicts if jobs run concurrently or use same session data
@@ -273,45 +695,46 @@ def process_video_frames(
     
     PIPELINE_OUTPUT_ROOT = Path("pipeline_output")
     PIPELINE_OUTPUT_ROOT.mkdir(exist_ok=True)
-    output_base_dir = PIPELINE_OUTPUT_ROOT / job_id / "Accepted_images"
-    if output_base_dir.exists():
-        shutil.rmtree(output_base_dir)
-    output_base_dir.mkdir(parents=True, exist_ok=True)
-
-    # Load pattern images
-    loaded_patterns = []
-    if pipeline_processes_config.get('Pattern Thresholding', False) and pattern_image_paths:
-        logger.info(f"Job {job_id}: Loading {len(pattern_image_paths)} pattern images.")
-        for img_path_str in pattern_image_paths:
-            try:
-                img_path = Path(img_path_str)
-                pattern_cv_img = cv2.imread(str(img_path))
-                if pattern_cv_img is not None:
-                    # Convert to grayscale for SIFT consistency
-                    pattern_cv_gray = cv2.cvtColor(pattern_cv_img, cv2.COLOR_BGR2GRAY)
-                    loaded_patterns.append((pattern_cv_gray, img_path.name))
-                else:
-                    logger.warning(f"Job {job_id}: Could not load pattern image: {img_path_str}")
-            except Exception as e:
-                 logger.error(f"Job {job_id}: Error loading pattern image {img_path_str}: {e}")
-    elif pipeline_processes_config.get('Pattern Thresholding', False):
-        logger.warning(f"Job {job_id}: Pattern Thresholding is ON, but no pattern image paths were provided.")
-
-
-    cap_raw = cv2.VideoCapture(path_to_raw_video)
-    cap_realsense = cv2.VideoCapture(path_to_realsense_video)
-
-    if not cap_raw.isOpened():
-        logger.error(f"Job {job_id}: Error: Unable to open raw video: {path_to_raw_video}")
-        raise IOError(f"Could not open raw video: {path_to_raw_video}")
-    if not cap_realsense.isOpened():
-        logger.error(f"Job {job_id}: Error: Unable to open RealSense video: {path_to_realsense_video}")
-        cap_raw.release() # Release the already opened one
-        raise IOError(f"Could not open RealSense video: {path_to_realsense_video}")
-
-    frame_count = 0
-    processed_frame_count = 0
-    removed_images_log_data = []
+    output_base_dir = PIPELINE_OUTPUT_ROOT / job_id / "Accepted_images" # Cleared below unless the job resumes
+
+    # Load pattern images once per job. Features are cached per file, so later jobs
+    # using the same patterns skip SIFT extraction entirely.
+    if pattern_library is None:
+        pattern_library = PatternLibrary()
+        if pipeline_processes_config.get('Pattern Thresholding', False) and pattern_image_paths:
+            logger.info(f"Job {job_id}: Loading {len(pattern_image_paths)} pattern images.")
+            pattern_library = PatternLibrary.from_paths(pattern_image_paths)
+        elif pipeline_processes_config.get('Pattern Thresholding', False):
+            logger.warning(f"Job {job_id}: Pattern Thresholding is ON, but no pattern image paths were provided.")
+    logger.info(f"Job {job_id}: Pattern library has {len(pattern_library)} usable patterns.")
+
+
+    growing = [path for path in (path_to_raw_video, path_to_realsense_video) if streaming_ingest and is_growing(path)]
+    if growing and not streaming_ingest_supported():
+        logger.info(f"Job {job_id}: Streaming ingest needs named pipes; waiting for uploads to complete instead.")
+        for path in growing:
+            if not wait_until_complete(path, cancel_event):
+                raise PipelineCancelled(f"Job {job_id} was cancelled.")
+        growing = []
+    if growing:
+        logger.info(f"Job {job_id}: Streaming ingest: processing {', '.join(map(str, growing))} while still being written.")
+        total_frames = 0 # Unknown until the videos are complete; processed as a single range
+    else:
+        cap_raw = cv2.VideoCapture(path_to_raw_video)
+        cap_realsense = cv2.VideoCapture(path_to_realsense_video)
+
+        if not cap_raw.isOpened():
+            logger.error(f"Job {job_id}: Error: Unable to open raw video: {path_to_raw_video}")
+            raise IOError(f"Could not open raw video: {path_to_raw_video}")
+        if not cap_realsense.isOpened():
+            logger.error(f"Job {job_id}: Error: Unable to open RealSense video: {path_to_realsense_video}")
+            cap_raw.release() # Release the already opened one
+            raise IOError(f"Could not open RealSense video: {path_to_realsense_video}")
+
+        # Frame counts from container metadata can be estimates; they are only used to split work
+        total_frames = int(min(cap_raw.get(cv2.CAP_PROP_FRAME_COUNT), cap_realsense.get(cv2.CAP_PROP_FRAME_COUNT)))
+        cap_raw.release()
+        cap_realsense.release()
 
     # Prepare parameters for load_and_process_frame_pair
     bw_params = {
@@ -323,56 +746,131 @@ def process_video_frames(
     # This was THRESHOLD_PATTERN_MATCH, used as a distance.
     sift_distance_thresh = thres_params.get('Pattern Thresholding Value', 200)
 
+    frame_options = dict(
+        run_solid_color_check=pipeline_processes_config.get('Solid Color Detection', True),
+        run_object_detection=pipeline_processes_config.get('Model Object Detection', True),
+        run_pattern_matching=pipeline_processes_config.get('Pattern Thresholding', True),
+        bw_filter_params=bw_params,
+        obj_detect_prompt=obj_det_prompt,
+        pattern_match_sift_distance_thresh=sift_distance_thresh,
+        detector=detector,
+        reject_no_pattern_match=bool(thres_params.get('Reject No Pattern Match', False)),
+        stage_costs=stage_costs,
+        sampling=sampling
+    )
+    # Probe once here rather than in every range worker
+    gray_lut = probe_gray_decode(path_to_realsense_video) if realsense_gray_decode and path_to_realsense_video not in growing else None
+    if realsense_gray_decode and path_to_realsense_video in growing:
+        logger.info(f"Job {job_id}: Grayscale decode needs the RealSense video up front; using BGR decode while it streams in.")
+    elif realsense_gray_decode and gray_lut is None:
+        logger.info(f"Job {job_id}: RealSense video can't be decoded as grayscale; using BGR decode.")
+    realsense_decode = dict(gray=gray_lut is not None, analysis_width=analysis_width, gray_lut=gray_lut)
+
+    feature_store = None
+    if feature_store_dir and growing:
+        logger.info(f"Job {job_id}: Feature store not used; videos are keyed by content, which isn't known until they are complete.")
+    elif feature_store_dir:
+        feature_store = FeatureStore.for_videos(path_to_raw_video, path_to_realsense_video, feature_store_dir,
+                                                 decode_profile(gray_lut is not None, analysis_width))
+        logger.info(f"Job {job_id}: Using frame feature store {feature_store.path}")
+    checkpoint = frame_ranges = None
+    if checkpoint_interval and not growing:
+        checkpoint = JobCheckpoint(PIPELINE_OUTPUT_ROOT / job_id, checkpoint_interval)
+        fingerprint = inputs_fingerprint({
+            'videos': [video_signature(path_to_raw_video), video_signature(path_to_realsense_video)],
+            'patterns': pattern_library.fingerprint if pattern_library else None,
+            'thres_params': thres_params,
+            'pipeline_processes': pipeline_processes_config,
+            'llm_model': (detector or get_default_detector()).model,
+            'stage_costs': stage_costs,
+            'realsense_decode': decode_profile(gray_lut is not None, analysis_width),
+            'output': [output_mode, manifest_format, resolve_output_formats(writer_options)],
+            'sampling': sampling,
+        })
+        frame_ranges = checkpoint.load(fingerprint)
+    if frame_ranges is not None:
+        logger.info(f"Job {job_id}: Resuming from checkpoints in {checkpoint.dir}.")
+    else:
+        if output_base_dir.exists():
+            shutil.rmtree(output_base_dir)
+        frame_ranges = split_frame_ranges(total_frames, frame_workers, align=sampler.stride if sampler.enabled else 1)
+        if checkpoint is not None:
+            checkpoint.start(fingerprint, frame_ranges)
+    output_base_dir.mkdir(parents=True, exist_ok=True)
+    range_args = (job_id, path_to_raw_video, path_to_realsense_video, pattern_library, output_base_dir, frame_options, cancel_event, feature_store, realsense_decode,
+                  writer_options or {}, output_mode, progress, checkpoint)
+
+    start_progress(progress, total_frames, len(frame_ranges))
+    if growing:
+        range_results = [_process_growing_videos(range_args, cancel_event)]
+    elif len(frame_ranges) > 1:
+        logger.info(f"Job {job_id}: Processing ~{total_frames} frame pairs in {len(frame_ranges)} ranges across {frame_workers} workers.")
+        with ProcessPoolExecutor(max_workers=frame_workers, initializer=_init_frame_worker) as executor:
+            if profile_dir is not None:
+                futures = [executor.submit(profile_call, profile_dir, f"range-{start}", _process_frame_range, *range_args, start, stop)
+                           for start, stop in frame_ranges]
+            else:
+                futures = [executor.submit(_process_frame_range, *range_args, start, stop) for start, stop in frame_ranges]
+            try:
+                # Collected in range order, so the removal log keeps frame order
+                range_results = [future.result() for future in futures]
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+    else:
+        range_results = [_process_frame_range(*range_args, *frame_ranges[0])]
 
-    while True:
-        ret_raw, raw_frame = cap_raw.read()
-        ret_realsense, realsense_frame = cap_realsense.read()
-
-        if not ret_raw or not ret_realsense:
-            logger.info(f"Job {job_id}: Reached end of one or both videos after {frame_count} iterations.")
-            break
-
-        raw_frame_name = f"raw_frame_{frame_count:05d}.png" # Save as png for quality
-        realsense_frame_name = f"realsense_frame_{frame_count:05d}.png"
-
-        accepted, reason_or_category = load_and_process_frame_pair(
-            raw_frame, raw_frame_name, realsense_frame, realsense_frame_name,
-            loaded_patterns,
-            output_base_dir, # Pass the specific output dir for accepted images
-            run_solid_color_check=pipeline_processes_config.get('Solid Color Detection', True),
-            run_object_detection=pipeline_processes_config.get('Model Object Detection', True),
-            run_pattern_matching=pipeline_processes_config.get('Pattern Thresholding', True),
-            bw_filter_params=bw_params,
-            obj_detect_prompt=obj_det_prompt,
-            pattern_match_sift_distance_thresh=sift_distance_thresh
-        )
-
-        if not accepted:
-            removed_images_log_data.append((raw_frame_name, reason_or_category))
-        
-        processed_frame_count +=1
-        if frame_count % 100 == 0: # Log progress
-            logger.info(f"Job {job_id}: Processed {frame_count} frame pairs...")
-        frame_count +=1
-
-
-    cap_raw.release()
-    cap_realsense.release()
+    frame_count = sum(iterated for iterated, _, _, _, _ in range_results)
+    processed_frame_count = frame_count
+    removed_images_log_data = [entry for _, removed, _, _, _ in range_results for entry in removed]
     logger.info(f"Job {job_id}: Finished processing video frames. Total pairs iterated: {frame_count}, successfully processed: {processed_frame_count - len(removed_images_log_data)}")
 
+    # Measured per-stage cost, kept next to (not inside) the zipped output so stage_costs can be tuned
+    stage_timings = merge_stage_timings(timings for _, _, timings, _, _ in range_results)
+    for name, timing in stage_timings.items():
+        logger.info(f"Job {job_id}: Stage '{name}' ran {timing['count']} times ({timing['stored']} from stored features), mean {timing['mean_seconds'] * 1000:.1f} ms, rejected {timing['rejected']}.")
+    with open(PIPELINE_OUTPUT_ROOT / job_id / "stage_timings.json", "w") as f:
+        json.dump(stage_timings, f, indent=2)
+
     create_text_file_with_removed_images(output_base_dir, removed_images_log_data)
+    if output_mode == "manifest":
+        manifest_path = write_manifest((row for _, _, _, rows, _ in range_results for row in rows), output_base_dir, manifest_format)
+        image_format, depth_format, png_compression = resolve_output_formats(writer_options)
+        write_results_info(PIPELINE_OUTPUT_ROOT / job_id, {
+            'output_mode': output_mode,
+            'manifest': manifest_path.name,
+            'raw_video': str(Path(path_to_raw_video).resolve()),
+            'realsense_video': str(Path(path_to_realsense_video).resolve()),
+            'realsense_gray': gray_lut is not None,
+            'image_format': image_format,
+            'depth_format': depth_format,
+            'png_compression': png_compression,
+        })
+        logger.info(f"Job {job_id}: Wrote manifest {manifest_path}")
     
     # Zip the contents of output_base_dir
-    if os.listdir(output_base_dir): # Only zip if there's content
+    if os.listdir(output_base_dir) and create_zip: # Only zip if there's content
         zip_file_name = create_zip_from_directory(str(output_base_dir), job_id)
         logger.info(f"Job {job_id}: Successfully created ZIP file: {zip_file_name}")
+    elif os.listdir(output_base_dir):
+        zip_file_name = f"Results_{job_id}.zip"
+        logger.info(f"Job {job_id}: Output left in {output_base_dir} to be streamed as {zip_file_name}")
     else:
         logger.info(f"Job {job_id}: No images were accepted. ZIP file not created.")
         zip_file_name = None # Or an empty zip, depending on requirements
 
-    # Optionally, clean up the unzipped output_base_dir after zipping
-    # shutil.rmtree(output_base_dir)
-    # logger.info(f"Job {job_id}: Cleaned up temporary processing directory: {output_base_dir}")
+    # Per-operation counters and latency histograms of all ranges (plus zipping), for the metrics API
+    job_metrics = merge_metrics([range_metrics for _, _, _, _, range_metrics in range_results] + [pipeline_metrics.snapshot(reset=True)])
+    with open(PIPELINE_OUTPUT_ROOT / job_id / METRICS_FILENAME, "w") as f:
+        json.dump(job_metrics, f, indent=2)
+    if checkpoint is not None:
+        checkpoint.clear() # Complete; nothing left to resume
+
+    # The ZIP holds everything in output_base_dir, so keeping both only doubles the disk used
+    if zip_file_name and create_zip and not keep_unzipped:
+        shutil.rmtree(output_base_dir)
+        logger.info(f"Job {job_id}: Cleaned up temporary processing directory: {output_base_dir}")
 
 
     return processed_frame_count, zip_file_name
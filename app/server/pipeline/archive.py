@@ -0,0 +1,78 @@
+import io
+import os
+import zipfile
+from pathlib import Path
+
+# Image formats that are already compressed; deflating them again costs CPU for ~0% gain
+_PRECOMPRESSED_SUFFIXES = {'.png', '.webp', '.jpg', '.jpeg', '.zip'}
+ZIP_STREAM_CHUNK_SIZE = 1024 * 1024
+
+
+def zip_compress_type(name):
+    return zipfile.ZIP_STORED if Path(name).suffix.lower() in _PRECOMPRESSED_SUFFIXES else zipfile.ZIP_DEFLATED
+
+
+def iter_directory_entries(dir_path):
+    """Yields (file_path, arcname) for every file under dir_path, in a stable order."""
+    dir_path = Path(dir_path)
+    for root, dirs, files in os.walk(dir_path):
+        dirs.sort()
+        for file in sorted(files):
+            file_path = Path(root) / file
+            yield file_path, file_path.relative_to(dir_path)
+
+
+class _ZipStreamBuffer(io.RawIOBase):
+    """Write-only, unseekable sink that zipfile writes into and the stream generator drains."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def stream_zip(entries, chunk_size=ZIP_STREAM_CHUNK_SIZE):
+    """
+    Generates a zip archive as byte chunks without writing it to disk, e.g. for a streaming
+    HTTP response. entries yields (arcname, source) where source is a file path or bytes.
+    Images are stored as-is; other files are deflated.
+    """
+    sink = _ZipStreamBuffer()
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED) as zipf:
+        for arcname, source in entries:
+            if isinstance(source, (bytes, bytearray, memoryview)):
+                zinfo = zipfile.ZipInfo(str(arcname))
+                zinfo.compress_type = zip_compress_type(arcname)
+                zipf.writestr(zinfo, source)
+            else:
+                zinfo = zipfile.ZipInfo.from_file(source, arcname)
+                zinfo.compress_type = zip_compress_type(arcname)
+                with open(source, "rb") as src, zipf.open(zinfo, "w") as dest:
+                    for chunk in iter(lambda: src.read(chunk_size), b""):
+                        dest.write(chunk)
+                        data = sink.drain()
+                        if data:
+                            yield data
+            data = sink.drain()
+            if data:
+                yield data
+    # Central directory is written on close
+    data = sink.drain()
+    if data:
+        yield data
+
+
+def stream_zip_from_directory(directory_path_str, chunk_size=ZIP_STREAM_CHUNK_SIZE):
+    """Streams a zip of every file under a directory (see stream_zip)."""
+    entries = ((arcname, file_path) for file_path, arcname in iter_directory_entries(directory_path_str))
+    return stream_zip(entries, chunk_size)
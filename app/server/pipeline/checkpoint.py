@@ -0,0 +1,162 @@
+import os
+import re
+import json
+import time
+import shutil
+import hashlib
+import logging
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Defaults can be overridden from the server .env
+DEFAULT_CHECKPOINT_INTERVAL = float(os.getenv("PIPELINE_CHECKPOINT_INTERVAL", 30)) # Seconds between checkpoints; 0 disables them
+CHECKPOINT_DIRNAME = "checkpoints"
+JOB_CHECKPOINT_FILENAME = "job.json"
+_FRAME_FILE_RE = re.compile(r"^(?:raw|realsense)_frame_(\d+)\.")
+
+
+def video_signature(path):
+    """Identifies a video file cheaply: resolved path, size and modification time."""
+    stat = os.stat(path)
+    return [str(Path(path).resolve()), stat.st_size, stat.st_mtime_ns]
+
+
+def inputs_fingerprint(inputs):
+    """Hash of everything that decides a job's results; checkpoints only resume a job with the same inputs."""
+    return hashlib.sha256(json.dumps(inputs, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def has_checkpoint(job_dir):
+    return (Path(job_dir) / CHECKPOINT_DIRNAME / JOB_CHECKPOINT_FILENAME).exists()
+
+
+def discard_frames_from(output_base_dir, start_frame, stop_frame=None):
+    """
+    Removes accepted frame images with indices in [start_frame, stop_frame) (stop_frame=None: to the end),
+    i.e. ones an interrupted run may have written after its last checkpoint.
+    """
+    for path in Path(output_base_dir).glob("*/*/*"):
+        match = _FRAME_FILE_RE.match(path.name)
+        if match and int(match.group(1)) >= start_frame and (stop_frame is None or int(match.group(1)) < stop_frame):
+            path.unlink(missing_ok=True)
+
+
+class JobCheckpoint:
+    """
+    Checkpoints of one job, kept in <job_dir>/checkpoints: job.json records the inputs'
+    fingerprint and how the frames were split into ranges, and each range keeps a RangeCheckpoint
+    journal. Running a job again with the same job ID and inputs resumes every range from its
+    last checkpoint instead of starting over. Picklable, so frame range workers get a copy.
+    """
+
+    def __init__(self, job_dir, interval=DEFAULT_CHECKPOINT_INTERVAL):
+        self.dir = Path(job_dir) / CHECKPOINT_DIRNAME
+        self.interval = interval
+
+    def load(self, fingerprint):
+        """Returns: the frame ranges of an earlier run with the same inputs, or None if there isn't one to resume."""
+        try:
+            checkpoint = json.loads((self.dir / JOB_CHECKPOINT_FILENAME).read_text())
+        except (FileNotFoundError, ValueError):
+            return None
+        if checkpoint.get("fingerprint") != fingerprint:
+            logger.info(f"Checkpoints in {self.dir} are for different inputs; starting over.")
+            return None
+        return [tuple(frame_range) for frame_range in checkpoint["ranges"]]
+
+    def start(self, fingerprint, frame_ranges):
+        """Starts checkpointing a fresh run, dropping any checkpoints of an earlier one."""
+        self.clear()
+        self.dir.mkdir(parents=True)
+        tmp_path = self.dir / f"{JOB_CHECKPOINT_FILENAME}.tmp"
+        tmp_path.write_text(json.dumps({"fingerprint": fingerprint, "ranges": [list(frame_range) for frame_range in frame_ranges]}))
+        os.replace(tmp_path, self.dir / JOB_CHECKPOINT_FILENAME)
+
+    def for_range(self, start_frame, stop_frame):
+        return RangeCheckpoint(self.dir / f"range-{start_frame}.jsonl", start_frame, stop_frame, self.interval)
+
+    def clear(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+
+class RangeCheckpoint:
+    """
+    Append-only journal of one frame range's committed work. The first line identifies the
+    range; each checkpoint appends the frame index processing can restart from, the removal
+    log and manifest rows added since the previous checkpoint, and the range's cumulative stage
+    timings and metrics. A line torn by a crash is ignored, falling back to the one before it.
+    """
+
+    def __init__(self, path, start_frame, stop_frame, interval=DEFAULT_CHECKPOINT_INTERVAL):
+        self.path = Path(path)
+        self.start_frame = start_frame
+        self.stop_frame = stop_frame
+        self.interval = interval
+        self._removed_committed = 0
+        self._rows_committed = 0
+        self._last_commit = time.monotonic()
+
+    def load(self):
+        """
+        Returns: None if this range never started, else {next_frame, removed, manifest_rows,
+        stage_timings, metrics, done} as of its last checkpoint.
+        """
+        if not self.path.exists():
+            return None
+        with open(self.path) as f:
+            lines = f.read().splitlines()
+        state = {'next_frame': self.start_frame, 'removed': [], 'manifest_rows': [], 'stage_timings': {}, 'metrics': None, 'done': False}
+        for line in lines[1:]:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue # Torn by a crash mid-write; the run after it restarted from the line before
+            state['next_frame'] = record['next_frame']
+            state['removed'] += [tuple(entry) for entry in record['removed']]
+            state['manifest_rows'] += record['manifest_rows']
+            state['stage_timings'] = record['stage_timings']
+            state['metrics'] = record['metrics']
+            state['done'] = record['done']
+        self._removed_committed = len(state['removed'])
+        self._rows_committed = len(state['manifest_rows'])
+        return state
+
+    def begin(self):
+        """Starts the journal, unless a resumed run is adding to it."""
+        if not self.path.exists():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "w") as f:
+                f.write(json.dumps({"start_frame": self.start_frame, "stop_frame": self.stop_frame}) + "\n")
+        else:
+            with open(self.path, "rb+") as f:
+                size = f.seek(0, os.SEEK_END)
+                if size:
+                    f.seek(size - 1)
+                    if f.read(1) != b"\n":
+                        f.write(b"\n") # Keep the next record off a torn line
+        self._last_commit = time.monotonic()
+
+    def due(self):
+        return self.interval and time.monotonic() - self._last_commit >= self.interval
+
+    def commit(self, next_frame, removed, manifest_rows, stage_timings, metrics, done=False):
+        """
+        Records that every frame before next_frame is finished (decided, and written if accepted).
+        removed and manifest_rows are the range's full lists so far; only their new entries are appended.
+        """
+        record = {
+            'next_frame': next_frame,
+            'removed': removed[self._removed_committed:],
+            'manifest_rows': manifest_rows[self._rows_committed:],
+            'stage_timings': stage_timings,
+            'metrics': metrics,
+            'done': done,
+        }
+        with open(self.path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self._removed_committed = len(removed)
+        self._rows_committed = len(manifest_rows)
+        self._last_commit = time.monotonic()
@@ -0,0 +1,152 @@
+import os
+import pickle
+import hashlib
+import sqlite3
+import threading
+import logging
+from contextlib import closing
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FEATURE_STORE_DIR = os.getenv("FEATURE_STORE_DIR", "feature_store")
+HASH_CHUNK_SIZE = 1024 * 1024
+
+FILE_HASH_INDEX_FILENAME = "file_hashes.sqlite"
+
+
+def _open_file_hash_index(index_dir):
+    Path(index_dir).mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(Path(index_dir) / FILE_HASH_INDEX_FILENAME), timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS file_hashes ("
+        "path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, sha1 TEXT NOT NULL)"
+    )
+    return conn
+
+
+def file_content_hash(path_str, index_dir=DEFAULT_FEATURE_STORE_DIR):
+    """
+    SHA-1 of a file's contents. Results are remembered in <index_dir>/file_hashes.sqlite keyed
+    by path, size and mtime, so multi-GB videos are only hashed once. SQLite lets the jobs of
+    several processes update the index at once.
+    """
+    path = Path(path_str).resolve()
+    stat = path.stat()
+    with closing(_open_file_hash_index(index_dir)) as conn:
+        row = conn.execute("SELECT size, mtime_ns, sha1 FROM file_hashes WHERE path = ?", (str(path),)).fetchone()
+        if row is not None and row[:2] == (stat.st_size, stat.st_mtime_ns):
+            return row[2]
+
+        # No lock is held while hashing; another process hashing the same file just writes the same row
+        digest = hashlib.sha1()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                digest.update(chunk)
+        content_hash = digest.hexdigest()
+
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO file_hashes (path, size, mtime_ns, sha1) VALUES (?, ?, ?, ?)",
+                (str(path), stat.st_size, stat.st_mtime_ns, content_hash)
+            )
+    return content_hash
+
+
+def video_pair_key(path_to_raw_video, path_to_realsense_video, index_dir=DEFAULT_FEATURE_STORE_DIR):
+    """Identifies a raw/RealSense video pair by the content of both files."""
+    raw_hash = file_content_hash(path_to_raw_video, index_dir)
+    realsense_hash = file_content_hash(path_to_realsense_video, index_dir)
+    return hashlib.sha1(f"{raw_hash}:{realsense_hash}".encode()).hexdigest()
+
+
+class FeatureStore:
+    """
+    Per-video store of threshold-independent frame features, keyed by stage, a stage-specific
+    variant (pattern library fingerprint, LLM prompt, ...) and frame index.
+
+    Stages save the expensive part of their work here (grayscale histograms, raw SIFT match
+    distances, LLM responses), so re-running a video with different thresholds only re-applies
+    the cheap decision functions. Writes are batched and flushed every `flush_every` frames.
+    """
+
+    def __init__(self, video_key, store_dir=DEFAULT_FEATURE_STORE_DIR, flush_every=200):
+        self.video_key = video_key
+        self.store_dir = str(store_dir)
+        self.flush_every = flush_every
+        self.path = str(Path(self.store_dir) / f"{video_key}.sqlite")
+        self._conn = None
+        self._pending_rows = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_videos(cls, path_to_raw_video, path_to_realsense_video, store_dir=DEFAULT_FEATURE_STORE_DIR, decode_profile=None):
+        """
+        Store for a video pair. decode_profile separates features computed from differently
+        decoded frames (e.g. grayscale or downscaled analysis frames).
+        """
+        video_key = video_pair_key(path_to_raw_video, path_to_realsense_video, store_dir)
+        if decode_profile and decode_profile != "bgr-full":
+            video_key = f"{video_key}-{decode_profile}"
+        return cls(video_key, store_dir)
+
+    def __getstate__(self):
+        # Each process opens its own connection
+        return {'video_key': self.video_key, 'store_dir': self.store_dir, 'flush_every': self.flush_every}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def _connect(self):
+        if self._conn is None:
+            Path(self.store_dir).mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS features ("
+                "stage TEXT NOT NULL, variant TEXT NOT NULL, frame_index INTEGER NOT NULL, value BLOB NOT NULL, "
+                "PRIMARY KEY (stage, variant, frame_index))"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def get(self, stage, variant, frame_index):
+        """Returns the stored features for a frame, or None if they were never computed."""
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT value FROM features WHERE stage = ? AND variant = ? AND frame_index = ?",
+                (stage, variant, frame_index)
+            ).fetchone()
+            if row is None:
+                # May still be waiting in the write buffer
+                for pending_stage, pending_variant, pending_index, value in reversed(self._pending_rows):
+                    if (pending_stage, pending_variant, pending_index) == (stage, variant, frame_index):
+                        return pickle.loads(value)
+                return None
+        return pickle.loads(row[0])
+
+    def put(self, stage, variant, frame_index, features):
+        with self._lock:
+            self._pending_rows.append((stage, variant, frame_index, pickle.dumps(features, protocol=pickle.HIGHEST_PROTOCOL)))
+            if len(self._pending_rows) >= self.flush_every:
+                self._flush_locked()
+
+    def _flush_locked(self):
+        if not self._pending_rows:
+            return
+        conn = self._connect()
+        conn.executemany("INSERT OR REPLACE INTO features (stage, variant, frame_index, value) VALUES (?, ?, ?, ?)", self._pending_rows)
+        conn.commit()
+        self._pending_rows = []
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def close(self):
+        with self._lock:
+            self._flush_locked()
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
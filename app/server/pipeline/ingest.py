@@ -0,0 +1,214 @@
+import os
+import json
+import time
+import errno
+import shutil
+import tempfile
+import threading
+import logging
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Defaults can be overridden from the server .env
+DEFAULT_INGEST_POLL_SECONDS = float(os.getenv("STREAMING_INGEST_POLL_SECONDS", 0.2))
+# A growing file that gains no bytes for this long is treated as abandoned
+DEFAULT_INGEST_STALL_TIMEOUT = float(os.getenv("STREAMING_INGEST_STALL_TIMEOUT", 600))
+INGEST_PROGRESS_SUFFIX = ".progress"
+INGEST_READ_SIZE = 1024 * 1024
+
+
+def ingest_progress_path(path):
+    """Sidecar that exists next to a file's final path for as long as the file is still being written."""
+    return Path(str(path) + INGEST_PROGRESS_SUFFIX)
+
+
+def write_ingest_progress(path, data_path, available_bytes):
+    """
+    Records that the first available_bytes of the file destined for `path` are final.
+    data_path is where those bytes are being written, which may differ from the final path.
+    """
+    progress_path = ingest_progress_path(path)
+    tmp_path = progress_path.with_name(progress_path.name + ".tmp")
+    tmp_path.write_text(json.dumps({"path": str(data_path), "available_bytes": int(available_bytes)}))
+    os.replace(tmp_path, progress_path) # Readers never see a half-written sidecar
+
+
+def clear_ingest_progress(path):
+    """Marks the file at `path` as complete (or gone)."""
+    ingest_progress_path(path).unlink(missing_ok=True)
+
+
+def read_ingest_progress(path):
+    """Returns: {"path", "available_bytes"} while the file is still being written, else None."""
+    try:
+        return json.loads(ingest_progress_path(path).read_text())
+    except FileNotFoundError:
+        return None
+    except ValueError:
+        return None # Only possible for a sidecar written by something other than write_ingest_progress
+
+
+def is_growing(path):
+    return ingest_progress_path(path).exists()
+
+
+def streaming_ingest_supported():
+    """Growing files are handed to the decoder through a named pipe, which needs a POSIX system."""
+    return hasattr(os, "mkfifo")
+
+
+def wait_until_complete(path, cancel_event=None, poll_seconds=DEFAULT_INGEST_POLL_SECONDS, stall_timeout=DEFAULT_INGEST_STALL_TIMEOUT):
+    """
+    Blocks until a growing file is complete. Returns: True once it is, False if cancelled.
+    Raises IOError if it stops growing for stall_timeout seconds or its upload is abandoned.
+    """
+    last_available, last_change = None, time.monotonic()
+    while True:
+        progress = read_ingest_progress(path)
+        if progress is None:
+            if not Path(path).exists():
+                raise IOError(f"{path} was removed before it was complete.")
+            return True
+        if cancel_event is not None and cancel_event.is_set():
+            return False
+        if progress["available_bytes"] != last_available:
+            last_available, last_change = progress["available_bytes"], time.monotonic()
+        elif time.monotonic() - last_change > stall_timeout:
+            raise IOError(f"{path} stopped growing at {last_available} bytes.")
+        time.sleep(poll_seconds)
+
+
+class GrowingFileStream:
+    """
+    Exposes a file that is still being written (e.g. a video mid-upload) as a sequential
+    stream the video decoder can start on right away.
+
+    A thread copies the prefix of the file that is already final, as reported by its
+    progress sidecar, into a named pipe and keeps following the sidecar as it advances.
+    Reads from `stream_path` block until more of the file has arrived, and reach end of
+    file once the file is complete. Only formats that decode front to back without seeking
+    work this way (MKV, AVI, MPEG-TS, fragmented or "faststart" MP4).
+
+    The stream also ends early if the file stalls for stall_timeout seconds, is removed,
+    or cancel_event is set; `complete` and `error` tell these cases apart afterwards.
+    """
+
+    def __init__(self, path, cancel_event=None, poll_seconds=DEFAULT_INGEST_POLL_SECONDS,
+                 stall_timeout=DEFAULT_INGEST_STALL_TIMEOUT):
+        self.path = Path(path)
+        self.cancel_event = cancel_event
+        self.poll_seconds = poll_seconds
+        self.stall_timeout = stall_timeout
+        self.bytes_fed = 0
+        self.complete = False
+        self.error = None
+        self._stop = threading.Event()
+        self._tmp_dir = None
+        self.stream_path = None
+        self._thread = None
+
+    def __enter__(self):
+        self._tmp_dir = tempfile.mkdtemp(prefix="ingest-")
+        # Keep the extension; some demuxers use it as a hint
+        self.stream_path = os.path.join(self._tmp_dir, f"stream{self.path.suffix}")
+        os.mkfifo(self.stream_path)
+        self._thread = threading.Thread(target=self._run, name=f"ingest-{self.path.name}", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=max(1.0, self.poll_seconds * 5))
+            if self._thread.is_alive():
+                logger.warning(f"Feeder for {self.path} did not stop; leaving it to exit with the process.")
+        if self._tmp_dir is not None:
+            shutil.rmtree(self._tmp_dir, ignore_errors=True)
+            self._tmp_dir = None
+
+    def _stopped(self):
+        return self._stop.is_set() or (self.cancel_event is not None and self.cancel_event.is_set())
+
+    def _open_pipe(self):
+        """Opens the write end once the decoder has opened the read end. Returns: fd, or None if stopped first."""
+        while not self._stopped():
+            try:
+                fd = os.open(self.stream_path, os.O_WRONLY | os.O_NONBLOCK)
+            except OSError as e:
+                if e.errno != errno.ENXIO: # ENXIO: no reader yet
+                    raise
+                time.sleep(0.01)
+                continue
+            os.set_blocking(fd, True)
+            return fd
+        return None
+
+    def _release_waiting_reader(self):
+        """Opens the write end without waiting, so a decoder blocked opening the pipe gets end of file."""
+        try:
+            return os.open(self.stream_path, os.O_WRONLY | os.O_NONBLOCK)
+        except OSError:
+            return None
+
+    def _open_source(self):
+        """Opens the bytes being written; the fd stays valid when the finished file is moved into place."""
+        deadline = time.monotonic() + self.stall_timeout
+        while not self._stopped():
+            progress = read_ingest_progress(self.path)
+            try:
+                return os.open(progress["path"] if progress else self.path, os.O_RDONLY)
+            except FileNotFoundError:
+                if progress is None and not is_growing(self.path) and not self.path.exists():
+                    raise IOError(f"{self.path} was removed before it was complete.")
+                if time.monotonic() > deadline:
+                    raise IOError(f"{self.path} did not appear within {self.stall_timeout:.0f}s.")
+                time.sleep(self.poll_seconds) # Moved into place between reading the sidecar and opening
+        return None
+
+    def _run(self):
+        pipe_fd = source_fd = None
+        try:
+            pipe_fd = self._open_pipe()
+            source_fd = self._open_source() if pipe_fd is not None and not self._stopped() else None
+            last_growth = time.monotonic()
+            while source_fd is not None and not self._stopped():
+                progress = read_ingest_progress(self.path)
+                if progress is None and not self.path.exists():
+                    raise IOError(f"{self.path} was removed before it was complete.")
+                available = progress["available_bytes"] if progress else os.fstat(source_fd).st_size
+                if self.bytes_fed < available:
+                    data = os.pread(source_fd, min(INGEST_READ_SIZE, available - self.bytes_fed), self.bytes_fed)
+                    if not data:
+                        raise IOError(f"{self.path} is shorter than the {available} bytes reported as written.")
+                    view = memoryview(data)
+                    while view:
+                        view = view[os.write(pipe_fd, view):]
+                    self.bytes_fed += len(data)
+                    last_growth = time.monotonic()
+                elif progress is None:
+                    self.complete = True
+                    return
+                elif time.monotonic() - last_growth > self.stall_timeout:
+                    raise IOError(f"{self.path} stopped growing at {self.bytes_fed} bytes.")
+                else:
+                    time.sleep(self.poll_seconds)
+        except BrokenPipeError:
+            pass # The decoder stopped reading, e.g. because the other video ended first
+        except Exception as e:
+            logger.error(f"Streaming ingest of {self.path} failed: {e}")
+            self.error = e
+        finally:
+            # Closing the write end is what the decoder sees as end of file
+            for fd in (source_fd, pipe_fd):
+                if fd is not None:
+                    os.close(fd)
+            # OpenCV tries other backends when FFmpeg can't open a stream, and each reopens the
+            # pipe; keep answering them with end of file until the stream is closed
+            while not self._stop.wait(0.05):
+                fd = self._release_waiting_reader()
+                if fd is not None:
+                    os.close(fd)
@@ -0,0 +1,182 @@
+import ollama
+import cv2
+import re
+import os
+import time
+import random
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from .verdicts import VerdictCache, frame_phash, prompt_key
+from .metrics import pipeline_metrics
+
+logger = logging.getLogger(__name__)
+
+# Defaults can be overridden from the server .env
+DEFAULT_MODEL = os.getenv("OLLAMA_MODEL", "llava:34b")
+DEFAULT_MAX_IN_FLIGHT = int(os.getenv("OLLAMA_MAX_IN_FLIGHT", 4))
+DEFAULT_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", 120))
+DEFAULT_MAX_RETRIES = int(os.getenv("OLLAMA_MAX_RETRIES", 3))
+DEFAULT_RETRY_BACKOFF = float(os.getenv("OLLAMA_RETRY_BACKOFF", 1.0))
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") != "0"
+
+# Placeholder responses returned when no real model answer was obtained
+NONE_FRAME_RESPONSE = "Error: Input frame was None."
+MODEL_ERROR_RESPONSE = "Error in model processing."
+ERROR_RESPONSES = (NONE_FRAME_RESPONSE, MODEL_ERROR_RESPONSE)
+
+
+def parse_detection_response(model_response_content):
+    """Returns True if the model response means man-made objects were detected."""
+    return not re.search(r'False', model_response_content, re.IGNORECASE)
+
+
+class OllamaDetector:
+    """
+    Sends object-detection prompts to an Ollama server with a reusable client.
+
+    Up to `max_in_flight` requests run concurrently on background threads through `submit`,
+    which returns a Future so callers can keep several frames in flight and still consume
+    results in frame order. Failed requests are retried with exponential backoff.
+
+    With a VerdictCache attached, frames perceptually close to one already judged under the
+    same prompt reuse that verdict without calling the model.
+    """
+
+    def __init__(self, host=None, model=DEFAULT_MODEL, max_in_flight=DEFAULT_MAX_IN_FLIGHT,
+                 timeout=DEFAULT_TIMEOUT, max_retries=DEFAULT_MAX_RETRIES, retry_backoff=DEFAULT_RETRY_BACKOFF,
+                 cache: VerdictCache = None):
+        self.host = host # None lets the ollama client use OLLAMA_HOST or its default
+        self.model = model
+        self.max_in_flight = max(1, int(max_in_flight))
+        self.timeout = timeout
+        self.max_retries = max(0, int(max_retries))
+        self.retry_backoff = retry_backoff
+        self.cache = cache
+        self._in_flight = {} # (prompt key, phash) -> Future, so near-duplicate frames share one request
+        self._in_flight_lock = threading.Lock()
+        self._client = None
+        self._executor = None
+
+    def __getstate__(self):
+        # The HTTP client and thread pool are recreated lazily in the receiving process
+        state = self.__dict__.copy()
+        state['_client'] = None
+        state['_executor'] = None
+        state['_in_flight'] = {}
+        state['_in_flight_lock'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._in_flight_lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = ollama.Client(host=self.host, timeout=self.timeout)
+        return self._client
+
+    def _chat(self, image_bytes, model_prompt_content):
+        for attempt in range(self.max_retries + 1):
+            try:
+                res = self.client.chat(
+                    model=self.model,
+                    messages=[
+                        {
+                            'role': 'user',
+                            'content': model_prompt_content,
+                            'images': [image_bytes]
+                        }
+                    ]
+                )
+                return res['message']['content']
+            except ollama.ResponseError as e:
+                # 4xx (e.g. unknown model) won't succeed on retry
+                if (e.status_code is not None and 400 <= e.status_code < 500) or attempt == self.max_retries:
+                    raise
+                error = e
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise
+                error = e
+            delay = self.retry_backoff * (2 ** attempt) * (1 + random.random() * 0.25)
+            logger.warning(f"Ollama request failed ({error}); retrying in {delay:.1f}s ({attempt + 1}/{self.max_retries}).")
+            time.sleep(delay)
+
+    def detect(self, frame_cv, model_prompt_content):
+        """
+        Blocking object detection for one frame.
+        Returns: (bool indicating if man-made objects detected, str response from model)
+        """
+        if frame_cv is None:
+            logger.error("modelObjectDetection: Input frame is None.")
+            return True, NONE_FRAME_RESPONSE # Default to objects_detected = True to avoid filtering good images due to error
+
+        cache_key = phash = None
+        if self.cache is not None:
+            cache_key, phash = prompt_key(self.model, model_prompt_content), frame_phash(frame_cv)
+            cached = self.cache.get(cache_key, phash)
+            if cached is not None:
+                return cached
+
+        try:
+            with pipeline_metrics.timer("llm_call"): # Includes retries; failed calls are counted as errors
+                _, buffer = cv2.imencode('.jpg', frame_cv)
+                model_response_content = self._chat(buffer.tobytes(), model_prompt_content)
+        except Exception as e:
+            logger.error(f"Error in modelObjectDetection with Ollama: {e}")
+            # Keep objects_detected = True to be safe; errors are never cached
+            return True, MODEL_ERROR_RESPONSE
+        objects_detected = parse_detection_response(model_response_content)
+        if self.cache is not None:
+            self.cache.put(cache_key, phash, objects_detected, model_response_content)
+        return objects_detected, model_response_content
+
+    def cached_result(self, frame_cv, model_prompt_content):
+        """Returns the cached verdict for a frame without contacting the model, or None."""
+        if self.cache is None or frame_cv is None:
+            return None
+        return self.cache.get(prompt_key(self.model, model_prompt_content), frame_phash(frame_cv))
+
+    def submit(self, frame_cv, model_prompt_content) -> Future:
+        """Queues detection for a frame on the request pool. The Future resolves to detect()'s result."""
+        cached = self.cached_result(frame_cv, model_prompt_content)
+        if cached is not None:
+            future = Future()
+            future.set_result(cached)
+            return future
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix="ollama")
+        if self.cache is None or frame_cv is None:
+            return self._executor.submit(self.detect, frame_cv, model_prompt_content)
+
+        # A near-identical frame may already be waiting on the model; share its answer
+        cache_key, phash = prompt_key(self.model, model_prompt_content), frame_phash(frame_cv)
+        with self._in_flight_lock:
+            for (other_key, other_hash), future in self._in_flight.items():
+                if other_key == cache_key and bin(other_hash ^ phash).count("1") <= self.cache.max_distance:
+                    return future
+            future = self._executor.submit(self.detect, frame_cv, model_prompt_content)
+            self._in_flight[(cache_key, phash)] = future
+        future.add_done_callback(lambda _: self._forget_in_flight((cache_key, phash)))
+        return future
+
+    def _forget_in_flight(self, in_flight_key):
+        with self._in_flight_lock:
+            self._in_flight.pop(in_flight_key, None)
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+_default_detector = None
+
+def get_default_detector():
+    """Shared detector (and HTTP client) for callers that don't pass their own."""
+    global _default_detector
+    if _default_detector is None:
+        _default_detector = OllamaDetector(cache=VerdictCache() if LLM_CACHE_ENABLED else None)
+    return _default_detector
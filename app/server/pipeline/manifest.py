@@ -0,0 +1,191 @@
+import csv
+import json
+import logging
+from pathlib import Path
+
+from .archive import iter_directory_entries, stream_zip
+from .video import VideoFrameSource
+from .writer import FrameWriter, encode_frame
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FORMATS = ("csv", "jsonl", "parquet")
+MANIFEST_FIELDS = (
+    "frame_index", "raw_frame_name", "realsense_frame_name", "accepted",
+    "category", "matched_pattern", "match_score", "rejection_reason",
+)
+RESULTS_INFO_FILENAME = "results_info.json"
+# Frames further apart than this are reached by seeking instead of decoding every frame in between
+EXTRACT_SEEK_GAP = 250
+
+
+def check_manifest_format(manifest_format):
+    """Raises if a manifest format is unknown or its optional dependency is missing."""
+    if manifest_format not in MANIFEST_FORMATS:
+        raise ValueError(f"Unsupported manifest format '{manifest_format}', expected one of {MANIFEST_FORMATS}")
+    if manifest_format == "parquet":
+        try:
+            import pyarrow # noqa: F401
+        except ImportError:
+            raise ImportError("Parquet manifests need pyarrow (pip install pyarrow); use csv or jsonl otherwise.")
+
+
+def manifest_row(pair):
+    """One manifest record for a processed frame pair."""
+    return {
+        "frame_index": pair.index,
+        "raw_frame_name": pair.raw_frame_name,
+        "realsense_frame_name": pair.realsense_frame_name,
+        "accepted": pair.accepted,
+        "category": pair.category if pair.accepted else None,
+        "matched_pattern": pair.matched_pattern,
+        "match_score": pair.match_score,
+        "rejection_reason": pair.rejection_reason,
+    }
+
+
+def write_manifest(rows, output_dir, manifest_format="csv"):
+    """Writes manifest rows to <output_dir>/manifest.<format>. Returns: path of the manifest."""
+    check_manifest_format(manifest_format)
+    path = Path(output_dir) / f"manifest.{manifest_format}"
+    if manifest_format == "csv":
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=MANIFEST_FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+    elif manifest_format == "jsonl":
+        with open(path, "w") as f:
+            for row in rows:
+                f.write(json.dumps(row) + "\n")
+    else:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        pq.write_table(pa.Table.from_pylist(list(rows)), path)
+    return path
+
+
+def _parse_csv_row(row):
+    parsed = {key: (value if value != "" else None) for key, value in row.items()}
+    parsed["frame_index"] = int(parsed["frame_index"])
+    parsed["accepted"] = parsed["accepted"] == "True"
+    if parsed["match_score"] is not None:
+        parsed["match_score"] = int(parsed["match_score"])
+    return parsed
+
+
+def read_manifest(path):
+    """Reads a manifest written by write_manifest. Returns: list of row dicts."""
+    path = Path(path)
+    if path.suffix == ".csv":
+        with open(path, newline="") as f:
+            return [_parse_csv_row(row) for row in csv.DictReader(f)]
+    if path.suffix == ".jsonl":
+        with open(path) as f:
+            return [json.loads(line) for line in f if line.strip()]
+    if path.suffix == ".parquet":
+        import pyarrow.parquet as pq
+        return pq.read_table(path).to_pylist()
+    raise ValueError(f"Unknown manifest file type: {path}")
+
+
+def select_manifest_rows(rows, category=None, start_frame=None, stop_frame=None):
+    """Accepted rows, optionally limited to one category and/or frame indices [start_frame, stop_frame)."""
+    return [
+        row for row in rows
+        if row["accepted"]
+        and (category is None or row["category"] == category)
+        and (start_frame is None or row["frame_index"] >= start_frame)
+        and (stop_frame is None or row["frame_index"] < stop_frame)
+    ]
+
+
+def write_results_info(job_dir, info):
+    """Records what lazy extraction needs (source videos, decode and output formats) next to the job output."""
+    with open(Path(job_dir) / RESULTS_INFO_FILENAME, "w") as f:
+        json.dump(info, f, indent=2)
+
+
+def load_results_info(job_dir):
+    path = Path(job_dir) / RESULTS_INFO_FILENAME
+    if not path.exists():
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def iter_manifest_frames(info, rows):
+    """
+    Decodes the frames of the given manifest rows from the source videos, in frame order.
+    Yields: (row, raw_frame_cv, realsense_frame_cv)
+    """
+    rows = sorted(rows, key=lambda row: row["frame_index"])
+    if not rows:
+        return
+    cap_raw = cap_realsense = None
+    position = None # Index of the frame the next grab() returns
+    try:
+        for row in rows:
+            index = row["frame_index"]
+            if position is None or index < position or index - position > EXTRACT_SEEK_GAP:
+                for cap in (cap_raw, cap_realsense):
+                    if cap is not None:
+                        cap.release()
+                cap_raw = VideoFrameSource(info["raw_video"], index)
+                cap_realsense = VideoFrameSource(info["realsense_video"], index, gray=info.get("realsense_gray", False))
+                position = index
+            while position <= index:
+                if not cap_raw.grab() or not cap_realsense.grab():
+                    logger.warning(f"Videos ended before frame {index}; stopping extraction.")
+                    return
+                position += 1
+            yield row, cap_raw.retrieve(), cap_realsense.retrieve()
+    finally:
+        for cap in (cap_raw, cap_realsense):
+            if cap is not None:
+                cap.release()
+
+
+def stream_manifest_results(job_dir, output_dir, category=None, start_frame=None, stop_frame=None):
+    """
+    Streams a results zip for a manifest-mode job: the files in output_dir (manifest, removal
+    log) plus the selected accepted frames, decoded from the source videos on the fly.
+    """
+    info = load_results_info(job_dir)
+    if info is None:
+        raise FileNotFoundError(f"No {RESULTS_INFO_FILENAME} in {job_dir}")
+    rows = select_manifest_rows(read_manifest(Path(output_dir) / info["manifest"]), category, start_frame, stop_frame)
+    missing = [path for path in (info["raw_video"], info["realsense_video"]) if not Path(path).exists()]
+    if rows and missing:
+        raise FileNotFoundError(f"Source videos no longer available: {missing}")
+
+    def entries():
+        for file_path, arcname in iter_directory_entries(output_dir):
+            yield arcname, file_path
+        for row, raw_frame_cv, realsense_frame_cv in iter_manifest_frames(info, rows):
+            folder = Path(row["category"])
+            yield folder / "raw" / row["raw_frame_name"], encode_frame(raw_frame_cv, info["image_format"], info.get("png_compression"))
+            yield folder / "realsense" / row["realsense_frame_name"], encode_frame(realsense_frame_cv, info["depth_format"], info.get("png_compression"))
+
+    return stream_zip(entries())
+
+
+def extract_manifest_frames(job_dir, output_dir, target_dir, category=None, start_frame=None, stop_frame=None):
+    """
+    Writes the selected accepted frames of a manifest-mode job into <target_dir>/<category>/{raw,realsense}/.
+    Returns: number of frame pairs written.
+    """
+    info = load_results_info(job_dir)
+    if info is None:
+        raise FileNotFoundError(f"No {RESULTS_INFO_FILENAME} in {job_dir}")
+    rows = select_manifest_rows(read_manifest(Path(output_dir) / info["manifest"]), category, start_frame, stop_frame)
+    writer = FrameWriter(target_dir, info["image_format"], info["depth_format"], info.get("png_compression"))
+    count = 0
+    try:
+        for row, raw_frame_cv, realsense_frame_cv in iter_manifest_frames(info, rows):
+            writer.write(row["category"], raw_frame_cv, row["raw_frame_name"], realsense_frame_cv, row["realsense_frame_name"])
+            count += 1
+        writer.close()
+    except BaseException:
+        writer.close(discard=True)
+        raise
+    return count
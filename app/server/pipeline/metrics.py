@@ -0,0 +1,181 @@
+import time
+import threading
+from contextlib import contextmanager
+
+# Operations timed by the pipeline, in the order they are reported
+OPERATIONS = ("decode", "solid_color", "llm_call", "sift_extract", "sift_match", "image_write", "zip")
+# Upper bounds (seconds) of the latency histogram buckets; a final +Inf bucket is implied
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+METRICS_FILENAME = "metrics.json"
+
+
+def empty_metrics():
+    return {'operations': {}, 'counters': {}, 'rejections': {}}
+
+
+def _empty_operation():
+    return {'count': 0, 'errors': 0, 'sum_seconds': 0.0, 'buckets': [0] * (len(LATENCY_BUCKETS) + 1)}
+
+
+class PipelineMetrics:
+    """
+    Counters and latency histograms for the pipeline's operations (decoding, each check, LLM
+    calls, SIFT, image writes, zipping), safe to update from writer and LLM threads.
+
+    Snapshots are plain dicts, so worker processes can return them or write them to JSON,
+    and merge_metrics adds them up per job, per session or for the whole server.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = empty_metrics()
+
+    def observe(self, operation, seconds, error=False):
+        bucket = next((i for i, bound in enumerate(LATENCY_BUCKETS) if seconds <= bound), len(LATENCY_BUCKETS))
+        with self._lock:
+            entry = self._data['operations'].setdefault(operation, _empty_operation())
+            entry['count'] += 1
+            entry['errors'] += int(error)
+            entry['sum_seconds'] += seconds
+            entry['buckets'][bucket] += 1
+
+    @contextmanager
+    def timer(self, operation):
+        """Times the enclosed block; exceptions raised inside are counted as errors."""
+        started = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.observe(operation, time.perf_counter() - started, error=True)
+            raise
+        self.observe(operation, time.perf_counter() - started)
+
+    def count(self, counter, amount=1):
+        with self._lock:
+            self._data['counters'][counter] = self._data['counters'].get(counter, 0) + amount
+
+    def count_rejection(self, stage_name, amount=1):
+        with self._lock:
+            self._data['rejections'][stage_name] = self._data['rejections'].get(stage_name, 0) + amount
+
+    def merge(self, snapshot):
+        with self._lock:
+            _merge_into(self._data, snapshot)
+
+    def snapshot(self, reset=False):
+        with self._lock:
+            data = _copy(self._data)
+            if reset:
+                self._data = empty_metrics()
+        return data
+
+
+def _copy(snapshot):
+    return {
+        'operations': {name: dict(entry, buckets=list(entry['buckets'])) for name, entry in snapshot['operations'].items()},
+        'counters': dict(snapshot['counters']),
+        'rejections': dict(snapshot['rejections']),
+    }
+
+
+def _merge_into(total, snapshot):
+    for name, entry in snapshot.get('operations', {}).items():
+        merged = total['operations'].setdefault(name, _empty_operation())
+        for key in ('count', 'errors', 'sum_seconds'):
+            merged[key] += entry[key]
+        merged['buckets'] = [a + b for a, b in zip(merged['buckets'], entry['buckets'])]
+    for group in ('counters', 'rejections'):
+        for name, value in snapshot.get(group, {}).items():
+            total[group][name] = total[group].get(name, 0) + value
+
+
+def merge_metrics(snapshots):
+    """Adds up metrics snapshots, e.g. from a job's frame ranges or from all of a session's jobs."""
+    total = empty_metrics()
+    for snapshot in snapshots:
+        if snapshot:
+            _merge_into(total, snapshot)
+    return total
+
+
+def _bucket_quantile(entry, quantile):
+    """Estimates a latency quantile from histogram buckets (the upper bound of the bucket it falls in)."""
+    if not entry['count']:
+        return None
+    rank = quantile * entry['count']
+    seen = 0
+    for bound, bucket_count in zip(LATENCY_BUCKETS + (None,), entry['buckets']):
+        seen += bucket_count
+        if seen >= rank:
+            return bound if bound is not None else LATENCY_BUCKETS[-1]
+    return LATENCY_BUCKETS[-1]
+
+
+def summarize_metrics(snapshot):
+    """Readable form of a snapshot: per operation count, errors, total/mean seconds and approximate p50/p95."""
+    operations = {}
+    ordered = [name for name in OPERATIONS if name in snapshot['operations']]
+    ordered += sorted(name for name in snapshot['operations'] if name not in OPERATIONS)
+    for name in ordered:
+        entry = snapshot['operations'][name]
+        operations[name] = {
+            'count': entry['count'],
+            'errors': entry['errors'],
+            'total_seconds': entry['sum_seconds'],
+            'mean_seconds': entry['sum_seconds'] / entry['count'] if entry['count'] else None,
+            'p50_seconds': _bucket_quantile(entry, 0.5),
+            'p95_seconds': _bucket_quantile(entry, 0.95),
+        }
+    return {'operations': operations, 'counters': dict(snapshot['counters']), 'rejections': dict(snapshot['rejections'])}
+
+
+def _label_value(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_label_value(value)}"' for key, value in labels.items()) + "}"
+
+
+def format_prometheus(snapshot, extra_labels=None, prefix="pradd"):
+    """
+    Renders a metrics snapshot in the Prometheus text exposition format: one latency
+    histogram per operation plus the frame counters and per-stage rejection counters.
+    """
+    base = dict(extra_labels or {})
+    lines = [
+        f"# HELP {prefix}_operation_duration_seconds Time spent per pipeline operation.",
+        f"# TYPE {prefix}_operation_duration_seconds histogram",
+    ]
+    for name, entry in snapshot['operations'].items():
+        labels = dict(base, operation=name)
+        cumulative = 0
+        for bound, bucket_count in zip(LATENCY_BUCKETS + (None,), entry['buckets']):
+            cumulative += bucket_count
+            le = "+Inf" if bound is None else repr(bound)
+            lines.append(f"{prefix}_operation_duration_seconds_bucket{_format_labels(dict(labels, le=le))} {cumulative}")
+        lines.append(f"{prefix}_operation_duration_seconds_sum{_format_labels(labels)} {entry['sum_seconds']}")
+        lines.append(f"{prefix}_operation_duration_seconds_count{_format_labels(labels)} {entry['count']}")
+    lines += [
+        f"# HELP {prefix}_operation_errors_total Pipeline operations that failed.",
+        f"# TYPE {prefix}_operation_errors_total counter",
+    ]
+    for name, entry in snapshot['operations'].items():
+        lines.append(f"{prefix}_operation_errors_total{_format_labels(dict(base, operation=name))} {entry['errors']}")
+    for counter, value in sorted(snapshot['counters'].items()):
+        lines.append(f"# TYPE {prefix}_{counter}_total counter")
+        lines.append(f"{prefix}_{counter}_total{_format_labels(base)} {value}")
+    lines += [
+        f"# HELP {prefix}_frames_rejected_total Frames rejected, by the stage that rejected them.",
+        f"# TYPE {prefix}_frames_rejected_total counter",
+    ]
+    for stage_name, value in sorted(snapshot['rejections'].items()):
+        lines.append(f"{prefix}_frames_rejected_total{_format_labels(dict(base, stage=stage_name))} {value}")
+    return "\n".join(lines) + "\n"
+
+
+# Process-wide recorder. A pipeline process works on one job (or frame range) at a time,
+# so process_video_frames and _process_frame_range reset it and collect what it recorded.
+pipeline_metrics = PipelineMetrics()
@@ -0,0 +1,265 @@
+import cv2
+import numpy as np
+import os
+import hashlib
+import logging
+import threading
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+# One SIFT extractor per thread; cv2.SIFT_create() is not free and was previously called per frame
+_sift_local = threading.local()
+
+def get_sift():
+    """Returns a SIFT extractor reused across calls on the current thread."""
+    sift = getattr(_sift_local, "sift", None)
+    if sift is None:
+        sift = cv2.SIFT_create()
+        _sift_local.sift = sift
+    return sift
+
+
+class PatternFeatures(NamedTuple):
+    """SIFT features extracted from a single pattern image."""
+    name: str
+    keypoints: np.ndarray # (N, 2) keypoint coordinates, kept as an array so it can be pickled
+    descriptors: np.ndarray # (N, 128) float32 SIFT descriptors
+
+
+def extract_pattern_features(pattern_img_gray, pattern_name):
+    """
+    Runs SIFT on a grayscale pattern image.
+    Returns: PatternFeatures, or None if no descriptors could be extracted.
+    """
+    if pattern_img_gray is None:
+        logger.warning(f"Skipping None pattern image: {pattern_name}")
+        return None
+    try:
+        keypoints, descriptors = get_sift().detectAndCompute(pattern_img_gray, None)
+    except cv2.error as e:
+        logger.error(f"SIFT error on pattern image {pattern_name}: {e}")
+        return None
+
+    if descriptors is None or keypoints is None or len(keypoints) == 0:
+        logger.warning(f"No SIFT descriptors found for pattern: {pattern_name}")
+        return None
+    return PatternFeatures(pattern_name, cv2.KeyPoint_convert(keypoints), descriptors)
+
+
+# Process-wide cache of extracted pattern features, keyed by file path.
+# Each entry remembers the (mtime, size) it was computed from so a replaced file is re-extracted.
+_pattern_feature_cache = {}
+_pattern_feature_cache_lock = threading.Lock()
+
+def _file_signature(path_str):
+    stat = os.stat(path_str)
+    return (stat.st_mtime_ns, stat.st_size)
+
+def load_pattern_features(path_str):
+    """Loads (or returns the cached) SIFT features for the pattern image at path_str."""
+    try:
+        signature = _file_signature(path_str)
+    except OSError as e:
+        logger.warning(f"Could not stat pattern image {path_str}: {e}")
+        return None
+
+    with _pattern_feature_cache_lock:
+        cached = _pattern_feature_cache.get(path_str)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+
+    pattern_cv_img = cv2.imread(path_str)
+    if pattern_cv_img is None:
+        logger.warning(f"Could not load pattern image: {path_str}")
+        return None
+    pattern_cv_gray = cv2.cvtColor(pattern_cv_img, cv2.COLOR_BGR2GRAY)
+    features = extract_pattern_features(pattern_cv_gray, Path(path_str).name)
+
+    with _pattern_feature_cache_lock:
+        _pattern_feature_cache[path_str] = (signature, features)
+    return features
+
+def invalidate_pattern_cache(pattern_paths=None):
+    """
+    Drops cached pattern features.
+    Args:
+        pattern_paths (list or None): Paths to forget. None clears the whole cache.
+    """
+    with _pattern_feature_cache_lock:
+        if pattern_paths is None:
+            _pattern_feature_cache.clear()
+            return
+        for path_str in pattern_paths:
+            _pattern_feature_cache.pop(str(path_str), None)
+
+
+# Libraries with at least this many stacked descriptors (roughly 10-40 patterns) are matched through
+# one approximate k-NN index instead of exactly; 0 always matches exactly
+FLANN_MIN_DESCRIPTORS = int(os.getenv("PATTERN_FLANN_MIN_DESCRIPTORS", 4000))
+FLANN_INDEX_KDTREE = 1
+FLANN_TREES = 4
+FLANN_CHECKS = 64 # Leaves searched per query; fixed, so query time barely grows with the library
+KNN_CANDIDATES = 8 # Nearest library descriptors fetched per frame descriptor
+# Frame descriptors compared with the whole library at once; bounds the distance matrix to ~16 MB
+_EXACT_MATCH_CELLS = 4 * 1024 * 1024
+# Part of the library fingerprint, so features stored by another matching method aren't reused
+_MATCHING_VERSION = b"per-pattern-cross-check"
+_KNN_MATCHING_VERSION = f"knn-cross-check-{KNN_CANDIDATES}-{FLANN_TREES}-{FLANN_CHECKS}".encode()
+
+
+class PatternLibrary:
+    """
+    Holds precomputed SIFT keypoints/descriptors for a set of pattern images so that
+    each pattern is extracted once per job (or once per process, via the feature cache)
+    instead of once per video frame.
+
+    All pattern descriptors are stacked into one matrix with a parallel pattern-ID array.
+    Small libraries compare a frame with every pattern in one matrix product per block of
+    frame descriptors; large ones (see FLANN_MIN_DESCRIPTORS) query one KD-tree index over
+    the stacked descriptors, so matching cost grows sub-linearly with the number of patterns.
+    """
+
+    def __init__(self, patterns: Optional[list] = None, approximate: Optional[bool] = None):
+        """approximate: match through the k-NN index; by default when the library has FLANN_MIN_DESCRIPTORS or more."""
+        self.patterns = [p for p in (patterns or []) if p is not None]
+        if self.patterns:
+            self.stacked_descriptors = np.ascontiguousarray(np.vstack([p.descriptors for p in self.patterns]), dtype=np.float32)
+            self.pattern_ids = np.concatenate([np.full(len(p.descriptors), i, dtype=np.int32) for i, p in enumerate(self.patterns)])
+        else:
+            self.stacked_descriptors = np.empty((0, 128), dtype=np.float32)
+            self.pattern_ids = np.empty(0, dtype=np.int32)
+        # Where each pattern's rows start in stacked_descriptors, plus the total
+        self.block_bounds = np.concatenate([[0], np.cumsum([len(p.descriptors) for p in self.patterns])]).astype(np.int64)
+        self._squared_norms = np.einsum("ij,ij->i", self.stacked_descriptors, self.stacked_descriptors)
+        if approximate is None:
+            approximate = 0 < FLANN_MIN_DESCRIPTORS <= len(self.stacked_descriptors)
+        self.approximate = approximate
+        self._index = None # FLANN index over stacked_descriptors, built on first use
+        self._fingerprint = None
+
+    @property
+    def fingerprint(self):
+        """Content hash of the library, used to key stored match results."""
+        if self._fingerprint is None:
+            digest = hashlib.sha1(_KNN_MATCHING_VERSION if self.approximate else _MATCHING_VERSION)
+            for pattern in self.patterns:
+                digest.update(pattern.name.encode("utf-8"))
+                digest.update(pattern.descriptors.tobytes())
+            self._fingerprint = digest.hexdigest()
+        return self._fingerprint
+
+    def __getstate__(self):
+        # cv2 indexes can't be pickled; the index is rebuilt lazily in the receiving process
+        state = self.__dict__.copy()
+        state['_index'] = None
+        return state
+
+    def match_distances(self, test_descriptors):
+        """
+        Cross-checked matches between frame descriptors and each pattern, as
+        cv2.BFMatcher(cv2.NORM_L2, crossCheck=True).match(frame, pattern) gives them: a frame
+        descriptor and a pattern descriptor match when each is the other's nearest neighbour
+        among that pattern's descriptors and the frame's. Patterns don't compete, so a frame
+        descriptor can match one descriptor of every pattern.
+
+        Approximate libraries (large ones by default) only check each frame descriptor against the
+        patterns among its KNN_CANDIDATES nearest library descriptors, found approximately.
+        Weak matches to patterns that other patterns' descriptors crowd out are dropped, so
+        counts are slightly lower than exact ones, mostly for patterns that aren't the best match.
+        Returns: (pattern_ids, distances) numpy arrays, one entry per match.
+        """
+        if not self.patterns or test_descriptors is None or len(test_descriptors) == 0:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+        test_descriptors = np.ascontiguousarray(test_descriptors, dtype=np.float32)
+        if self.approximate:
+            frame_idx, pattern_idx = self._mutual_matches_knn(test_descriptors)
+        else:
+            frame_idx, pattern_idx = self._mutual_matches_exact(test_descriptors)
+        distances = np.linalg.norm(test_descriptors[frame_idx] - self.stacked_descriptors[pattern_idx], axis=1).astype(np.float32)
+        return self.pattern_ids[pattern_idx], distances
+
+    def _mutual_matches_exact(self, test_descriptors):
+        """Returns: (frame descriptor, stacked descriptor) index arrays of the cross-checked pairs."""
+        num_stacked = len(self.stacked_descriptors)
+        # forward[f, p]: pattern p's descriptor nearest to frame descriptor f; reverse[d]: frame descriptor nearest to d
+        forward = np.empty((len(test_descriptors), len(self.patterns)), dtype=np.int64)
+        reverse = np.zeros(num_stacked, dtype=np.int64)
+        reverse_distances = np.full(num_stacked, np.inf, dtype=np.float32)
+        test_norms = np.einsum("ij,ij->i", test_descriptors, test_descriptors)
+        columns = np.arange(num_stacked)
+        block_rows = max(1, _EXACT_MATCH_CELLS // num_stacked)
+        for first in range(0, len(test_descriptors), block_rows):
+            block = slice(first, first + block_rows)
+            # Squared L2 distances of this block of frame descriptors to every pattern descriptor
+            squared = test_norms[block, None] + self._squared_norms[None, :] - 2.0 * (test_descriptors[block] @ self.stacked_descriptors.T)
+            for p, (start, stop) in enumerate(zip(self.block_bounds[:-1], self.block_bounds[1:])):
+                forward[block, p] = start + np.argmin(squared[:, start:stop], axis=1)
+            nearest = np.argmin(squared, axis=0)
+            nearest_distances = squared[nearest, columns]
+            closer = nearest_distances < reverse_distances
+            reverse[closer] = nearest[closer] + first
+            reverse_distances[closer] = nearest_distances[closer]
+
+        frame_idx = np.repeat(np.arange(len(test_descriptors)), len(self.patterns))
+        pattern_idx = forward.ravel()
+        mutual = reverse[pattern_idx] == frame_idx
+        return frame_idx[mutual], pattern_idx[mutual]
+
+    def _mutual_matches_knn(self, test_descriptors):
+        """
+        Cross-check restricted to k-NN candidates: one query returns each frame descriptor's
+        nearest library descriptors, nearest first. The first candidate of each pattern is the
+        frame descriptor's nearest in that pattern, and the nearest frame descriptor to a library
+        descriptor is taken among the frame descriptors that returned it.
+        Returns: (frame descriptor, stacked descriptor) index arrays of the cross-checked pairs.
+        """
+        if self._index is None:
+            self._index = cv2.flann_Index(self.stacked_descriptors, dict(algorithm=FLANN_INDEX_KDTREE, trees=FLANN_TREES))
+        k = min(KNN_CANDIDATES, len(self.stacked_descriptors))
+        candidates, candidate_distances = self._index.knnSearch(test_descriptors, k, params=dict(checks=FLANN_CHECKS))
+        candidates = candidates.astype(np.int64)
+        # Keep each frame descriptor's first (nearest) candidate of every pattern
+        candidate_patterns = self.pattern_ids[np.maximum(candidates, 0)]
+        first_of_pattern = candidates >= 0
+        for j in range(1, k):
+            first_of_pattern[:, j] &= (candidate_patterns[:, :j] != candidate_patterns[:, j:j + 1]).all(axis=1)
+
+        frame_idx = np.repeat(np.arange(len(test_descriptors)), k)
+        pattern_idx, pair_distances = candidates.ravel(), candidate_distances.ravel()
+        returned = pattern_idx >= 0
+        # Nearest frame descriptor to each library descriptor: sort the pairs by library descriptor, then distance
+        order = np.lexsort((pair_distances[returned], pattern_idx[returned]))
+        sorted_patterns, sorted_frames = pattern_idx[returned][order], frame_idx[returned][order]
+        nearest_first = np.concatenate([[True], sorted_patterns[1:] != sorted_patterns[:-1]])
+        reverse = np.full(len(self.stacked_descriptors), -1, dtype=np.int64)
+        reverse[sorted_patterns[nearest_first]] = sorted_frames[nearest_first]
+
+        mutual = first_of_pattern.ravel() & (reverse[np.maximum(pattern_idx, 0)] == frame_idx)
+        return frame_idx[mutual], pattern_idx[mutual]
+
+    def good_match_counts(self, test_descriptors, threshold_match_val):
+        """Returns an array with the number of matches closer than threshold_match_val for each pattern."""
+        pattern_ids, distances = self.match_distances(test_descriptors)
+        return np.bincount(pattern_ids[distances < threshold_match_val], minlength=len(self.patterns))
+
+    @classmethod
+    def from_paths(cls, pattern_image_paths, approximate=None):
+        """Builds a library from image files, reusing cached features where possible."""
+        return cls([load_pattern_features(str(p)) for p in pattern_image_paths], approximate)
+
+    @classmethod
+    def from_images(cls, loaded_pattern_images_data):
+        """Builds a library from a list of (pattern_cv_gray, pattern_name) tuples."""
+        return cls([extract_pattern_features(img, name) for img, name in loaded_pattern_images_data])
+
+    @property
+    def names(self):
+        return [p.name for p in self.patterns]
+
+    def __len__(self):
+        return len(self.patterns)
+
+    def __bool__(self):
+        return len(self.patterns) > 0
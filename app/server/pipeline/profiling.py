@@ -0,0 +1,124 @@
+import os
+import sys
+import cProfile
+import pstats
+import threading
+import logging
+from collections import Counter
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Defaults can be overridden from the server .env
+DEFAULT_PROFILE_SAMPLE_INTERVAL = float(os.getenv("PIPELINE_PROFILE_SAMPLE_INTERVAL", 0.005)) # Seconds between stack samples
+PROFILE_DIRNAME = "profile"
+PROFILE_STATS_FILENAME = "profile.pstats"
+PROFILE_STACKS_FILENAME = "profile.collapsed"
+PROFILE_SUMMARY_FILENAME = "profile.txt"
+PROFILE_SUMMARY_LINES = 60
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class PipelineProfiler:
+    """
+    Profiles the enclosed block of one process and writes two files into profile_dir:
+
+    - <name>.pstats: deterministic cProfile statistics of the thread that entered the block,
+      for `python -m pstats` or snakeviz.
+    - <name>.collapsed: wall-clock stack samples of every thread in the process, taken every
+      sample_interval seconds, in the collapsed-stack format of flamegraph.pl and speedscope.
+      Stacks start with `name` and the thread name, so files from several processes can be
+      concatenated; threads waiting (e.g. on LLM responses or the writer queue) are included.
+
+    Both add overhead, so this is only meant for jobs started with profiling requested.
+    """
+
+    def __init__(self, profile_dir, name, sample_interval=DEFAULT_PROFILE_SAMPLE_INTERVAL):
+        self.profile_dir = Path(profile_dir)
+        self.name = name
+        self.sample_interval = sample_interval
+        self.samples = Counter()
+        self._profile = None
+        self._stop = threading.Event()
+        self._sampler = None
+
+    def __enter__(self):
+        self._sampler = threading.Thread(target=self._sample, name=f"profiler-{self.name}", daemon=True)
+        self._sampler.start()
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._profile.disable()
+        self._stop.set()
+        self._sampler.join()
+        try:
+            self.write()
+        except OSError as e:
+            logger.error(f"Could not write profile {self.name} to {self.profile_dir}: {e}")
+
+    def _sample(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.sample_interval):
+            thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                stack += [thread_names.get(thread_id, f"thread-{thread_id}"), self.name]
+                self.samples[";".join(reversed(stack))] += 1
+
+    def write(self):
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        self._profile.dump_stats(str(self.profile_dir / f"{self.name}.pstats"))
+        with open(self.profile_dir / f"{self.name}.collapsed", "w") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+def profile_call(profile_dir, name, func, /, *args, **kwargs):
+    """Runs func(*args, **kwargs) under a PipelineProfiler. Picklable, so it can be submitted to a process pool."""
+    with PipelineProfiler(profile_dir, name):
+        return func(*args, **kwargs)
+
+
+def combine_profiles(profile_dir):
+    """
+    Merges the per-process profiles in profile_dir into profile.pstats and profile.collapsed,
+    plus profile.txt listing the functions with the most cumulative time.
+    Returns: the paths written, or [] if there was nothing to combine.
+    """
+    profile_dir = Path(profile_dir)
+    combined = (PROFILE_STATS_FILENAME, PROFILE_STACKS_FILENAME)
+    stats_paths = sorted(path for path in profile_dir.glob("*.pstats") if path.name not in combined)
+    if not stats_paths:
+        return []
+    stats = pstats.Stats(*map(str, stats_paths))
+    stats.dump_stats(str(profile_dir / PROFILE_STATS_FILENAME))
+    with open(profile_dir / PROFILE_SUMMARY_FILENAME, "w") as f:
+        pstats.Stats(str(profile_dir / PROFILE_STATS_FILENAME), stream=f).sort_stats("cumulative").print_stats(PROFILE_SUMMARY_LINES)
+
+    with open(profile_dir / PROFILE_STACKS_FILENAME, "w") as out:
+        for path in sorted(profile_dir.glob("*.collapsed")):
+            if path.name not in combined:
+                out.write(path.read_text())
+    return [profile_dir / name for name in combined + (PROFILE_SUMMARY_FILENAME,)]
+
+
+def profile_job(profile_dir, func, /, *args, **kwargs):
+    """
+    Runs a whole job, func(*args, **kwargs), under a PipelineProfiler and then combines its
+    profile with those of any frame range workers that wrote into the same profile_dir.
+    """
+    try:
+        return profile_call(profile_dir, "job", func, *args, **kwargs)
+    finally:
+        combine_profiles(profile_dir)
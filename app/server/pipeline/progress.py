@@ -0,0 +1,88 @@
+import os
+import time
+
+from .metrics import merge_metrics, summarize_metrics
+
+# How often each frame range publishes its progress; can be overridden from the server .env
+DEFAULT_PROGRESS_INTERVAL = float(os.getenv("PIPELINE_PROGRESS_INTERVAL", 0.5))
+_RANGE_PREFIX = "range-"
+
+
+class ProgressReporter:
+    """
+    Publishes one frame range's progress into a mapping shared with the server, e.g. a
+    multiprocessing Manager dict, which is what makes it visible across the job's processes.
+
+    Writes to a Manager dict are round trips to another process, so `update` can be called
+    for every frame but only publishes once per `interval` seconds (and when forced).
+    """
+
+    def __init__(self, sink, start_frame=0, interval=DEFAULT_PROGRESS_INTERVAL):
+        self.sink = sink
+        self.key = f"{_RANGE_PREFIX}{start_frame}"
+        self.interval = interval
+        self._last_publish = None
+
+    def update(self, frames_done, stage_timings, metrics=None, force=False):
+        if self.sink is None:
+            return
+        now = time.monotonic()
+        if not force and self._last_publish is not None and now - self._last_publish < self.interval:
+            return
+        self._last_publish = now
+        self.sink[self.key] = {
+            'frames_done': frames_done,
+            'stages': {name: dict(timing) for name, timing in stage_timings.items()},
+            'metrics': metrics.snapshot() if metrics is not None else None,
+        }
+
+
+def start_progress(sink, total_frames, ranges=1):
+    """Records job-wide facts once processing starts. total_frames may be None when it isn't known yet."""
+    if sink is not None:
+        sink['job'] = {'total_frames': total_frames or None, 'ranges': ranges, 'started': time.time()}
+
+
+def summarize_progress(snapshot, now=None):
+    """
+    Combines the entries published by a job's frame ranges.
+    Returns: {frames_done, total_frames, percent, elapsed_seconds, frames_per_second, eta_seconds, stages, metrics},
+    or None if processing hasn't started. Values that can't be known yet are None.
+    """
+    job = snapshot.get('job')
+    if job is None:
+        return None
+    now = time.time() if now is None else now
+    ranges = [entry for key, entry in snapshot.items() if key.startswith(_RANGE_PREFIX)]
+    frames_done = sum(entry['frames_done'] for entry in ranges)
+    total_frames = job['total_frames']
+    elapsed = max(0.0, now - job['started'])
+    frames_per_second = frames_done / elapsed if elapsed > 0 and frames_done else None
+
+    stages = {}
+    for entry in ranges:
+        for name, timing in entry['stages'].items():
+            total = stages.setdefault(name, {'count': 0, 'total_seconds': 0.0, 'rejected': 0, 'stored': 0})
+            for key in total:
+                total[key] += timing.get(key, 0)
+    for timing in stages.values():
+        # Per-worker rate while a frame is in the stage, and the job-wide rate it is actually getting through frames at
+        timing['mean_seconds'] = timing['total_seconds'] / timing['count'] if timing['count'] else None
+        timing['frames_per_second'] = timing['count'] / elapsed if elapsed > 0 else None
+
+    eta_seconds = percent = None
+    if total_frames:
+        # Container frame counts can be estimates, so clamp rather than report >100% or negative ETAs
+        percent = min(100.0, 100.0 * frames_done / total_frames)
+        if frames_per_second:
+            eta_seconds = max(0, total_frames - frames_done) / frames_per_second
+    return {
+        'frames_done': frames_done,
+        'total_frames': total_frames,
+        'percent': percent,
+        'elapsed_seconds': elapsed,
+        'frames_per_second': frames_per_second,
+        'eta_seconds': eta_seconds,
+        'stages': stages,
+        'metrics': summarize_metrics(merge_metrics(entry.get('metrics') for entry in ranges)),
+    }
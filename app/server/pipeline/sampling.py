@@ -0,0 +1,72 @@
+import os
+import logging
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Defaults can be overridden from the server .env
+DEFAULT_SAMPLING_MODE = os.getenv("PIPELINE_SAMPLING", "off").lower() # off, stride or scene
+DEFAULT_SAMPLING_STRIDE = int(os.getenv("PIPELINE_SAMPLING_STRIDE", 10)) # Frames per segment; the longest segment in scene mode
+DEFAULT_SCENE_CHANGE_THRESHOLD = float(os.getenv("PIPELINE_SCENE_CHANGE_THRESHOLD", 0.05)) # Mean absolute difference, 0-1
+SAMPLING_MODES = ("off", "stride", "scene")
+_SIGNATURE_WIDTH = 64
+
+
+def scene_signature(image_cv):
+    """Small grayscale copy of a frame that cheap scene-change checks compare."""
+    gray_image = image_cv if image_cv.ndim == 2 else cv2.cvtColor(image_cv, cv2.COLOR_BGR2GRAY)
+    height, width = gray_image.shape[:2]
+    size = (_SIGNATURE_WIDTH, max(1, round(height * _SIGNATURE_WIDTH / width)))
+    return cv2.resize(gray_image, size, interpolation=cv2.INTER_AREA).astype(np.float32)
+
+
+def scene_difference(signature_a, signature_b):
+    """Mean absolute difference of two scene signatures, from 0 (identical) to 1."""
+    return float(np.mean(np.abs(signature_a - signature_b))) / 255.0
+
+
+class FrameSampler:
+    """
+    Splits a frame range into segments of similar frames so only the first frame of each
+    segment (its representative) runs the pipeline stages; the other frames take its verdict.
+
+    - "stride": a new segment at every frame index that is a multiple of `stride`.
+    - "scene": a new segment when the RealSense analysis frame differs from the segment's
+      representative by more than `scene_threshold` (see scene_difference), and at every
+      multiple of `stride`, so verdicts are refreshed even in a static scene.
+    - "off": every frame is its own segment.
+
+    Segments are anchored to absolute frame indices, so a frame range (or resumed run)
+    starting at a segment start, e.g. a multiple of `stride` (see split_frame_ranges), samples
+    exactly as a serial run does. Use one sampler per frame range.
+    """
+
+    def __init__(self, mode=DEFAULT_SAMPLING_MODE, stride=DEFAULT_SAMPLING_STRIDE, scene_threshold=DEFAULT_SCENE_CHANGE_THRESHOLD):
+        if mode not in SAMPLING_MODES:
+            raise ValueError(f"Unknown sampling mode '{mode}', expected one of {SAMPLING_MODES}")
+        self.mode = mode
+        self.stride = max(1, int(stride))
+        self.scene_threshold = float(scene_threshold)
+        self._started = False
+        self._signature = None
+
+    @property
+    def enabled(self):
+        return self.mode != "off" and self.stride > 1
+
+    def starts_segment(self, pair) -> bool:
+        """Whether the pair (given in frame order) represents a new segment."""
+        if not self.enabled:
+            return True
+        signature = None
+        if self.mode == "scene":
+            frame = pair.realsense_analysis_cv
+            signature = scene_signature(frame) if frame is not None and frame.size else None
+        if self._started and pair.index % self.stride != 0:
+            if self.mode == "stride" or (signature is not None and self._signature is not None
+                                         and scene_difference(signature, self._signature) <= self.scene_threshold):
+                return False
+        self._started, self._signature = True, signature
+        return True
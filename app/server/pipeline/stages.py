@@ -0,0 +1,235 @@
+import time
+import logging
+from concurrent.futures import Future
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Rough seconds-per-frame guesses used to order stages until measured timings say otherwise
+DEFAULT_STAGE_COSTS = {
+    'Solid Color Detection': 0.001,
+    'Pattern Thresholding': 0.05,
+    'Model Object Detection': 2.0,
+}
+
+
+class FramePair:
+    """
+    A raw/RealSense frame pair moving through the pipeline stages.
+
+    Frames can be given directly or through loaders that are only invoked when a stage or
+    writer first needs pixels, so frames decided early (or entirely from stored features)
+    skip that decoding work. `raw_loader` returns the raw frame; `realsense_loader` returns
+    (full_resolution_frame, analysis_frame), where the analysis frame may be downscaled.
+    """
+
+    def __init__(self, index, raw_frame_cv, raw_frame_name, realsense_frame_cv, realsense_frame_name,
+                 raw_loader=None, realsense_loader=None, realsense_analysis_cv=None):
+        self.index = index
+        self._raw_frame_cv = raw_frame_cv
+        self.raw_frame_name = raw_frame_name
+        self._realsense_frame_cv = realsense_frame_cv
+        self._realsense_analysis_cv = realsense_analysis_cv
+        self.realsense_frame_name = realsense_frame_name
+        self._raw_loader = raw_loader
+        self._realsense_loader = realsense_loader
+        self.category = "Uncategorized" # Default if pattern matching is off or no match
+        self.matched_pattern: Optional[str] = None
+        self.match_score: Optional[int] = None # Good SIFT matches against matched_pattern (or the closest pattern)
+        self.rejection_reason: Optional[str] = None
+        self.next_stage = 0
+        self.pending: Optional[Future] = None # In-flight result for the stage at next_stage
+        self.pending_since = 0.0
+        self.representative: Optional["FramePair"] = None # With frame sampling, the analyzed pair whose verdict this one takes
+
+    @property
+    def accepted(self):
+        return self.rejection_reason is None
+
+    def load(self):
+        """Fetches any frames not loaded yet."""
+        self.raw_frame_cv
+        self.realsense_frame_cv
+
+    def detach(self, keep_pixels=None):
+        """
+        Called before the frame source moves on: pulls pixels the pair may still need
+        (by default, if it is accepted so far) and otherwise forgets the loaders.
+        """
+        if self.accepted if keep_pixels is None else keep_pixels:
+            self.load()
+        self._raw_loader = self._realsense_loader = None
+
+    def adopt_verdict(self):
+        """Takes the finished verdict (rejection, category, pattern match) of the representative pair, skipping every stage."""
+        source = self.representative
+        self.rejection_reason = source.rejection_reason
+        self.category, self.matched_pattern, self.match_score = source.category, source.matched_pattern, source.match_score
+        self.next_stage = source.next_stage
+
+    @property
+    def raw_frame_cv(self):
+        if self._raw_loader is not None:
+            self._raw_frame_cv = self._raw_loader()
+            self._raw_loader = None
+        return self._raw_frame_cv
+
+    def _load_realsense(self):
+        if self._realsense_loader is not None:
+            self._realsense_frame_cv, self._realsense_analysis_cv = self._realsense_loader()
+            self._realsense_loader = None
+
+    @property
+    def realsense_frame_cv(self):
+        """Full-resolution RealSense frame, as written to the output."""
+        self._load_realsense()
+        return self._realsense_frame_cv
+
+    @property
+    def realsense_analysis_cv(self):
+        """RealSense frame used by analysis stages; the full frame unless a smaller one was provided."""
+        self._load_realsense()
+        if self._realsense_analysis_cv is None:
+            return self._realsense_frame_cv
+        return self._realsense_analysis_cv
+
+
+class PipelineStage:
+    """
+    One step of frame processing.
+
+    Subclasses set `name`, `cost` (estimated seconds per frame) and `rejects` (whether the
+    stage can reject a frame, as opposed to only categorizing it). Work is split in two:
+    `extract` computes threshold-independent features from the frames (the expensive part,
+    which can be kept in a FeatureStore) and `decide` applies the thresholds to them.
+    Stages backed by a remote service can also implement `submit` so the executor can keep
+    several frames in flight.
+    """
+    name = "Stage"
+    cost = 0.0
+    rejects = True
+    # Distinguishes stored features computed under different settings (e.g. prompt or pattern set)
+    feature_variant = ""
+
+    def extract(self, pair: FramePair):
+        """Computes this stage's features for a frame pair."""
+        raise NotImplementedError
+
+    def decide(self, pair: FramePair, features) -> Optional[str]:
+        """
+        Applies thresholds to features, setting pair.category if the stage categorizes.
+        Returns: rejection reason, or None if the frame passes.
+        """
+        raise NotImplementedError
+
+    def submit(self, pair: FramePair) -> Optional[Future]:
+        """Starts extract() in the background. Returns None if the stage only runs synchronously."""
+        return None
+
+    def should_store(self, features) -> bool:
+        """Whether features are worth persisting (e.g. not an error placeholder)."""
+        return True
+
+    def run(self, pair: FramePair, prefetched=None) -> Optional[str]:
+        return self.decide(pair, self.extract(pair) if prefetched is None else prefetched)
+
+
+class StageExecutor:
+    """
+    Runs frame pairs through stages ordered cheapest-first, stopping at the first rejection.
+
+    Stages that can reject run first in order of cost, so an expensive stage never runs on a
+    frame a cheaper one would have thrown out; stages that only categorize run last, on
+    accepted frames. Wall time per stage is recorded so costs can be tuned from measurements.
+
+    With a FeatureStore, features already computed for a frame index are reused and new
+    ones are saved, so only the decision functions run again on a re-run.
+    """
+
+    def __init__(self, stages, stage_costs: dict = None, feature_store=None):
+        for stage in stages:
+            if stage_costs and stage.name in stage_costs:
+                stage.cost = float(stage_costs[stage.name])
+        self.stages = sorted(stages, key=lambda s: (not s.rejects, s.cost))
+        self.feature_store = feature_store
+        self.timings = {stage.name: {'count': 0, 'total_seconds': 0.0, 'rejected': 0, 'stored': 0} for stage in self.stages}
+
+    @property
+    def stage_names(self):
+        return [stage.name for stage in self.stages]
+
+    def _record(self, stage, seconds, rejection_reason, from_store):
+        timing = self.timings[stage.name]
+        timing['count'] += 1
+        timing['total_seconds'] += seconds
+        if rejection_reason is not None:
+            timing['rejected'] += 1
+        if from_store:
+            timing['stored'] += 1
+
+    def _stored_features(self, stage, pair):
+        if self.feature_store is None or pair.index is None:
+            return None
+        return self.feature_store.get(stage.name, stage.feature_variant, pair.index)
+
+    def advance(self, pair: FramePair, submit_async=True) -> bool:
+        """
+        Runs stages for a pair until it is rejected, all stages finish, or (with submit_async)
+        a stage hands its work to the background.
+        Returns: True when the pair is done, False if it is waiting on pair.pending.
+        """
+        while pair.accepted and pair.next_stage < len(self.stages):
+            stage = self.stages[pair.next_stage]
+            if submit_async and pair.pending is None and self._stored_features(stage, pair) is None:
+                started = time.perf_counter()
+                future = stage.submit(pair)
+                if future is not None:
+                    pair.pending, pair.pending_since = future, started
+                    return False
+            self._run_stage(stage, pair)
+        return True
+
+    def _run_stage(self, stage, pair):
+        from_store = False
+        if pair.pending is not None:
+            features = pair.pending.result()
+            started = pair.pending_since
+            pair.pending = None
+        else:
+            started = time.perf_counter()
+            features = self._stored_features(stage, pair)
+            from_store = features is not None
+            if features is None:
+                features = stage.extract(pair)
+        if not from_store and self.feature_store is not None and pair.index is not None and stage.should_store(features):
+            self.feature_store.put(stage.name, stage.feature_variant, pair.index, features)
+        pair.rejection_reason = stage.decide(pair, features)
+        self._record(stage, time.perf_counter() - started, pair.rejection_reason, from_store)
+        pair.next_stage += 1
+
+    def finish(self, pair: FramePair):
+        """Waits for any in-flight stage and runs the remaining stages synchronously."""
+        self.advance(pair, submit_async=False)
+        return pair
+
+    def process(self, pair: FramePair):
+        """Runs all stages for a pair synchronously."""
+        return self.finish(pair)
+
+    def cancel(self, pair: FramePair):
+        if pair.pending is not None:
+            pair.pending.cancel()
+            pair.pending = None
+
+
+def merge_stage_timings(timings_list):
+    """Sums per-stage timing dicts (e.g. from several frame ranges)."""
+    merged = {}
+    for timings in timings_list:
+        for name, timing in timings.items():
+            total = merged.setdefault(name, {'count': 0, 'total_seconds': 0.0, 'rejected': 0, 'stored': 0})
+            for key in total:
+                total[key] += timing[key]
+    for timing in merged.values():
+        timing['mean_seconds'] = timing['total_seconds'] / timing['count'] if timing['count'] else 0.0
+    return merged
@@ -0,0 +1,173 @@
+import cv2
+import numpy as np
+import os
+import hashlib
+import sqlite3
+import threading
+import logging
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "cache/llm_verdicts.sqlite")
+DEFAULT_MAX_DISTANCE = int(os.getenv("LLM_CACHE_MAX_DISTANCE", 4))
+
+
+def frame_phash(frame_cv):
+    """
+    64-bit DCT perceptual hash of a frame. Near-identical frames give hashes a small
+    Hamming distance apart.
+    Returns: int in [0, 2**64)
+    """
+    gray = frame_cv
+    if len(frame_cv.shape) == 3:
+        gray = cv2.cvtColor(frame_cv, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low_freq = cv2.dct(small)[:8, :8].flatten()
+    bits = low_freq > np.median(low_freq[1:]) # DC term skews the median
+    return int(np.packbits(bits).view('>u8')[0])
+
+
+def _popcount(values):
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(values)
+    return np.unpackbits(values.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+
+def prompt_key(model, prompt):
+    """Cache namespace for a model/prompt pair; verdicts are only reused for the exact same prompt."""
+    return hashlib.sha1(f"{model}\n{prompt}".encode("utf-8")).hexdigest()
+
+
+class _PromptEntries:
+    """In-memory copy of the stored verdicts for one prompt key, one entry per hash."""
+
+    def __init__(self):
+        self._hashes = np.empty(0, dtype=np.uint64)
+        self._new_hashes = [] # Added since _hashes was last built
+        self.verdicts = [] # (objects_detected, response), aligned with hashes
+        self.positions = {} # phash -> index into hashes/verdicts
+        self.last_rowid = 0 # Highest SQLite rowid merged so far
+
+    @property
+    def hashes(self):
+        """uint64 array of the stored hashes; new ones are added in one copy, however many arrived."""
+        if self._new_hashes:
+            self._hashes = np.concatenate([self._hashes, np.array(self._new_hashes, dtype=np.uint64)])
+            self._new_hashes = []
+        return self._hashes
+
+    def set(self, phash, verdict):
+        position = self.positions.get(phash)
+        if position is None:
+            self.positions[phash] = len(self.verdicts)
+            self._new_hashes.append(phash)
+            self.verdicts.append(verdict)
+        else:
+            self.verdicts[position] = verdict
+
+
+def _to_signed(phash):
+    # SQLite integers are signed, hashes are stored as their int64 bit pattern
+    return int(np.array([phash], dtype=np.uint64).view(np.int64)[0])
+
+
+def _to_unsigned(signed_hashes):
+    return np.array(signed_hashes, dtype=np.int64).view(np.uint64).tolist()
+
+
+class VerdictCache:
+    """
+    On-disk cache of LLM object-detection verdicts keyed by prompt and frame perceptual hash.
+
+    A lookup hits when a stored frame for the same model/prompt is within `max_distance`
+    bits of the query hash, so consecutive near-identical canopy frames and re-runs of the
+    same video skip the Ollama call entirely. Backed by SQLite so it persists across jobs
+    and can be shared by worker processes: lookups use an in-memory copy of the rows, and
+    a miss first merges rows other processes added since it was last read.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, max_distance=DEFAULT_MAX_DISTANCE):
+        self.path = str(path)
+        self.max_distance = max_distance
+        self._conn = None
+        self._lock = threading.Lock()
+        self._loaded = {} # prompt_key -> _PromptEntries
+
+    def __getstate__(self):
+        # Connections and in-memory indexes are rebuilt in the receiving process
+        return {'path': self.path, 'max_distance': self.max_distance}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def _connect(self):
+        if self._conn is None:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS verdicts ("
+                "prompt_key TEXT NOT NULL, phash INTEGER NOT NULL, "
+                "objects_detected INTEGER NOT NULL, response TEXT NOT NULL, "
+                "PRIMARY KEY (prompt_key, phash))"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def _refresh(self, key, below=None):
+        """
+        Merges rows for the key written since the last refresh (and, if given, with a rowid
+        below `below`). put() gives every written row a rowid above all existing ones, so
+        replaced verdicts are picked up too.
+        """
+        entries = self._loaded.setdefault(key, _PromptEntries())
+        rows = self._connect().execute(
+            "SELECT rowid, phash, objects_detected, response FROM verdicts WHERE prompt_key = ? AND rowid > ? AND rowid < ? ORDER BY rowid",
+            (key, entries.last_rowid, below if below is not None else 2 ** 63 - 1)
+        ).fetchall()
+        if rows:
+            for phash, (_, _, objects_detected, response) in zip(_to_unsigned([row[1] for row in rows]), rows):
+                entries.set(phash, (bool(objects_detected), response))
+            entries.last_rowid = rows[-1][0]
+        return entries
+
+    def _nearest(self, entries, phash):
+        if len(entries.hashes) == 0:
+            return None
+        distances = _popcount(entries.hashes ^ np.uint64(phash))
+        nearest = int(np.argmin(distances))
+        if distances[nearest] > self.max_distance:
+            return None
+        return entries.verdicts[nearest]
+
+    def get(self, key, phash):
+        """Returns the cached (objects_detected, response) for the nearest stored frame, or None."""
+        with self._lock:
+            entries = self._loaded.get(key)
+            verdict = self._nearest(entries, phash) if entries is not None else None
+            if verdict is None:
+                verdict = self._nearest(self._refresh(key), phash)
+            return verdict
+
+    def put(self, key, phash, objects_detected, response):
+        with self._lock:
+            conn = self._connect()
+            # Rowid above every existing row, including the one being replaced, so other processes see the change
+            rowid = conn.execute(
+                "INSERT OR REPLACE INTO verdicts (rowid, prompt_key, phash, objects_detected, response) "
+                "VALUES ((SELECT IFNULL(MAX(rowid), 0) + 1 FROM verdicts), ?, ?, ?, ?)",
+                (key, _to_signed(phash), int(objects_detected), response)
+            ).lastrowid
+            # Rows written before this one are merged inside the write transaction, so later refreshes can start after it
+            entries = self._refresh(key, below=rowid)
+            conn.commit()
+            entries.set(int(phash), (bool(objects_detected), response))
+            entries.last_rowid = rowid
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+            self._loaded = {}
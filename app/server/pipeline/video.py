@@ -0,0 +1,152 @@
+import cv2
+import numpy as np
+import logging
+from .metrics import pipeline_metrics
+
+logger = logging.getLogger(__name__)
+
+# Largest mean difference (0-255 scale) tolerated between the decoded luma plane and
+# cvtColor(BGR -> GRAY) before grayscale decoding is considered unsafe for a video
+MAX_GRAY_DECODE_ERROR = 3.0
+# Mean per-channel deviation from gray above which a video is treated as colorized
+MAX_GRAY_CHROMA_SPREAD = 2.0
+
+# Limited ("TV") range luma 16-235 expanded to full range 0-255, matching what cvtColor sees
+_LIMITED_RANGE_LUT = np.clip(np.round((np.arange(256) - 16) * 255.0 / 219.0), 0, 255).astype(np.uint8)
+
+
+def _silence_luma_format_warnings():
+    """
+    OpenCV's FFmpeg backend logs a warning for every frame read with CONVERT_RGB off
+    ("unsupported picture format ... treated as 8UC1"), which is exactly the plane we want.
+    Raises this process's OpenCV log level to errors only.
+    """
+    log = cv2.utils.logging
+    if log.getLogLevel() > log.LOG_LEVEL_ERROR:
+        log.setLogLevel(log.LOG_LEVEL_ERROR)
+
+
+def seek_capture(cap, path_to_video, start_frame):
+    """Positions an opened capture at start_frame, falling back to grabbing frames if seeking is inexact."""
+    if start_frame <= 0:
+        return cap
+    cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+    if int(cap.get(cv2.CAP_PROP_POS_FRAMES)) != start_frame:
+        logger.warning(f"Inexact seek in {path_to_video}; skipping to frame {start_frame} by decoding.")
+        convert_rgb = cap.get(cv2.CAP_PROP_CONVERT_RGB)
+        cap.release()
+        cap = cv2.VideoCapture(path_to_video)
+        cap.set(cv2.CAP_PROP_CONVERT_RGB, convert_rgb)
+        for _ in range(start_frame):
+            if not cap.grab():
+                break
+    return cap
+
+
+def probe_gray_decode(path_to_video):
+    """
+    Checks whether a video can be decoded straight to its luma plane instead of BGR.
+    Compares the first frame both ways; colorized videos, non-planar formats and luma that
+    doesn't match cvtColor's grayscale are rejected.
+    Returns: a 256-entry lookup table mapping decoded luma to grayscale, or None if gray decode can't be used.
+    """
+    cap_bgr = cv2.VideoCapture(path_to_video)
+    cap_gray = cv2.VideoCapture(path_to_video)
+    try:
+        if not cap_bgr.isOpened() or not cap_gray.isOpened():
+            return None
+        _silence_luma_format_warnings()
+        cap_gray.set(cv2.CAP_PROP_CONVERT_RGB, 0)
+        ok_bgr, frame_bgr = cap_bgr.read()
+        ok_gray, frame_luma = cap_gray.read()
+    finally:
+        cap_bgr.release()
+        cap_gray.release()
+
+    if not ok_bgr or not ok_gray or frame_luma is None or frame_luma.dtype != np.uint8:
+        return None
+    if frame_luma.shape != frame_bgr.shape[:2]:
+        logger.info(f"Gray decode not available for {path_to_video}: decoder returned shape {frame_luma.shape}.")
+        return None
+
+    gray_reference = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2GRAY)
+    chroma_spread = np.abs(frame_bgr.astype(np.int16) - gray_reference[..., None]).mean()
+    if chroma_spread > MAX_GRAY_CHROMA_SPREAD:
+        logger.info(f"Gray decode not used for {path_to_video}: video is colorized (spread {chroma_spread:.1f}).")
+        return None
+
+    best_lut, best_error = None, None
+    for lut in (None, _LIMITED_RANGE_LUT):
+        candidate = frame_luma if lut is None else cv2.LUT(frame_luma, lut)
+        error = np.abs(candidate.astype(np.int16) - gray_reference).mean()
+        if best_error is None or error < best_error:
+            best_lut, best_error = lut, error
+    if best_error > MAX_GRAY_DECODE_ERROR:
+        logger.info(f"Gray decode not used for {path_to_video}: luma differs from grayscale by {best_error:.1f} on average.")
+        return None
+    return np.arange(256, dtype=np.uint8) if best_lut is None else best_lut
+
+
+def decode_profile(gray, analysis_width=None):
+    """Describes how analysis frames are produced; stored features are only valid for one profile."""
+    return f"{'gray' if gray else 'bgr'}-{analysis_width or 'full'}"
+
+
+class VideoFrameSource:
+    """
+    Frame-by-frame reader for one video stream.
+
+    In gray mode the decoder hands back the luma plane directly (no BGR conversion, a third
+    of the memory traffic) and frames are single-channel. `analysis_width` additionally
+    provides a downscaled copy for the analysis stages, so callers only need to hold on to
+    the full-resolution frame for frames that are written out.
+    """
+
+    def __init__(self, path_to_video, start_frame=0, gray=False, analysis_width=None, gray_lut=None):
+        self.path_to_video = path_to_video
+        self.gray = gray
+        self.analysis_width = analysis_width or None
+        self._gray_lut = gray_lut
+        if self.gray and self._gray_lut is None:
+            self._gray_lut = probe_gray_decode(path_to_video)
+            if self._gray_lut is None:
+                self.gray = False
+
+        cap = cv2.VideoCapture(path_to_video)
+        if not cap.isOpened():
+            raise IOError(f"Could not open video: {path_to_video}")
+        if self.gray:
+            _silence_luma_format_warnings()
+            cap.set(cv2.CAP_PROP_CONVERT_RGB, 0)
+        self.cap = seek_capture(cap, path_to_video, start_frame)
+        self._frame = None
+
+    @property
+    def decode_profile(self):
+        return decode_profile(self.gray, self.analysis_width)
+
+    def grab(self):
+        self._frame = None
+        with pipeline_metrics.timer("decode"):
+            return self.cap.grab()
+
+    def retrieve(self):
+        """Full-resolution frame for the last grab (BGR, or single-channel in gray mode)."""
+        if self._frame is None:
+            with pipeline_metrics.timer("decode"):
+                ok, frame = self.cap.retrieve()
+                if ok and self.gray:
+                    frame = cv2.LUT(frame, self._gray_lut)
+            self._frame = frame if ok else None
+        return self._frame
+
+    def retrieve_analysis(self):
+        """Frame used by the analysis stages, downscaled to analysis_width if set."""
+        frame = self.retrieve()
+        if frame is None or self.analysis_width is None or frame.shape[1] <= self.analysis_width:
+            return frame
+        height = max(1, round(frame.shape[0] * self.analysis_width / frame.shape[1]))
+        return cv2.resize(frame, (self.analysis_width, height), interpolation=cv2.INTER_AREA)
+
+    def release(self):
+        self.cap.release()
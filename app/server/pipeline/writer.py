@@ -0,0 +1,174 @@
+import cv2
+import numpy as np
+import io
+import os
+import queue
+import threading
+import logging
+from pathlib import Path
+from .metrics import pipeline_metrics
+
+logger = logging.getLogger(__name__)
+
+# Defaults can be overridden from the server .env
+DEFAULT_IMAGE_FORMAT = os.getenv("OUTPUT_IMAGE_FORMAT", "png") # Raw frames: png or webp
+DEFAULT_DEPTH_FORMAT = os.getenv("OUTPUT_DEPTH_FORMAT", DEFAULT_IMAGE_FORMAT) # RealSense frames: png, webp or npy
+_png_compression = os.getenv("OUTPUT_PNG_COMPRESSION", "")
+DEFAULT_PNG_COMPRESSION = int(_png_compression) if _png_compression else None # 0-9; unset keeps OpenCV's default
+DEFAULT_WRITER_THREADS = int(os.getenv("OUTPUT_WRITER_THREADS", 2))
+DEFAULT_WRITER_QUEUE_SIZE = int(os.getenv("OUTPUT_WRITER_QUEUE_SIZE", 32))
+
+IMAGE_FORMATS = ("png", "webp")
+DEPTH_FORMATS = IMAGE_FORMATS + ("npy",)
+
+_STOP = object()
+
+
+def frame_extension(output_format):
+    return f".{output_format}"
+
+
+def resolve_output_formats(writer_options=None):
+    """Returns: (image_format, depth_format, png_compression) for FrameWriter options, filling in defaults."""
+    writer_options = writer_options or {}
+    return (
+        writer_options.get("image_format", DEFAULT_IMAGE_FORMAT),
+        writer_options.get("depth_format", DEFAULT_DEPTH_FORMAT),
+        writer_options.get("png_compression", DEFAULT_PNG_COMPRESSION),
+    )
+
+
+def _encode_params(output_format, png_compression):
+    if output_format == "png" and png_compression is not None:
+        return [cv2.IMWRITE_PNG_COMPRESSION, int(png_compression)]
+    if output_format == "webp":
+        return [cv2.IMWRITE_WEBP_QUALITY, 101] # Quality above 100 selects lossless WebP
+    return []
+
+
+def encode_frame(frame_cv, output_format="png", png_compression=None):
+    """Encodes one frame in the given format. Returns: bytes of the encoded file."""
+    if output_format == "npy":
+        buffer = io.BytesIO()
+        np.save(buffer, frame_cv)
+        return buffer.getvalue()
+    ok, buffer = cv2.imencode(frame_extension(output_format), frame_cv, _encode_params(output_format, png_compression))
+    if not ok:
+        raise IOError(f"Could not encode frame as {output_format}")
+    return buffer.tobytes()
+
+
+def write_frame(path, frame_cv, output_format="png", png_compression=None):
+    """Writes one frame in the given format. Raises IOError if it couldn't be written."""
+    with pipeline_metrics.timer("image_write"):
+        if output_format == "npy":
+            np.save(path, frame_cv)
+            return
+        if not cv2.imwrite(str(path), frame_cv, _encode_params(output_format, png_compression)):
+            raise IOError(f"Could not write frame to {path}")
+
+
+class FrameWriter:
+    """
+    Writes accepted frame pairs into <output_base_dir>/<category>/{raw,realsense}/ on
+    background threads, so image encoding overlaps with analysis of the following frames.
+
+    The queue is bounded: once `queue_size` pairs are waiting, `write` blocks until the
+    threads catch up, which keeps memory flat when encoding is the bottleneck. Directories
+    are only created the first time a category is seen. Errors raised on a writer thread
+    are re-raised from the next `write` or from `close`.
+    """
+
+    def __init__(self, output_base_dir, image_format=DEFAULT_IMAGE_FORMAT, depth_format=DEFAULT_DEPTH_FORMAT,
+                 png_compression=DEFAULT_PNG_COMPRESSION, threads=DEFAULT_WRITER_THREADS, queue_size=DEFAULT_WRITER_QUEUE_SIZE):
+        if image_format not in IMAGE_FORMATS:
+            raise ValueError(f"Unsupported image format '{image_format}', expected one of {IMAGE_FORMATS}")
+        if depth_format not in DEPTH_FORMATS:
+            raise ValueError(f"Unsupported depth format '{depth_format}', expected one of {DEPTH_FORMATS}")
+        self.output_base_dir = Path(output_base_dir)
+        self.image_format = image_format
+        self.depth_format = depth_format
+        self.png_compression = png_compression
+        self._created_dirs = set()
+        self._dirs_lock = threading.Lock()
+        self._error = None
+        self._closed = False
+        self._queue = queue.Queue(maxsize=max(1, int(queue_size)))
+        self._threads = [
+            threading.Thread(target=self._run, name=f"frame-writer-{i}", daemon=True)
+            for i in range(max(1, int(threads)))
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    @property
+    def raw_extension(self):
+        return frame_extension(self.image_format)
+
+    @property
+    def realsense_extension(self):
+        return frame_extension(self.depth_format)
+
+    def _category_dirs(self, category):
+        target_dir_raw = self.output_base_dir / category / "raw"
+        target_dir_realsense = self.output_base_dir / category / "realsense"
+        with self._dirs_lock:
+            if category not in self._created_dirs:
+                target_dir_raw.mkdir(parents=True, exist_ok=True)
+                target_dir_realsense.mkdir(parents=True, exist_ok=True)
+                self._created_dirs.add(category)
+        return target_dir_raw, target_dir_realsense
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is _STOP:
+                    return
+                if self._error is not None:
+                    continue # Drain without writing once something has failed
+                category, raw_image_cv, raw_image_name, realsense_image_cv, realsense_image_name = item
+                target_dir_raw, target_dir_realsense = self._category_dirs(category)
+                write_frame(target_dir_raw / raw_image_name, raw_image_cv, self.image_format, self.png_compression)
+                write_frame(target_dir_realsense / realsense_image_name, realsense_image_cv, self.depth_format, self.png_compression)
+            except Exception as e:
+                logger.error(f"Frame writer failed: {e}")
+                self._error = self._error or e
+            finally:
+                self._queue.task_done()
+
+    def _raise_error(self):
+        if self._error is not None:
+            raise self._error
+
+    def write(self, category, raw_image_cv, raw_image_name, realsense_image_cv, realsense_image_name):
+        """Queues a frame pair for writing; blocks while the queue is full."""
+        self._raise_error()
+        self._queue.put((category, raw_image_cv, raw_image_name, realsense_image_cv, realsense_image_name))
+
+    def flush(self):
+        """Blocks until every queued frame has been written; raises the first write error, if any."""
+        self._queue.join()
+        self._raise_error()
+
+    def close(self, discard=False):
+        """
+        Waits for queued frames to be written and stops the threads.
+        With discard=True (e.g. on cancellation) frames still waiting are dropped.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        if discard:
+            try:
+                while True:
+                    self._queue.get_nowait()
+                    self._queue.task_done()
+            except queue.Empty:
+                pass
+        for _ in self._threads:
+            self._queue.put(_STOP)
+        for thread in self._threads:
+            thread.join()
+        if not discard:
+            self._raise_error()
@@ -0,0 +1,184 @@
+import json
+import logging
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Defaults can be overridden from the server .env
+DEFAULT_SWEEP_INTERVAL = float(os.getenv("STORAGE_SWEEP_INTERVAL", 300)) # Seconds between sweeps; 0 disables them
+DEFAULT_ORPHAN_GRACE = float(os.getenv("STORAGE_ORPHAN_GRACE", 24 * 3600)) # Seconds before files nothing refers to are deleted
+RECENTLY_USED_SECONDS = 600 # Never evicted, since they may still be being written (e.g. an upload or a ZIP)
+_BYTES_PER_GB = 1024 ** 3
+
+
+def parse_directory_limits(value: str, scale: float = 1.0) -> Dict[str, float]:
+    """Parses a JSON {directory name: number} setting, e.g. STORAGE_QUOTAS, multiplying each number by scale."""
+    return {name: float(limit) * scale for name, limit in json.loads(value or "{}").items()}
+
+
+def storage_quotas_from_env() -> Dict[str, float]:
+    """STORAGE_QUOTAS, in bytes: JSON {directory name: GB}."""
+    return parse_directory_limits(os.getenv("STORAGE_QUOTAS", "{}"), _BYTES_PER_GB)
+
+
+def storage_ttls_from_env() -> Dict[str, float]:
+    """STORAGE_TTLS, in seconds: JSON {directory name: hours unused before deletion}."""
+    return parse_directory_limits(os.getenv("STORAGE_TTLS", "{}"), 3600)
+
+
+class StoredItem:
+    """A file, or a folder evicted as a whole, with its size in bytes and when it was last used."""
+
+    __slots__ = ("path", "size", "last_used")
+
+    def __init__(self, path: Path, size: int, last_used: float):
+        self.path = path
+        self.size = size
+        self.last_used = last_used
+
+    def delete(self):
+        if self.path.is_dir():
+            shutil.rmtree(self.path, ignore_errors=True)
+        else:
+            self.path.unlink(missing_ok=True)
+
+
+def _file_item(path: Path) -> Optional[StoredItem]:
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+    return StoredItem(path, stat.st_size, max(stat.st_mtime, stat.st_atime))
+
+
+def _folder_item(path: Path) -> Optional[StoredItem]:
+    """The folder's total size; last used is its own or any file's latest modification."""
+    try:
+        size, last_used = 0, path.stat().st_mtime
+    except FileNotFoundError:
+        return None
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                stat = os.stat(os.path.join(root, name))
+            except FileNotFoundError:
+                continue
+            size += stat.st_size
+            last_used = max(last_used, stat.st_mtime)
+    return StoredItem(path, size, last_used)
+
+
+class ManagedDirectory:
+    """
+    One directory the StorageManager keeps in check. Its items are either every file under it
+    (per_folder=False) or each entry directly inside it, with folders evicted as a whole
+    (per_folder=True, e.g. one folder per job).
+    """
+
+    def __init__(self, name: str, path, quota: Optional[float] = None, ttl: Optional[float] = None, per_folder: bool = False):
+        self.name = name
+        self.path = Path(path)
+        self.quota = quota or None
+        self.ttl = ttl or None
+        self.per_folder = per_folder
+
+    def items(self) -> list:
+        if not self.path.is_dir():
+            return []
+        if self.per_folder:
+            candidates = [(entry, _folder_item if entry.is_dir() else _file_item) for entry in self.path.iterdir()]
+        else:
+            candidates = [(Path(root) / name, _file_item) for root, _, files in os.walk(self.path) for name in files]
+        return [item for item in (scan(path) for path, scan in candidates) if item is not None]
+
+
+class StorageManager:
+    """
+    Keeps server directories (uploads, pipeline outputs, downloads, ...) within per-directory
+    quotas and deletes what is no longer needed. Each sweep asks `references()` for the paths
+    live sessions and jobs use, as two sets: in use (never deleted, e.g. a session's videos or
+    a running job's output) and referenced (kept, but may be evicted, e.g. a finished job's
+    results). Then, per directory:
+
+    1. items nothing refers to are deleted once unused for `orphan_grace` seconds, e.g. chunks
+       of abandoned uploads or outputs of expired jobs;
+    2. items not in use are deleted once unused for the directory's TTL, if it has one;
+    3. while the directory is over its quota, items not in use are deleted least recently
+       used first.
+
+    Items used in the last RECENTLY_USED_SECONDS are always kept. Files whose name extends one
+    in use (e.g. its .part or .progress file) count as in use too.
+    """
+
+    def __init__(self, references: Callable[[], Tuple[set, set]], orphan_grace: float = DEFAULT_ORPHAN_GRACE):
+        self.references = references
+        self.orphan_grace = orphan_grace
+        self.directories: Dict[str, ManagedDirectory] = {}
+
+    def add_directory(self, name: str, path, quota: Optional[float] = None, ttl: Optional[float] = None, per_folder: bool = False):
+        self.directories[name] = ManagedDirectory(name, path, quota, ttl, per_folder)
+
+    @staticmethod
+    def _resolved(paths):
+        return {str(Path(path).resolve()) for path in paths}
+
+    @staticmethod
+    def _matches(path: Path, resolved_paths: set) -> bool:
+        name = str(path.resolve())
+        while True:
+            if name in resolved_paths:
+                return True
+            stem, dot, _ = name.rpartition(".")
+            if not dot or os.sep in name[len(stem):]:
+                return False
+            name = stem
+
+    def sweep(self) -> Dict[str, dict]:
+        """
+        Runs one pass over every directory. Blocking; call it from a worker thread.
+        Returns: {directory name: {"bytes", "items", "deleted", "freed_bytes", "quota"}} after the sweep.
+        """
+        in_use, referenced = self.references()
+        in_use, referenced = self._resolved(in_use), self._resolved(referenced)
+        now = time.time()
+        report = {}
+        for directory in self.directories.values():
+            kept, deleted, freed = [], 0, 0
+            for item in directory.items():
+                unused_for = now - item.last_used
+                if unused_for < RECENTLY_USED_SECONDS or self._matches(item.path, in_use):
+                    kept.append((item, False))
+                    continue
+                orphaned = not self._matches(item.path, referenced)
+                if (orphaned and unused_for >= self.orphan_grace) or (directory.ttl is not None and unused_for >= directory.ttl):
+                    logger.info(f"Storage: Deleting {'orphaned' if orphaned else 'expired'} {item.path} ({item.size / 1e6:.1f} MB, unused for {unused_for / 3600:.1f} h)")
+                    item.delete()
+                    deleted, freed = deleted + 1, freed + item.size
+                else:
+                    kept.append((item, True))
+            total, remaining = sum(item.size for item, _ in kept), len(kept)
+            if directory.quota is not None and total > directory.quota:
+                evictable = sorted((item for item, can_evict in kept if can_evict), key=lambda item: item.last_used)
+                for item in evictable:
+                    if total <= directory.quota:
+                        break
+                    logger.info(f"Storage: {directory.name} is over its {directory.quota / _BYTES_PER_GB:.1f} GB quota; evicting {item.path} ({item.size / 1e6:.1f} MB)")
+                    item.delete()
+                    total, remaining = total - item.size, remaining - 1
+                    deleted, freed = deleted + 1, freed + item.size
+                if total > directory.quota:
+                    logger.warning(f"Storage: {directory.name} uses {total / _BYTES_PER_GB:.2f} GB, over its quota, but the rest is in use or was just written.")
+            report[directory.name] = {"bytes": total, "items": remaining, "deleted": deleted, "freed_bytes": freed, "quota": directory.quota}
+        return report
+
+
+def touch(path):
+    """Marks a stored file or folder as just used, so LRU eviction keeps it longer."""
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,327 @@
+import copy
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Defaults can be overridden from the server .env
+DEFAULT_STATE_STORE = os.getenv("STATE_STORE", "sqlite").lower() # sqlite, or memory for a single process that forgets on restart
+DEFAULT_STATE_STORE_PATH = os.getenv("STATE_STORE_PATH", "state/server_state.sqlite")
+# Seconds a write waits for another worker's to finish; short, since request handlers call the store on the event loop
+DEFAULT_STATE_STORE_BUSY_TIMEOUT = float(os.getenv("STATE_STORE_BUSY_TIMEOUT", 1.0))
+
+
+class StateStoreBusy(RuntimeError):
+    """Another worker held the store's write lock for longer than the busy timeout; the call can be retried."""
+
+
+class StateStore:
+    """
+    Server state (sessions, pipeline jobs, uploads in progress) as JSON documents addressed by
+    kind and key. Documents given a TTL expire that many seconds after they were last written;
+    expired ones are never returned and are deleted by purge_expired.
+
+    Reading returns a copy: changes are only kept once written back, either with put or by
+    changing the document inside `with store.edit(kind, key) as value:`, which no other
+    writer can interleave with. Don't await inside an edit, and don't start another edit
+    inside one (RuntimeError): an edit holds the store's write transaction until it ends.
+    """
+
+    def __init__(self):
+        self._editing = threading.local()
+
+    @contextmanager
+    def _single_edit(self):
+        if getattr(self._editing, "active", False):
+            raise RuntimeError("StateStore edits can't be nested; finish one before starting another")
+        self._editing.active = True
+        try:
+            yield
+        finally:
+            self._editing.active = False
+
+    def get(self, kind: str, key: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    def put(self, kind: str, key: str, value, ttl: Optional[float] = None):
+        raise NotImplementedError
+
+    def add(self, kind: str, key: str, value, ttl: Optional[float] = None) -> bool:
+        """Stores a document unless one already exists. Returns: True if it was stored."""
+        raise NotImplementedError
+
+    def delete(self, kind: str, key: str) -> bool:
+        raise NotImplementedError
+
+    def edit(self, kind: str, key: str, ttl: Optional[float] = None):
+        """Context manager yielding the document to change in place. Raises KeyError if there is none."""
+        raise NotImplementedError
+
+    def items(self, kind: str) -> list:
+        raise NotImplementedError
+
+    def touch(self, kind: str, key: str, ttl: float):
+        """Pushes a document's expiry back to ttl seconds from now."""
+        raise NotImplementedError
+
+    def purge_expired(self) -> int:
+        """Deletes expired documents. Returns: how many were deleted."""
+        raise NotImplementedError
+
+    def table(self, kind: str, ttl: Optional[float] = None) -> "StoreTable":
+        return StoreTable(self, kind, ttl)
+
+    def close(self):
+        pass
+
+
+class MemoryStateStore(StateStore):
+    """StateStore kept in this process's memory; nothing survives a restart or is shared with other workers."""
+
+    def __init__(self):
+        super().__init__()
+        self._documents = {} # (kind, key) -> (value, expires_at)
+        self._lock = threading.RLock()
+
+    def _live(self, kind, key):
+        document = self._documents.get((kind, key))
+        if document is None:
+            return None
+        if document[1] is not None and document[1] <= time.time():
+            del self._documents[(kind, key)]
+            return None
+        return document
+
+    def get(self, kind, key):
+        with self._lock:
+            document = self._live(kind, key)
+            return copy.deepcopy(document[0]) if document is not None else None
+
+    def put(self, kind, key, value, ttl=None):
+        with self._lock:
+            self._documents[(kind, key)] = (copy.deepcopy(value), time.time() + ttl if ttl else None)
+
+    def add(self, kind, key, value, ttl=None):
+        with self._lock:
+            if self._live(kind, key) is not None:
+                return False
+            self.put(kind, key, value, ttl)
+            return True
+
+    def delete(self, kind, key):
+        with self._lock:
+            return self._documents.pop((kind, key), None) is not None
+
+    @contextmanager
+    def edit(self, kind, key, ttl=None):
+        with self._single_edit(), self._lock:
+            document = self._live(kind, key)
+            if document is None:
+                raise KeyError(key)
+            value = copy.deepcopy(document[0])
+            yield value
+            self.put(kind, key, value, ttl)
+
+    def items(self, kind):
+        with self._lock:
+            return [(key, self.get(kind, key)) for document_kind, key in list(self._documents)
+                    if document_kind == kind and self._live(kind, key) is not None]
+
+    def touch(self, kind, key, ttl):
+        with self._lock:
+            document = self._live(kind, key)
+            if document is not None:
+                self._documents[(kind, key)] = (document[0], time.time() + ttl)
+
+    def purge_expired(self):
+        with self._lock:
+            now = time.time()
+            expired = [address for address, (_, expires_at) in self._documents.items() if expires_at is not None and expires_at <= now]
+            for address in expired:
+                del self._documents[address]
+            return len(expired)
+
+
+class SqliteStateStore(StateStore):
+    """
+    StateStore in an SQLite database, so state survives restarts and every uvicorn worker
+    pointed at the same file sees the same sessions and jobs. Edits run in an IMMEDIATE
+    transaction, so read-modify-write cycles from different workers never interleave.
+
+    Calls block while another worker writes (WAL readers never wait), for at most
+    `busy_timeout` seconds before raising StateStoreBusy.
+    """
+
+    def __init__(self, path=DEFAULT_STATE_STORE_PATH, busy_timeout=DEFAULT_STATE_STORE_BUSY_TIMEOUT):
+        super().__init__()
+        self.path = str(path)
+        self.busy_timeout = busy_timeout
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        # Autocommit mode; edits manage their own transactions
+        self._conn = sqlite3.connect(self.path, timeout=busy_timeout, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS state ("
+            "kind TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, expires_at REAL, "
+            "PRIMARY KEY (kind, key))"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS state_expiry ON state (expires_at)")
+        self._lock = threading.RLock()
+
+    @contextmanager
+    def _locked(self):
+        with self._lock:
+            try:
+                yield
+            except sqlite3.OperationalError as e:
+                if "locked" not in str(e) and "busy" not in str(e):
+                    raise
+                raise StateStoreBusy(f"State store {self.path} was locked by another writer for over {self.busy_timeout} s") from e
+
+    def _select(self, kind, key):
+        row = self._conn.execute(
+            "SELECT value FROM state WHERE kind = ? AND key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (kind, key, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def get(self, kind, key):
+        with self._locked():
+            return self._select(kind, key)
+
+    def put(self, kind, key, value, ttl=None):
+        with self._locked():
+            self._conn.execute(
+                "INSERT OR REPLACE INTO state (kind, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                (kind, key, json.dumps(value), time.time() + ttl if ttl else None)
+            )
+
+    def add(self, kind, key, value, ttl=None):
+        with self._locked():
+            now = time.time()
+            self._conn.execute("DELETE FROM state WHERE kind = ? AND key = ? AND expires_at <= ?", (kind, key, now))
+            return self._conn.execute(
+                "INSERT OR IGNORE INTO state (kind, key, value, expires_at) VALUES (?, ?, ?, ?)",
+                (kind, key, json.dumps(value), now + ttl if ttl else None)
+            ).rowcount > 0
+
+    def delete(self, kind, key):
+        with self._locked():
+            return self._conn.execute("DELETE FROM state WHERE kind = ? AND key = ?", (kind, key)).rowcount > 0
+
+    @contextmanager
+    def edit(self, kind, key, ttl=None):
+        with self._single_edit(), self._locked():
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                value = self._select(kind, key)
+                if value is None:
+                    raise KeyError(key)
+                yield value
+                self.put(kind, key, value, ttl)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def items(self, kind):
+        with self._locked():
+            rows = self._conn.execute(
+                "SELECT key, value FROM state WHERE kind = ? AND (expires_at IS NULL OR expires_at > ?)", (kind, time.time())
+            ).fetchall()
+        return [(key, json.loads(value)) for key, value in rows]
+
+    def touch(self, kind, key, ttl):
+        with self._locked():
+            self._conn.execute("UPDATE state SET expires_at = ? WHERE kind = ? AND key = ?", (time.time() + ttl, kind, key))
+
+    def purge_expired(self):
+        with self._locked():
+            return self._conn.execute("DELETE FROM state WHERE expires_at <= ?", (time.time(),)).rowcount
+
+    def close(self):
+        with self._locked():
+            self._conn.close()
+
+
+class StoreTable(MutableMapping):
+    """
+    Dict-like view of one kind of document in a StateStore, with the kind's TTL applied to
+    every write. Reads return copies, so change documents through `edit` (or assign them
+    back); reading a document in the second half of its lifetime renews it.
+    """
+
+    def __init__(self, store: StateStore, kind: str, ttl: Optional[float] = None):
+        self.store = store
+        self.kind = kind
+        self.ttl = ttl or None
+        self._renewed = {} # key -> time.monotonic() of the last renewal from this process
+
+    def _renew(self, key):
+        if self.ttl is None:
+            return
+        now = time.monotonic()
+        if now - self._renewed.get(key, 0.0) >= self.ttl / 2:
+            self.store.touch(self.kind, key, self.ttl)
+            self._renewed[key] = now
+
+    def __getitem__(self, key):
+        value = self.store.get(self.kind, key)
+        if value is None:
+            raise KeyError(key)
+        self._renew(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.store.put(self.kind, key, value, self.ttl)
+        self._renewed[key] = time.monotonic()
+
+    def __delitem__(self, key):
+        self._renewed.pop(key, None)
+        if not self.store.delete(self.kind, key):
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return self.store.get(self.kind, key) is not None
+
+    def __iter__(self):
+        return iter([key for key, _ in self.store.items(self.kind)])
+
+    def __len__(self):
+        return len(self.store.items(self.kind))
+
+    def items(self):
+        return self.store.items(self.kind)
+
+    def values(self):
+        return [value for _, value in self.store.items(self.kind)]
+
+    def setdefault(self, key, default=None):
+        """Stores default unless the key exists, atomically across workers. Returns: the stored document."""
+        if self.store.add(self.kind, key, default, self.ttl):
+            self._renewed[key] = time.monotonic()
+            return copy.deepcopy(default)
+        return self[key]
+
+    def edit(self, key):
+        """`with table.edit(key) as value:` changes a document in place and writes it back. Raises KeyError if there is none."""
+        self._renewed[key] = time.monotonic()
+        return self.store.edit(self.kind, key, self.ttl)
+
+
+def open_state_store(backend: str = DEFAULT_STATE_STORE, path=DEFAULT_STATE_STORE_PATH) -> StateStore:
+    """Returns: the StateStore selected by name ("sqlite" or "memory")."""
+    if backend == "sqlite":
+        logger.info(f"Keeping server state in {path}")
+        return SqliteStateStore(path)
+    if backend == "memory":
+        return MemoryStateStore()
+    raise ValueError(f"Unknown state store '{backend}', expected 'sqlite' or 'memory'")
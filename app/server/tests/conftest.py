@@ -0,0 +1,28 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# Tests import the server modules the way main.py does, from app/server
+SERVER_DIR = Path(__file__).resolve().parents[1]
+if str(SERVER_DIR) not in sys.path:
+    sys.path.insert(0, str(SERVER_DIR))
+
+from benchmarks.synthetic import generate_pattern_library, generate_video_pair # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def synthetic_media(tmp_path_factory):
+    """Small pattern library and raw/RealSense video pair shared by the pipeline tests."""
+    media_dir = tmp_path_factory.mktemp("media")
+    pattern_paths = generate_pattern_library(media_dir / "patterns", 3)
+    raw_path, realsense_path = generate_video_pair(media_dir / "videos", width=320, height=240, frames=48,
+                                                   pattern_paths=pattern_paths, seed=1)
+    return {"patterns": pattern_paths, "raw": raw_path, "realsense": realsense_path}
+
+
+@pytest.fixture
+def in_tmp_dir(tmp_path, monkeypatch):
+    """Runs the test from an empty directory, since the pipeline writes pipeline_output/ and downloads/ relative to it."""
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
@@ -0,0 +1,76 @@
+import asyncio
+import importlib
+
+import pytest
+
+from store import MemoryStateStore, StateStoreBusy
+
+
+@pytest.fixture(scope="module")
+def server(tmp_path_factory):
+    """The FastAPI app with in-memory state, run from an empty directory since it creates uploads/, downloads/, ... there."""
+    with pytest.MonkeyPatch.context() as patch:
+        patch.chdir(tmp_path_factory.mktemp("server"))
+        patch.setenv("STATE_STORE", "memory")
+        patch.setenv("STORAGE_SWEEP_INTERVAL", "0")
+        from fastapi.testclient import TestClient
+        main = importlib.import_module("main")
+        with TestClient(main.app) as client:
+            yield main, client
+
+
+@pytest.fixture
+def session_id(server):
+    return server[1].get("/api/new-session").json()["session_id"]
+
+
+class BusyStore(MemoryStateStore):
+    def get(self, kind, key):
+        raise StateStoreBusy("locked by another writer")
+
+
+def test_busy_state_store_answers_503(server, session_id, monkeypatch):
+    main, client = server
+    monkeypatch.setattr(main.sessions, "store", BusyStore())
+    response = client.get(f"/api/session/{session_id}")
+    assert response.status_code == 503 and response.headers["Retry-After"] == "1"
+
+
+@pytest.mark.parametrize("priority", [None, "high", [1]])
+def test_run_pipeline_rejects_an_invalid_priority(server, session_id, priority):
+    main, client = server
+    jobs_before = len(main.pipeline_jobs)
+    response = client.post("/api/run-pipeline", json={"session_id": session_id, "priority": priority})
+    assert response.status_code == 400 and "priority" in response.json()["detail"]
+    assert len(main.pipeline_jobs) == jobs_before
+
+
+def test_pattern_library_is_built_off_the_event_loop(server, session_id, monkeypatch):
+    main, client = server
+    built_on_loop = []
+
+    class Library:
+        @staticmethod
+        def from_paths(paths):
+            try:
+                asyncio.get_running_loop()
+                built_on_loop.append(True)
+            except RuntimeError: # No event loop in a worker thread
+                built_on_loop.append(False)
+            return Library()
+
+    monkeypatch.setattr(main, "PatternLibrary", Library)
+    monkeypatch.setattr(main.job_scheduler, "submit", lambda *args, **kwargs: None)
+    with main.sessions.edit(session_id) as session:
+        session.update(dataset_path="raw.mp4", mirror_path="realsense.mp4", pattern_paths=["pattern.png"])
+        session["pipeline_processes"]["Pattern Thresholding"] = True
+    assert client.post("/api/run-pipeline", json={"session_id": session_id}).status_code == 200
+    assert built_on_loop == [False]
+    assert isinstance(main.pattern_libraries[session_id][1], Library)
+
+
+def test_purge_drops_pattern_libraries_of_expired_sessions(server, session_id):
+    main, _ = server
+    main.pattern_libraries.update({session_id: ((), None), "expired-session": ((), None)})
+    main._purge_expired_state()
+    assert session_id in main.pattern_libraries and "expired-session" not in main.pattern_libraries
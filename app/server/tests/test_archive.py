@@ -0,0 +1,26 @@
+import io
+import os
+import zipfile
+
+from pipeline.archive import stream_zip, stream_zip_from_directory
+
+
+def test_streamed_zip_holds_every_file(tmp_path):
+    files = {"removal_log.txt": b"frame_3 solid color\n" * 500, "a/raw/frame_0.png": os.urandom(5000),
+             "a/realsense/frame_0.png": os.urandom(3000)}
+    for name, data in files.items():
+        (tmp_path / name).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / name).write_bytes(data)
+
+    chunks = list(stream_zip_from_directory(tmp_path, chunk_size=1024))
+    assert len(chunks) > 1
+    with zipfile.ZipFile(io.BytesIO(b"".join(chunks))) as archive:
+        assert {info.filename: archive.read(info) for info in archive.infolist()} == files
+        assert archive.getinfo("a/raw/frame_0.png").compress_type == zipfile.ZIP_STORED # Already compressed
+        assert archive.getinfo("removal_log.txt").compress_type == zipfile.ZIP_DEFLATED
+
+
+def test_streamed_zip_of_in_memory_entries():
+    data = b"".join(stream_zip([("x/frame.webp", b"image"), ("notes.txt", bytearray(b"text"))]))
+    with zipfile.ZipFile(io.BytesIO(data)) as archive:
+        assert archive.read("x/frame.webp") == b"image" and archive.read("notes.txt") == b"text"
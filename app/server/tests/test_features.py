@@ -0,0 +1,42 @@
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from pipeline.features import FeatureStore, file_content_hash
+
+
+def test_file_hashes_are_remembered_until_the_file_changes(tmp_path):
+    video = tmp_path / "video.mp4"
+    video.write_bytes(b"frames")
+    assert file_content_hash(video, tmp_path / "store") == hashlib.sha1(b"frames").hexdigest()
+    stat = video.stat()
+    video.write_bytes(b"FRAMES") # Same size; only the mtime tells them apart
+    os.utime(video, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert file_content_hash(video, tmp_path / "store") == hashlib.sha1(b"frames").hexdigest()
+    os.utime(video, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    assert file_content_hash(video, tmp_path / "store") == hashlib.sha1(b"FRAMES").hexdigest()
+
+
+def test_jobs_in_several_processes_hash_at_once(tmp_path):
+    videos = []
+    for index in range(200):
+        videos.append(tmp_path / f"video_{index}.mp4")
+        videos[-1].write_bytes(os.urandom(1000))
+    with ProcessPoolExecutor(8) as pool:
+        hashes = list(pool.map(file_content_hash, videos, [tmp_path / "store"] * len(videos)))
+    assert hashes == [hashlib.sha1(video.read_bytes()).hexdigest() for video in videos]
+
+
+def test_features_survive_a_new_store_instance(tmp_path):
+    raw, realsense = tmp_path / "raw.mp4", tmp_path / "realsense.mp4"
+    raw.write_bytes(b"raw")
+    realsense.write_bytes(b"depth")
+    store = FeatureStore.for_videos(raw, realsense, tmp_path / "store")
+    store.put("Solid Color Detection", "", 3, {"histogram": [1, 2, 3]})
+    assert store.get("Solid Color Detection", "", 3) == {"histogram": [1, 2, 3]} # Still buffered
+    store.flush()
+    again = FeatureStore.for_videos(raw, realsense, tmp_path / "store")
+    assert again.video_key == store.video_key
+    assert again.get("Solid Color Detection", "", 3) == {"histogram": [1, 2, 3]}
+    assert again.get("Solid Color Detection", "other variant", 3) is None
+    assert FeatureStore.for_videos(raw, realsense, tmp_path / "store", decode_profile="gray").video_key != store.video_key
@@ -0,0 +1,48 @@
+import asyncio
+import os
+
+from jobs import PipelineJobScheduler
+
+
+def test_jobs_run_by_priority_then_in_submission_order():
+    async def scenario():
+        scheduler = PipelineJobScheduler(max_concurrent_jobs=1)
+        started, release = [], asyncio.Event()
+
+        def job(job_id):
+            async def run():
+                started.append(job_id)
+                if job_id == "blocker":
+                    await release.wait()
+            return run
+
+        try:
+            scheduler.submit("blocker", job("blocker"))
+            await asyncio.sleep(0.01) # Dispatched, so the only worker is busy
+            for job_id, priority in [("low", -1), ("first", 0), ("urgent", 5), ("second", 0), ("cancelled", 9)]:
+                scheduler.submit(job_id, job(job_id), priority=priority)
+            assert scheduler.cancel("cancelled") and scheduler.cancel_event("cancelled").is_set()
+            assert not scheduler.cancel("cancelled")
+            positions = {job_id: scheduler.queue_position(job_id) for job_id in ("urgent", "first", "second", "low")}
+            assert positions == {"urgent": 0, "first": 1, "second": 2, "low": 3}
+            assert scheduler.queue_position("blocker") is None
+            release.set()
+            await asyncio.wait_for(scheduler._queue.join(), 5)
+            assert scheduler.job_ids() == [] and scheduler.progress("urgent") is None
+            return started
+        finally:
+            await scheduler.shutdown()
+
+    assert asyncio.run(scenario()) == ["blocker", "urgent", "first", "second", "low"]
+
+
+def test_run_in_pool_uses_another_process():
+    async def scenario():
+        scheduler = PipelineJobScheduler(max_concurrent_jobs=1)
+        scheduler.start()
+        try:
+            return await scheduler.run_in_pool(os.getpid)
+        finally:
+            await scheduler.shutdown()
+
+    assert asyncio.run(scenario()) != os.getpid()
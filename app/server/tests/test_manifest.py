@@ -0,0 +1,55 @@
+import hashlib
+from pathlib import Path
+
+import pytest
+
+from pipeline import process_video_frames
+from pipeline.manifest import extract_manifest_frames, read_manifest, select_manifest_rows, write_manifest
+
+THRESHOLDS = {"Pattern Thresholding Value": 200, "Solid Color Detection": 0.6, "Black Threshold BW": 30, "White Threshold BW": 225}
+PROCESSES = {"Solid Color Detection": True, "Model Object Detection": False, "Pattern Thresholding": True}
+
+ROWS = [
+    {"frame_index": 0, "raw_frame_name": "frame_0.png", "realsense_frame_name": "depth_0.png", "accepted": True,
+     "category": "a", "matched_pattern": "a.png", "match_score": 12, "rejection_reason": None},
+    {"frame_index": 1, "raw_frame_name": "frame_1.png", "realsense_frame_name": "depth_1.png", "accepted": False,
+     "category": None, "matched_pattern": None, "match_score": None, "rejection_reason": "Solid color"},
+    {"frame_index": 2, "raw_frame_name": "frame_2.png", "realsense_frame_name": "depth_2.png", "accepted": True,
+     "category": "Uncategorized", "matched_pattern": None, "match_score": 3, "rejection_reason": None},
+]
+
+
+def _hashes(directory):
+    return {str(path.relative_to(directory)): hashlib.sha256(path.read_bytes()).hexdigest()
+            for path in sorted(Path(directory).rglob("*")) if path.is_file()}
+
+
+@pytest.mark.parametrize("manifest_format", ["csv", "jsonl"])
+def test_manifest_round_trip(tmp_path, manifest_format):
+    path = write_manifest(ROWS, tmp_path, manifest_format)
+    assert path.name == f"manifest.{manifest_format}"
+    assert read_manifest(path) == ROWS
+
+
+def test_select_manifest_rows():
+    assert [row["frame_index"] for row in select_manifest_rows(ROWS)] == [0, 2]
+    assert [row["frame_index"] for row in select_manifest_rows(ROWS, category="a")] == [0]
+    assert [row["frame_index"] for row in select_manifest_rows(ROWS, start_frame=1, stop_frame=3)] == [2]
+
+
+def test_extracted_frames_match_image_output(synthetic_media, in_tmp_dir):
+    def run(job_id, **options):
+        return process_video_frames(job_id, synthetic_media["raw"], synthetic_media["realsense"], synthetic_media["patterns"],
+                                    THRESHOLDS, PROCESSES, create_zip=False, checkpoint_interval=0, **options)
+
+    run("images")
+    run("manifest", output_mode="manifest", manifest_format="jsonl")
+    images = {name: digest for name, digest in _hashes("pipeline_output/images/Accepted_images").items() if "/" in name}
+    assert images # Category folders with raw/ and realsense/ frames
+
+    job_dir = Path("pipeline_output/manifest")
+    rows = read_manifest(job_dir / "Accepted_images" / "manifest.jsonl")
+    assert len(rows) == 48 and 2 * len(select_manifest_rows(rows)) == len(images)
+    assert not any(path.suffix == ".png" for path in (job_dir / "Accepted_images").rglob("*"))
+    assert extract_manifest_frames(job_dir, job_dir / "Accepted_images", "extracted") == len(images) // 2
+    assert _hashes("extracted") == images
@@ -0,0 +1,77 @@
+import pickle
+
+import cv2
+import numpy as np
+import pytest
+
+from benchmarks.synthetic import generate_pattern_library
+from pipeline.patterns import PatternLibrary, get_sift
+
+
+def _frame_descriptors(video_path, frame_indices):
+    capture = cv2.VideoCapture(video_path)
+    descriptors = []
+    for index in range(max(frame_indices) + 1):
+        ok, frame = capture.read()
+        assert ok
+        if index in frame_indices:
+            _, frame_descriptors = get_sift().detectAndCompute(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), None)
+            descriptors.append(frame_descriptors)
+    capture.release()
+    return descriptors
+
+
+def _cross_checked_counts(frame_descriptors, library, threshold):
+    """What the pipeline counted before patterns were stacked: one cross-checked BFMatcher per pattern."""
+    matcher = cv2.BFMatcher(cv2.NORM_L2, crossCheck=True)
+    return [sum(match.distance < threshold for match in matcher.match(frame_descriptors, pattern.descriptors))
+            for pattern in library.patterns]
+
+
+@pytest.mark.parametrize("threshold", [150, 200, 300])
+def test_stacked_matching_counts_match_per_pattern_cross_check(synthetic_media, threshold):
+    library = PatternLibrary.from_paths(synthetic_media["patterns"])
+    compared = 0
+    for frame_descriptors in _frame_descriptors(synthetic_media["realsense"], {0, 5, 11, 23, 40}):
+        if frame_descriptors is None:
+            continue
+        expected = _cross_checked_counts(frame_descriptors, library, threshold)
+        assert library.good_match_counts(frame_descriptors, threshold).tolist() == expected
+        compared += sum(expected)
+    assert compared > 0
+
+
+def test_patterns_do_not_compete_for_frame_descriptors(synthetic_media):
+    single = PatternLibrary.from_paths(synthetic_media["patterns"][:1])
+    duplicated = PatternLibrary.from_paths(synthetic_media["patterns"][:1] * 2)
+    frame_descriptors = single.patterns[0].descriptors + np.float32(1.0)
+    counts = duplicated.good_match_counts(frame_descriptors, 200)
+    assert counts[0] == counts[1] == single.good_match_counts(frame_descriptors, 200)[0] > 0
+
+
+def test_match_distances_are_l2_distances(synthetic_media):
+    library = PatternLibrary.from_paths(synthetic_media["patterns"])
+    frame_descriptors = _frame_descriptors(synthetic_media["realsense"], {0})[0]
+    expected = sorted(match.distance for pattern in library.patterns
+                      for match in cv2.BFMatcher(cv2.NORM_L2, crossCheck=True).match(frame_descriptors, pattern.descriptors))
+    _, distances = library.match_distances(frame_descriptors)
+    np.testing.assert_allclose(sorted(distances), expected, rtol=1e-4)
+
+
+def test_empty_inputs():
+    assert len(PatternLibrary().match_distances(np.ones((3, 128), np.float32))[0]) == 0
+
+
+def test_large_libraries_match_approximately_through_one_index(synthetic_media, tmp_path):
+    paths = synthetic_media["patterns"] + generate_pattern_library(tmp_path, 100, seed=5)
+    exact, approximate = PatternLibrary.from_paths(paths, approximate=False), PatternLibrary.from_paths(paths, approximate=True)
+    assert exact.fingerprint != approximate.fingerprint # Stored match results of one mode aren't reused by the other
+    compared = 0
+    for frame_descriptors in _frame_descriptors(synthetic_media["realsense"], {0, 3, 6, 13, 22, 36}):
+        expected, counts = exact.good_match_counts(frame_descriptors, 200), approximate.good_match_counts(frame_descriptors, 200)
+        assert counts.argmax() == expected.argmax()
+        assert abs(int(counts.max()) - int(expected.max())) <= max(3, expected.max() // 5)
+        compared += 1
+    assert compared == 6
+    assert isinstance(approximate._index, cv2.flann_Index) and exact._index is None
+    assert pickle.loads(pickle.dumps(approximate))._index is None # Rebuilt in the receiving process
@@ -0,0 +1,122 @@
+"""
+The same job must give the same results however it runs: serially, split across frame
+workers, interrupted and resumed from its checkpoints, and with frame sampling in each case.
+"""
+import hashlib
+from pathlib import Path
+
+import pytest
+
+from benchmarks.fake_ollama import FakeOllamaServer
+from pipeline import PipelineCancelled, process_video_frames
+from pipeline.checkpoint import has_checkpoint
+from pipeline.llm import OllamaDetector
+from pipeline.sampling import FrameSampler
+
+THRESHOLDS = {"Pattern Thresholding Value": 200, "Solid Color Detection": 0.6, "Black Threshold BW": 30,
+              "White Threshold BW": 225, "Object Detection Prompt": "Are there man-made objects?"}
+PROCESSES = {"Solid Color Detection": True, "Model Object Detection": True, "Pattern Thresholding": True}
+
+
+class CancelAfter:
+    """Cancel event that reports itself set once checked more than `checks` times (serial runs only)."""
+
+    def __init__(self, checks):
+        self.checks = checks
+
+    def is_set(self):
+        self.checks -= 1
+        return self.checks < 0
+
+
+@pytest.fixture(scope="module")
+def fake_ollama():
+    with FakeOllamaServer(latency=0.01, detect_ratio=0.3) as server:
+        yield server
+
+
+def _run(job_id, media, server, **options):
+    detector = OllamaDetector(host=server.url, max_in_flight=4, retry_backoff=0.01)
+    return process_video_frames(job_id, media["raw"], media["realsense"], media["patterns"], THRESHOLDS, PROCESSES,
+                                detector=detector, create_zip=False, **options)
+
+
+def _results(job_id):
+    """Every output file of a job (images and removal log) with a hash of its contents."""
+    output_dir = Path("pipeline_output") / job_id / "Accepted_images"
+    return {str(path.relative_to(output_dir)): hashlib.sha256(path.read_bytes()).hexdigest()
+            for path in sorted(output_dir.rglob("*")) if path.is_file()}
+
+
+def _interrupted_then_resumed(job_id, media, server, checks, **options):
+    with pytest.raises(PipelineCancelled):
+        _run(job_id, media, server, cancel_event=CancelAfter(checks), checkpoint_interval=0.001, **options)
+    assert has_checkpoint(Path("pipeline_output") / job_id)
+    result = _run(job_id, media, server, checkpoint_interval=0.001, **options)
+    assert not has_checkpoint(Path("pipeline_output") / job_id)
+    return result
+
+
+@pytest.mark.parametrize("sampling", [None, {"mode": "stride", "stride": 7}, {"mode": "scene", "stride": 9, "scene_threshold": 0.05}],
+                         ids=["all-frames", "stride", "scene"])
+def test_parallel_and_resumed_runs_match_serial(synthetic_media, fake_ollama, in_tmp_dir, sampling):
+    serial = _run("serial", synthetic_media, fake_ollama, checkpoint_interval=0, sampling_options=sampling)
+    expected = _results("serial")
+    assert serial[0] == 48 and len(expected) > 1
+
+    assert _run("parallel", synthetic_media, fake_ollama, frame_workers=3, checkpoint_interval=0, sampling_options=sampling) == (48, "Results_parallel.zip")
+    assert _results("parallel") == expected
+
+    for checks in (5, 20):
+        job_id = f"resumed-{checks}"
+        assert _interrupted_then_resumed(job_id, synthetic_media, fake_ollama, checks, sampling_options=sampling)[0] == 48
+        assert _results(job_id) == expected
+
+
+def test_sampling_analyzes_fewer_frames(synthetic_media, fake_ollama, in_tmp_dir):
+    requests_before = fake_ollama.stats()["requests"]
+    _run("all", synthetic_media, fake_ollama, checkpoint_interval=0)
+    all_frames = fake_ollama.stats()["requests"] - requests_before
+    _run("sampled", synthetic_media, fake_ollama, checkpoint_interval=0, sampling_options={"mode": "stride", "stride": 8})
+    sampled = fake_ollama.stats()["requests"] - requests_before - all_frames
+    assert 0 < sampled <= 6 < all_frames
+
+
+class _Pair:
+    def __init__(self, index):
+        self.index = index
+
+
+def test_stride_segments_are_anchored_to_frame_indices():
+    def representatives(start):
+        sampler = FrameSampler(mode="stride", stride=5)
+        return [index for index in range(start, 23) if sampler.starts_segment(_Pair(index))]
+
+    assert representatives(0) == [0, 5, 10, 15, 20]
+    # A range starting on a segment boundary agrees with the serial run from there on
+    assert representatives(10) == [10, 15, 20]
+
+
+def test_resumed_run_skips_checkpointed_frames(synthetic_media, fake_ollama, in_tmp_dir):
+    requests = fake_ollama.stats()["requests"]
+    _run("full", synthetic_media, fake_ollama, checkpoint_interval=0)
+    full_run = fake_ollama.stats()["requests"] - requests
+
+    with pytest.raises(PipelineCancelled):
+        _run("resumed", synthetic_media, fake_ollama, cancel_event=CancelAfter(24), checkpoint_interval=0.001)
+    requests = fake_ollama.stats()["requests"]
+    _run("resumed", synthetic_media, fake_ollama, checkpoint_interval=0.001)
+    assert 0 < fake_ollama.stats()["requests"] - requests < full_run
+
+
+def test_feature_store_rerun_with_new_thresholds(synthetic_media, fake_ollama, in_tmp_dir):
+    stricter = {**THRESHOLDS, "Solid Color Detection": 0.9, "Pattern Thresholding Value": 20}
+    _run("stored", synthetic_media, fake_ollama, checkpoint_interval=0, feature_store_dir="feature_store")
+    requests = fake_ollama.stats()["requests"]
+    detector = OllamaDetector(host=fake_ollama.url, max_in_flight=4, retry_backoff=0.01)
+    for job_id, feature_store_dir in [("rerun", "feature_store"), ("fresh", None)]:
+        process_video_frames(job_id, synthetic_media["raw"], synthetic_media["realsense"], synthetic_media["patterns"], stricter,
+                             PROCESSES, detector=detector, create_zip=False, checkpoint_interval=0, feature_store_dir=feature_store_dir)
+        if feature_store_dir:
+            assert fake_ollama.stats()["requests"] == requests # Every frame's verdict came from the store
+    assert _results("rerun") == _results("fresh") != _results("stored")
@@ -0,0 +1,69 @@
+import os
+import time
+
+from storage import StorageManager, parse_directory_limits
+
+HOUR = 3600
+
+
+def _file(path, size, age):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"x" * size)
+    used = time.time() - age
+    os.utime(path, (used, used))
+    return path
+
+
+def _folder(path, size, age):
+    """A job folder with one file, last changed `age` seconds ago."""
+    _file(path / "frame.png", size, age)
+    used = time.time() - age
+    os.utime(path, (used, used))
+    return path
+
+
+def _manager(in_use=(), referenced=(), orphan_grace=24 * HOUR):
+    return StorageManager(lambda: (set(in_use), set(referenced)), orphan_grace=orphan_grace)
+
+
+def test_orphans_are_deleted_after_the_grace_period(tmp_path):
+    uploads = tmp_path / "uploads"
+    old_orphan = _file(uploads / "abandoned.mp4", 10, 2 * HOUR)
+    recent_orphan = _file(uploads / "recent.mp4", 10, 0.5 * HOUR)
+    session_video = _file(uploads / "session.mp4", 10, 30 * HOUR)
+    session_progress = _file(uploads / "session.mp4.progress", 10, 30 * HOUR) # Sidecar of a file in use
+    manager = _manager(in_use=[session_video], orphan_grace=HOUR)
+    manager.add_directory("uploads", uploads)
+    report = manager.sweep()["uploads"]
+    assert not old_orphan.exists()
+    assert recent_orphan.exists() and session_video.exists() and session_progress.exists()
+    assert report["deleted"] == 1 and report["freed_bytes"] == 10 and report["items"] == 3
+
+
+def test_referenced_items_expire_after_the_ttl(tmp_path):
+    outputs = tmp_path / "pipeline_output"
+    expired_job, kept_job = _folder(outputs / "job-a", 5, 5 * HOUR), _folder(outputs / "job-b", 5, 1 * HOUR)
+    manager = _manager(referenced=[expired_job, kept_job])
+    manager.add_directory("pipeline_output", outputs, ttl=2 * HOUR, per_folder=True)
+    manager.sweep()
+    assert not expired_job.exists() and kept_job.exists()
+
+
+def test_quota_evicts_least_recently_used_items_not_in_use(tmp_path):
+    downloads = tmp_path / "downloads"
+    oldest = _file(downloads / "oldest.zip", 100, 10 * HOUR)
+    in_use = _file(downloads / "running.zip", 100, 9 * HOUR)
+    older = _file(downloads / "older.zip", 100, 8 * HOUR)
+    newest = _file(downloads / "newest.zip", 100, 2 * HOUR)
+    just_written = _file(downloads / "writing.zip", 100, 0)
+    manager = _manager(in_use=[in_use], referenced=[oldest, older, newest])
+    manager.add_directory("downloads", downloads, quota=300)
+    report = manager.sweep()["downloads"]
+    assert not oldest.exists() and not older.exists()
+    assert in_use.exists() and newest.exists() and just_written.exists()
+    assert report["bytes"] == 300 and report["deleted"] == 2 and report["quota"] == 300
+
+
+def test_directory_limits_are_scaled():
+    assert parse_directory_limits('{"uploads": 2, "downloads": 0.5}', 1024) == {"uploads": 2048.0, "downloads": 512.0}
+    assert parse_directory_limits("") == {}
@@ -0,0 +1,109 @@
+import sqlite3
+import time
+
+import pytest
+
+from store import MemoryStateStore, SqliteStateStore, StateStoreBusy
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    state_store = MemoryStateStore() if request.param == "memory" else SqliteStateStore(tmp_path / "state.sqlite")
+    yield state_store
+    state_store.close()
+
+
+def test_reads_are_copies_until_written_back(store):
+    store.put("sessions", "a", {"paths": []})
+    store.get("sessions", "a")["paths"].append("x")
+    assert store.get("sessions", "a") == {"paths": []}
+    with store.edit("sessions", "a") as session:
+        session["paths"].append("x")
+    assert store.get("sessions", "a") == {"paths": ["x"]}
+
+
+def test_failed_edit_keeps_the_document(store):
+    store.put("jobs", "j", {"status": "queued"})
+    with pytest.raises(ValueError):
+        with store.edit("jobs", "j") as job:
+            job["status"] = "running"
+            raise ValueError
+    assert store.get("jobs", "j") == {"status": "queued"}
+    with pytest.raises(KeyError):
+        with store.edit("jobs", "missing"):
+            pass
+
+
+def test_edits_cannot_be_nested(store):
+    store.put("jobs", "a", {"n": 0})
+    store.put("jobs", "b", {"n": 0})
+    with pytest.raises(RuntimeError, match="nested"):
+        with store.edit("jobs", "a"):
+            with store.edit("jobs", "b"):
+                pass
+    with store.edit("jobs", "b") as job: # The failed nesting left nothing held
+        job["n"] = 1
+    assert store.get("jobs", "b") == {"n": 1}
+
+
+def test_add_only_stores_new_or_expired_documents(store):
+    assert store.add("locks", "sweep", {"worker": 1}, ttl=0.05)
+    assert not store.add("locks", "sweep", {"worker": 2}, ttl=0.05)
+    time.sleep(0.1)
+    assert store.get("locks", "sweep") is None
+    assert store.add("locks", "sweep", {"worker": 2}, ttl=60)
+    assert store.get("locks", "sweep") == {"worker": 2}
+
+
+def test_expired_documents_are_purged(store):
+    store.put("sessions", "old", {}, ttl=0.05)
+    store.put("sessions", "kept", {})
+    store.put("sessions", "renewed", {}, ttl=0.05)
+    store.touch("sessions", "renewed", 60)
+    time.sleep(0.1)
+    assert store.purge_expired() == 1
+    assert sorted(key for key, _ in store.items("sessions")) == ["kept", "renewed"]
+
+
+def test_table_setdefault_and_edit(store):
+    sessions = store.table("sessions", ttl=60)
+    assert sessions.setdefault("s", {"n": 0}) == {"n": 0}
+    assert sessions.setdefault("s", {"n": 5}) == {"n": 0}
+    with sessions.edit("s") as session:
+        session["n"] += 1
+    assert sessions["s"] == {"n": 1} and "s" in sessions and len(sessions) == 1
+    del sessions["s"]
+    assert "s" not in sessions
+    with pytest.raises(KeyError):
+        del sessions["s"]
+
+
+def test_sqlite_store_is_shared_between_workers(tmp_path):
+    first, second = SqliteStateStore(tmp_path / "state.sqlite"), SqliteStateStore(tmp_path / "state.sqlite")
+    first.put("jobs", "j", {"status": "running"})
+    with second.edit("jobs", "j") as job:
+        job["cancel_requested"] = True
+    assert first.get("jobs", "j") == {"status": "running", "cancel_requested": True}
+
+
+def test_sqlite_store_gives_up_on_a_long_held_write_lock(tmp_path):
+    path = tmp_path / "state.sqlite"
+    store = SqliteStateStore(path, busy_timeout=0.05)
+    store.put("jobs", "j", {"status": "queued"})
+    other_worker = sqlite3.connect(path, isolation_level=None)
+    other_worker.execute("BEGIN IMMEDIATE")
+    try:
+        assert store.get("jobs", "j") == {"status": "queued"} # Readers don't wait in WAL mode
+        started = time.monotonic()
+        with pytest.raises(StateStoreBusy):
+            store.put("jobs", "j", {"status": "running"})
+        with pytest.raises(StateStoreBusy):
+            with store.edit("jobs", "j"):
+                pass
+        assert time.monotonic() - started < 1
+    finally:
+        other_worker.execute("ROLLBACK")
+        other_worker.close()
+    with store.edit("jobs", "j") as job:
+        job["status"] = "running"
+    assert store.get("jobs", "j") == {"status": "running"}
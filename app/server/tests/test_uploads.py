@@ -0,0 +1,103 @@
+import hashlib
+import io
+import os
+
+import pytest
+
+from store import SqliteStateStore
+from uploads import ChunkedUploadStore, content_hash_of_file, content_upload_id
+
+CHUNK_SIZE = 1000
+
+
+@pytest.fixture
+def data():
+    return os.urandom(10 * CHUNK_SIZE + 123)
+
+
+def _chunk(data, index):
+    return data[index * CHUNK_SIZE:(index + 1) * CHUNK_SIZE]
+
+
+def _total_chunks(data):
+    return -(-len(data) // CHUNK_SIZE)
+
+
+def _send(store, upload_id, data, indices, total_size=None):
+    """Writes the given chunks as the upload endpoints do. Returns: the chunk indices whose mark_received completed the upload."""
+    completed = []
+    for index in indices:
+        upload = store.get_or_create(upload_id, "video.mp4", _total_chunks(data), CHUNK_SIZE, total_size)
+        written = upload.write_from_file(index, io.BytesIO(_chunk(data, index)))
+        if upload.mark_received(index, written):
+            completed.append(index)
+    return completed
+
+
+def test_chunks_in_any_order_assemble_the_file(tmp_path, data):
+    store = ChunkedUploadStore(tmp_path / "uploads")
+    order = [3, 0, 10, 1, 7, 2, 9, 4, 8, 5, 6]
+    upload = store.get_or_create("job", "video.mp4", _total_chunks(data), CHUNK_SIZE)
+    assert _send(store, "job", data, order[:4]) == []
+    assert upload.available_bytes == 2 * CHUNK_SIZE # Chunks 0 and 1 are the complete prefix
+    assert _send(store, "job", data, order[4:] + [6]) == [6] # A retried chunk doesn't complete the upload twice
+    assert upload.available_bytes == len(data)
+    assert store.pop("job") is upload
+    assert upload.finalize().read_bytes() == data
+
+
+def test_late_retry_of_a_finished_upload_is_refused(tmp_path, data):
+    store = ChunkedUploadStore(tmp_path / "uploads")
+    _send(store, "job", data, range(_total_chunks(data)))
+    store.pop("job").finalize()
+    with pytest.raises(ValueError, match="already complete"):
+        store.get_or_create("job", "video.mp4", _total_chunks(data), CHUNK_SIZE)
+
+
+def test_content_hash_does_not_depend_on_chunking(tmp_path):
+    data = os.urandom(3 * 1024 * 1024 + 17)
+    path = tmp_path / "file"
+    path.write_bytes(data)
+    blocks = [data[i:i + 1024 * 1024] for i in range(0, len(data), 1024 * 1024)]
+    assert content_hash_of_file(path) == hashlib.sha256(b"".join(hashlib.sha256(block).digest() for block in blocks)).hexdigest()
+
+
+def test_content_addressed_upload_resumes_after_restart(tmp_path, data):
+    source = tmp_path / "source"
+    source.write_bytes(data)
+    upload_id = content_upload_id(content_hash_of_file(source))
+    total_chunks = _total_chunks(data)
+
+    before_restart = ChunkedUploadStore(tmp_path / "uploads")
+    _send(before_restart, upload_id, data, [0, 1, 5])
+    assert before_restart.find_content(upload_id[len("sha256-"):], "video.mp4") is None
+
+    after_restart = ChunkedUploadStore(tmp_path / "uploads")
+    assert after_restart.received_chunks(upload_id, "video.mp4", total_chunks, CHUNK_SIZE) == [0, 1, 5]
+    remaining = [index for index in range(total_chunks) if index not in (0, 1, 5)]
+    assert _send(after_restart, upload_id, data, remaining) == [remaining[-1]]
+    stored_path = after_restart.pop(upload_id).finalize()
+    assert stored_path.read_bytes() == data
+    assert after_restart.find_content(upload_id[len("sha256-"):], "VIDEO.MP4") == stored_path
+    assert after_restart.is_shared(stored_path)
+    assert sorted(path.name for path in stored_path.parent.iterdir()) == [stored_path.name] # No .part or journal left
+
+
+def test_content_hash_mismatch_discards_the_upload(tmp_path, data):
+    store = ChunkedUploadStore(tmp_path / "uploads")
+    upload_id = content_upload_id("0" * 64)
+    _send(store, upload_id, data, range(_total_chunks(data)))
+    upload = store.pop(upload_id)
+    with pytest.raises(ValueError, match="doesn't match"):
+        upload.finalize()
+    assert not upload.path.exists() and not upload.final_path.exists()
+
+
+def test_workers_sharing_a_state_store_complete_an_upload_once(tmp_path, data):
+    state = SqliteStateStore(tmp_path / "state.sqlite")
+    workers = [ChunkedUploadStore(tmp_path / "uploads", state=state.table("uploads")) for _ in range(2)]
+    total_chunks = _total_chunks(data)
+    completed = [_send(workers[index % 2], "job", data, [index], total_size=len(data)) for index in range(total_chunks)]
+    assert sum(completed, []) == [total_chunks - 1]
+    assert workers[0].received_chunks("job", "video.mp4", total_chunks, CHUNK_SIZE) == list(range(total_chunks))
+    assert workers[1].pop("job").finalize().read_bytes() == data
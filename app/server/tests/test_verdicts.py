@@ -0,0 +1,76 @@
+import sqlite3
+import time
+
+import numpy as np
+
+from pipeline.verdicts import VerdictCache, frame_phash, prompt_key
+
+KEY = prompt_key("llava", "Are there man-made objects?")
+
+
+def test_near_identical_frames_share_a_verdict(tmp_path):
+    cache = VerdictCache(tmp_path / "verdicts.sqlite", max_distance=4)
+    frame = np.random.default_rng(0).integers(0, 255, (120, 160, 3), dtype=np.uint8)
+    cache.put(KEY, frame_phash(frame), True, "Yes")
+    assert cache.get(KEY, frame_phash(np.clip(frame.astype(int) + 2, 0, 255).astype(np.uint8))) == (True, "Yes")
+    assert cache.get(KEY, frame_phash(255 - frame)) is None
+    assert cache.get(prompt_key("llava", "Another prompt"), frame_phash(frame)) is None
+
+
+def test_hashes_round_trip_through_signed_storage(tmp_path):
+    path = tmp_path / "verdicts.sqlite"
+    VerdictCache(path, max_distance=0).put(KEY, 2 ** 64 - 1, False, "No")
+    assert VerdictCache(path, max_distance=0).get(KEY, 2 ** 64 - 1) == (False, "No")
+
+
+def test_put_replaces_the_verdict_for_the_same_hash(tmp_path):
+    path = tmp_path / "verdicts.sqlite"
+    cache = VerdictCache(path, max_distance=0)
+    assert cache.get(KEY, 42) is None
+    cache.put(KEY, 42, False, "No")
+    cache.put(KEY, 42, True, "Yes")
+    assert cache.get(KEY, 42) == (True, "Yes")
+    assert VerdictCache(path, max_distance=0).get(KEY, 42) == (True, "Yes")
+
+
+def test_a_miss_sees_verdicts_stored_by_another_process(tmp_path):
+    path = tmp_path / "verdicts.sqlite"
+    reader, writer = VerdictCache(path, max_distance=0), VerdictCache(path, max_distance=0)
+    writer.put(KEY, 1, False, "No")
+    assert reader.get(KEY, 1) == (False, "No") # Loads the prompt key
+    writer.put(KEY, 2, True, "Yes")
+    assert reader.get(KEY, 2) == (True, "Yes")
+    writer.put(KEY, 1, True, "Yes, on a second look")
+    reader.get(KEY, 3) # Any miss merges newer rows, including replaced ones
+    assert reader.get(KEY, 1) == (True, "Yes, on a second look")
+
+
+def test_replacing_the_newest_row_is_seen_by_other_processes(tmp_path):
+    path = tmp_path / "verdicts.sqlite"
+    reader, writer = VerdictCache(path, max_distance=0), VerdictCache(path, max_distance=0)
+    writer.put(KEY, 1, False, "No")
+    assert reader.get(KEY, 1) == (False, "No")
+    writer.put(KEY, 1, True, "Yes") # Replaces the row with the highest rowid
+    reader.get(KEY, 3)
+    assert reader.get(KEY, 1) == (True, "Yes")
+
+
+def test_put_continues_reading_after_its_own_row(tmp_path):
+    path = tmp_path / "verdicts.sqlite"
+    cache, other = VerdictCache(path, max_distance=0), VerdictCache(path, max_distance=0)
+    other.put(KEY, 1, False, "No")
+    cache.put(KEY, 2, True, "Yes")
+    entries = cache._loaded[KEY]
+    assert entries.last_rowid == 2 and len(entries.hashes) == 2 # Merged the other process's row, not its own twice
+    assert cache.get(KEY, 1) == (False, "No")
+
+
+def test_large_cache_loads_quickly(tmp_path):
+    path = tmp_path / "verdicts.sqlite"
+    VerdictCache(path).put(KEY, 0, False, "No") # Creates the table
+    hashes = np.random.default_rng(0).integers(0, 2 ** 63, 200_000, dtype=np.int64)
+    with sqlite3.connect(path) as conn:
+        conn.executemany("INSERT OR IGNORE INTO verdicts VALUES (?, ?, 1, 'Yes')", ((KEY, int(h)) for h in hashes))
+    started = time.perf_counter()
+    assert VerdictCache(path, max_distance=0).get(KEY, int(hashes[-1])) == (True, "Yes")
+    assert time.perf_counter() - started < 3
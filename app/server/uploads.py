@@ -0,0 +1,339 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from pathlib import Path
+from typing import AsyncIterator, Dict, Optional
+
+from pipeline.ingest import clear_ingest_progress, write_ingest_progress
+from store import MemoryStateStore
+
+logger = logging.getLogger(__name__)
+
+# The web client slices files into 1MB chunks; clients can send their own chunk_size
+DEFAULT_UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Bytes of a streamed chunk gathered before each positional write
+STREAM_WRITE_SIZE = 1024 * 1024
+# Block size of the content hash; fixed so the hash doesn't depend on how a file was chunked for upload
+CONTENT_HASH_BLOCK_SIZE = 1024 * 1024
+CONTENT_UPLOAD_PREFIX = "sha256-"
+_CONTENT_HASH_RE = re.compile(r"^[0-9a-f]{64}$")
+
+
+def is_content_hash(value: str) -> bool:
+    return bool(value) and bool(_CONTENT_HASH_RE.match(value))
+
+
+def content_hash_of_file(path) -> str:
+    """
+    Content hash used to deduplicate uploads: SHA-256 over the SHA-256 digests of each
+    1MB block of the file. Block-wise hashing lets browsers compute it with WebCrypto
+    one slice at a time instead of loading multi-GB videos into memory.
+    Returns: lowercase hex digest
+    """
+    outer = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(CONTENT_HASH_BLOCK_SIZE), b""):
+            outer.update(hashlib.sha256(block).digest())
+    return outer.hexdigest()
+
+
+def content_upload_id(content_hash: str) -> str:
+    """Upload id for a file identified by its content hash; re-uploads of the same file resume into it."""
+    return f"{CONTENT_UPLOAD_PREFIX}{content_hash}"
+
+
+class ChunkedUpload:
+    """
+    One file being uploaded in chunks. Each chunk is written straight to its offset
+    (chunk_index * chunk_size) in a file preallocated at the final path, so chunks may
+    arrive in any order or in parallel and no assembly pass is needed afterwards.
+
+    Uploads identified by a content hash are written to `<final_path>.part` with a journal
+    of received chunks next to it, so an interrupted upload (even across server restarts)
+    resumes where it stopped. The hash is verified before the file is moved into place.
+
+    Until it is finalized, a progress sidecar next to the final path (see pipeline.ingest)
+    records how much of the file is final, i.e. the run of chunks received from the start,
+    so the pipeline can begin decoding a video while the rest is still arriving.
+
+    With `state` (a StoreTable and key), the set of received chunks is kept in that record
+    instead, so chunks of one upload can be received by different server workers.
+
+    File I/O methods are blocking; the async helpers run them in a worker thread.
+    """
+
+    def __init__(self, path: Path, total_chunks: int, chunk_size: int = DEFAULT_UPLOAD_CHUNK_SIZE, total_size: Optional[int] = None,
+                 content_hash: Optional[str] = None, state: Optional[tuple] = None):
+        self.final_path = Path(path)
+        self.content_hash = content_hash
+        self.path = self.final_path.with_name(self.final_path.name + ".part") if content_hash else self.final_path
+        self.total_chunks = total_chunks
+        self.chunk_size = chunk_size
+        self.total_size = total_size
+        self.received = set()
+        self.end_offset = 0 # Furthest byte written, i.e. the file size once all chunks are in
+        self.contiguous_chunks = 0 # Chunks 0..contiguous_chunks-1 have all been received
+        self._lock = threading.Lock()
+        self._journal_path = self.path.with_name(self.path.name + ".chunks") if content_hash else None
+        self._state = state
+        if not self._load_journal():
+            self._allocate()
+            self._start_journal()
+        if state is not None:
+            table, key = state
+            record = table.setdefault(key, {"received": sorted(self.received), "end_offset": self.end_offset, "completed": False})
+            self._apply_record(record)
+        self._advance_prefix()
+        self._write_progress()
+
+    def _load_journal(self):
+        """Picks up chunks received before an interruption. Returns: True if an earlier upload was resumed."""
+        if self._journal_path is None or not self._journal_path.exists() or not self.path.exists():
+            return False
+        with open(self._journal_path) as f:
+            lines = f.read().splitlines()
+        try:
+            layout = json.loads(lines[0])
+        except (IndexError, ValueError):
+            return False
+        if layout != {"total_chunks": self.total_chunks, "chunk_size": self.chunk_size}:
+            logger.info(f"Chunk layout of {self.path} changed; restarting its upload.")
+            return False
+        for line in lines[1:]:
+            try:
+                chunk_index, written = (int(value) for value in line.split())
+            except ValueError:
+                continue # Torn final line
+            self.received.add(chunk_index)
+            self.end_offset = max(self.end_offset, chunk_index * self.chunk_size + written)
+        logger.info(f"Resuming upload {self.path}: {len(self.received)}/{self.total_chunks} chunks already received.")
+        return True
+
+    def _start_journal(self):
+        if self._journal_path is not None:
+            with open(self._journal_path, "w") as f:
+                f.write(json.dumps({"total_chunks": self.total_chunks, "chunk_size": self.chunk_size}) + "\n")
+
+    def _apply_record(self, record):
+        self.received.update(record["received"])
+        self.end_offset = max(self.end_offset, record["end_offset"])
+
+    def refresh(self):
+        """Picks up chunks other workers have received since."""
+        if self._state is not None:
+            table, key = self._state
+            record = table.get(key)
+            with self._lock:
+                if record is not None:
+                    self._apply_record(record)
+                if self._advance_prefix():
+                    self._write_progress()
+
+    def _advance_prefix(self) -> bool:
+        """Returns: True if more of the start of the file is now complete."""
+        start = self.contiguous_chunks
+        while self.contiguous_chunks in self.received:
+            self.contiguous_chunks += 1
+        return self.contiguous_chunks != start
+
+    @property
+    def available_bytes(self) -> int:
+        """Length of the prefix of the file that has been received in full."""
+        if self.contiguous_chunks == self.total_chunks:
+            return self.end_offset
+        return self.contiguous_chunks * self.chunk_size
+
+    def _write_progress(self):
+        write_ingest_progress(self.final_path, self.path, self.available_bytes)
+
+    def _allocate(self):
+        fd = os.open(self.path, os.O_WRONLY | os.O_CREAT, 0o644)
+        try:
+            if self.total_size is not None:
+                try:
+                    os.posix_fallocate(fd, 0, self.total_size)
+                except (AttributeError, OSError):
+                    os.ftruncate(fd, self.total_size) # Sparse file where fallocate isn't supported
+            else:
+                os.ftruncate(fd, self.total_chunks * self.chunk_size) # Upper bound; trimmed when complete
+        finally:
+            os.close(fd)
+
+    def chunk_offset(self, chunk_index: int) -> int:
+        if not 0 <= chunk_index < self.total_chunks:
+            raise ValueError(f"Chunk index {chunk_index} out of range for {self.total_chunks} chunks.")
+        return chunk_index * self.chunk_size
+
+    def _check_length(self, chunk_index: int, written: int):
+        if written > self.chunk_size:
+            raise ValueError(f"Chunk {chunk_index} is {written} bytes, larger than the chunk size {self.chunk_size}.")
+
+    def write_from_file(self, chunk_index: int, fileobj) -> int:
+        """Copies a chunk from a file object to its offset, piece by piece. Returns: bytes written."""
+        offset = start = self.chunk_offset(chunk_index)
+        fd = os.open(self.path, os.O_WRONLY)
+        try:
+            for piece in iter(lambda: fileobj.read(STREAM_WRITE_SIZE), b""):
+                offset += os.pwrite(fd, piece, offset)
+                self._check_length(chunk_index, offset - start)
+        finally:
+            os.close(fd)
+        return offset - start
+
+    async def write_stream(self, chunk_index: int, stream: AsyncIterator[bytes]) -> int:
+        """Writes a chunk from an async byte stream (e.g. a request body) to its offset. Returns: bytes written."""
+        offset = start = self.chunk_offset(chunk_index)
+        fd = await asyncio.to_thread(os.open, self.path, os.O_WRONLY)
+        try:
+            buffer = bytearray()
+            async for piece in stream:
+                buffer += piece
+                self._check_length(chunk_index, offset - start + len(buffer))
+                if len(buffer) >= STREAM_WRITE_SIZE:
+                    offset += await asyncio.to_thread(os.pwrite, fd, bytes(buffer), offset)
+                    buffer.clear()
+            if buffer:
+                offset += await asyncio.to_thread(os.pwrite, fd, bytes(buffer), offset)
+        finally:
+            os.close(fd)
+        return offset - start
+
+    def mark_received(self, chunk_index: int, written: int) -> bool:
+        """Records a fully written chunk. Returns: True for the call that completes the upload."""
+        with self._lock:
+            if self._state is not None:
+                table, key = self._state
+                with table.edit(key) as record:
+                    already_complete = len(record["received"]) == self.total_chunks
+                    if chunk_index not in record["received"]:
+                        record["received"].append(chunk_index)
+                    record["end_offset"] = max(record["end_offset"], self.chunk_offset(chunk_index) + written)
+                self._apply_record(record)
+            else:
+                already_complete = len(self.received) == self.total_chunks
+                self.received.add(chunk_index)
+                self.end_offset = max(self.end_offset, self.chunk_offset(chunk_index) + written)
+            if self._journal_path is not None:
+                with open(self._journal_path, "a") as f:
+                    f.write(f"{chunk_index} {written}\n")
+            if self._advance_prefix():
+                self._write_progress()
+            return not already_complete and len(self.received) == self.total_chunks
+
+    def finalize(self) -> Path:
+        """
+        Trims preallocated space past the last byte written and, for content-addressed
+        uploads, verifies the hash and moves the file into place.
+        Returns: path of the uploaded file. Raises ValueError if the content hash doesn't match.
+        """
+        size = self.total_size if self.total_size is not None else self.end_offset
+        os.truncate(self.path, size)
+        if self.content_hash:
+            actual_hash = content_hash_of_file(self.path)
+            if actual_hash != self.content_hash:
+                self.discard()
+                raise ValueError(f"Uploaded file hash {actual_hash} doesn't match the declared {self.content_hash}.")
+            os.replace(self.path, self.final_path)
+            self._journal_path.unlink(missing_ok=True)
+        clear_ingest_progress(self.final_path) # Streaming readers now read to the end of the file
+        return self.final_path
+
+    def discard(self):
+        for path in (self.path, self._journal_path):
+            if path is not None:
+                path.unlink(missing_ok=True)
+        clear_ingest_progress(self.final_path)
+
+
+class ChunkedUploadStore:
+    """
+    Tracks in-progress chunked uploads by upload job id. Uploads whose id is
+    content_upload_id(hash) are stored once in content_dir and shared by every session
+    that uploads the same file.
+
+    Which chunks each upload has received is kept in `state` (a StoreTable, see store.py), so
+    server workers sharing a state store can each receive chunks of the same upload. Without
+    one it is kept in memory.
+    """
+
+    def __init__(self, upload_dir: Path, content_dir: Optional[Path] = None, state=None):
+        self.upload_dir = Path(upload_dir)
+        self.content_dir = Path(content_dir) if content_dir is not None else self.upload_dir / "by_hash"
+        self.content_dir.mkdir(parents=True, exist_ok=True)
+        self.state = state if state is not None else MemoryStateStore().table("uploads")
+        self._uploads: Dict[str, ChunkedUpload] = {} # This worker's handles on uploads in progress
+        self._lock = threading.Lock() # Called from worker threads, since preallocation can take a while
+
+    def get_or_create(self, upload_job_id: str, original_filename: str, total_chunks: int,
+                      chunk_size: int = DEFAULT_UPLOAD_CHUNK_SIZE, total_size: Optional[int] = None) -> ChunkedUpload:
+        with self._lock:
+            upload = self._uploads.get(upload_job_id)
+            record = self.state.get(upload_job_id)
+            if upload is not None and (record is None or record["completed"]):
+                del self._uploads[upload_job_id] # Finished by another worker
+                upload = None
+            if upload is None:
+                if record is not None and record["completed"]: # Late retries of a finished upload must not reopen its file
+                    raise ValueError(f"Upload {upload_job_id} is already complete.")
+                if total_chunks <= 0 or chunk_size <= 0:
+                    raise ValueError("total_chunks and chunk_size must be positive.")
+                content_hash = self._content_hash_for(upload_job_id)
+                if content_hash:
+                    path = self.content_path(content_hash, original_filename)
+                else:
+                    # Name is unique per upload job, so uploads of the same file name never collide
+                    path = self.upload_dir / f"{upload_job_id}_{Path(original_filename).name}"
+                upload = ChunkedUpload(path, total_chunks, chunk_size, total_size, content_hash, state=(self.state, upload_job_id))
+                self._uploads[upload_job_id] = upload
+            elif upload.total_chunks != total_chunks or upload.chunk_size != chunk_size:
+                raise ValueError("Chunk layout changed mid-upload.")
+            return upload
+
+    @staticmethod
+    def _content_hash_for(upload_job_id: str) -> Optional[str]:
+        if upload_job_id.startswith(CONTENT_UPLOAD_PREFIX):
+            content_hash = upload_job_id[len(CONTENT_UPLOAD_PREFIX):]
+            if not is_content_hash(content_hash):
+                raise ValueError(f"Invalid content hash in upload id {upload_job_id}.")
+            return content_hash
+        return None
+
+    def content_path(self, content_hash: str, original_filename: str) -> Path:
+        """Where a file with this content is stored; keeps the original extension for decoders that look at it."""
+        return self.content_dir / f"{content_hash}{Path(original_filename).suffix.lower()}"
+
+    def find_content(self, content_hash: str, original_filename: str) -> Optional[Path]:
+        """Returns the stored copy of a file with this content, or None if it hasn't been uploaded."""
+        path = self.content_path(content_hash, original_filename)
+        return path if path.exists() else None
+
+    def is_shared(self, path) -> bool:
+        """Whether a path is a content-addressed copy that other sessions may also use."""
+        return Path(path).parent.resolve() == self.content_dir.resolve()
+
+    def received_chunks(self, upload_job_id: str, original_filename: str, total_chunks: int,
+                        chunk_size: int = DEFAULT_UPLOAD_CHUNK_SIZE, total_size: Optional[int] = None) -> list:
+        """Chunk indices already stored for an upload, resuming an interrupted content-addressed upload from disk."""
+        if self._content_hash_for(upload_job_id) is None and upload_job_id not in self.state:
+            return []
+        upload = self.get_or_create(upload_job_id, original_filename, total_chunks, chunk_size, total_size)
+        upload.refresh()
+        with upload._lock:
+            return sorted(upload.received)
+
+    def pop(self, upload_job_id: str) -> Optional[ChunkedUpload]:
+        """Removes a finished upload from the in-progress set."""
+        with self._lock:
+            if upload_job_id.startswith(CONTENT_UPLOAD_PREFIX): # The same content may be uploaded again after eviction
+                self.state.pop(upload_job_id, None)
+            else:
+                try:
+                    with self.state.edit(upload_job_id) as record:
+                        record["completed"] = True
+                except KeyError:
+                    pass
+            return self._uploads.pop(upload_job_id, None)